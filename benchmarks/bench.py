@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+    Benchmarks for the client's hot paths.
+
+    Each benchmark drives one command shape against a local redis-server or
+    the in-process fake server (redis.fakeserver) and reports ops/sec and latency percentiles.
+    Results are written as JSON, and --compare prints the change against an
+    earlier result file, so runs from different versions can be compared:
+
+        PYTHONPATH=. python3 benchmarks/bench.py --server standin --output before.json
+        ...
+        PYTHONPATH=. python3 benchmarks/bench.py --server standin --compare before.json
+
+    Commands on one connection are answered in order, so a sequential
+    benchmark measures the latency of one command at a time, while a burst
+    queues all of its commands at once and measures how fast the client
+    works through its queue.
+"""
+
+import sys
+import json
+import time
+import socket
+import logging
+import argparse
+import platform
+
+import tornado
+from tornado import ioloop
+from tornado.concurrent import Future
+
+from redis.redis import Redis
+from redis.metrics import Histogram
+from redis.transport import AsyncioTransport
+from redis.fakeserver import FakeRedisServer
+from redis.capture import Capture
+
+logger = logging.getLogger('bench')
+
+#Keys are namespaced and deleted afterwards, nothing else in the database is touched
+KEY_PREFIX = 'bench:'
+
+
+class _Run(object):
+    """
+        Time commands from the moment they are issued to their callback.
+    """
+
+    def __init__(self, name, ops):
+        self.name = name
+        self.ops = ops
+        self.done = 0
+        self.errors = 0
+        self.latency = Histogram()
+        self.future = Future()
+        self.started = None
+        self.finished = None
+
+    def start(self):
+        self.started = time.perf_counter()
+
+    def callback(self):
+        issued = time.perf_counter()
+
+        def _done(error, value):
+            now = time.perf_counter()
+            self.latency.record(now - issued)
+            self.done += 1
+            if error is not None:
+                self.errors += 1
+                if self.errors == 1:
+                    logger.error('%s failed: %s' % (self.name, error))
+
+            if self.done == self.ops:
+                self.finished = now
+                self.future.set_result(None)
+
+        return _done
+
+    def result(self, **extra):
+        seconds = self.finished - self.started
+        result = {
+            'ops': self.ops,
+            'errors': self.errors,
+            'seconds': seconds,
+            'ops_per_sec': self.ops / seconds if seconds > 0 else 0.0,
+            'latency': self.latency.snapshot(),
+        }
+        result.update(extra)
+        return result
+
+
+def sequential(name, ops, issue):
+    '''
+        Issue ops commands one after the other, each from the previous one's callback.
+    '''
+    run = _Run(name, ops)
+
+    def _next():
+        done = run.callback()
+
+        def _callback(error, value):
+            done(error, value)
+            if run.done < ops:
+                _next()
+
+        issue(run.done, _callback)
+
+    run.start()
+    _next()
+    return run
+
+
+def burst(name, ops, issue):
+    '''
+        Queue ops commands at once and time until the last reply.
+    '''
+    run = _Run(name, ops)
+    run.start()
+    for i in range(ops):
+        issue(i, run.callback())
+    return run
+
+
+def _call(method, *args):
+    future = Future()
+
+    def _done(error, value):
+        if error is not None:
+            future.set_exception(RuntimeError(error))
+        else:
+            future.set_result(value)
+
+    method(*(args + (_done,)))
+    return future
+
+
+async def bench_strings(db, results, options):
+    small = b'x' * options.small_size
+    large = b'x' * options.large_size
+
+    for label, value in (('small', small), ('large', large)):
+        key = KEY_PREFIX + label
+        run = sequential('set_' + label, options.requests, lambda i, callback: db.set(key, value, callback))
+        await run.future
+        results['set_' + label] = run.result(value_size=len(value))
+
+        run = sequential('get_' + label, options.requests, lambda i, callback: db.get(key, callback))
+        await run.future
+        results['get_' + label] = run.result(value_size=len(value))
+
+
+async def bench_many_fields(db, results, options):
+    keys = [KEY_PREFIX + 'mget:%d' % i for i in range(options.fields)]
+    await _call(db.mset, *[item for key in keys for item in (key, b'v' * options.small_size)])
+    await _call(db.hset, KEY_PREFIX + 'hash', *[item for i in range(options.fields)
+                                                for item in ('field:%d' % i, b'v' * options.small_size)])
+
+    requests = max(1, options.requests // 10)
+
+    run = sequential('mget', requests, lambda i, callback: db.mget(*(keys + [callback])))
+    await run.future
+    results['mget'] = run.result(fields=options.fields)
+
+    run = sequential('hgetall', requests, lambda i, callback: db.hgetall(KEY_PREFIX + 'hash', callback))
+    await run.future
+    results['hgetall'] = run.result(fields=options.fields)
+
+    await _call(db.delete, *keys)
+
+
+async def bench_bursts(db, results, options):
+    value = b'x' * options.small_size
+
+    run = burst('burst_set', options.burst, lambda i, callback: db.set(KEY_PREFIX + 'burst:%d' % (i % 100), value, callback))
+    await run.future
+    results['burst_set'] = run.result(burst=options.burst)
+
+    run = burst('burst_get', options.burst, lambda i, callback: db.get(KEY_PREFIX + 'burst:%d' % (i % 100), callback))
+    await run.future
+    results['burst_get'] = run.result(burst=options.burst)
+
+    await _call(db.delete, *[KEY_PREFIX + 'burst:%d' % i for i in range(100)])
+
+
+async def bench_pubsub(db, subscriber, results, options):
+    channel = KEY_PREFIX + 'channel'
+    payload = b'x' * options.small_size
+    messages = options.burst
+
+    run = _Run('pubsub', messages)
+    subscribed = Future()
+    published = []
+
+    def onmessage(msg):
+        if msg[0] in (b'subscribe', 'subscribe'):
+            subscribed.set_result(None)
+        elif msg[0] in (b'message', 'message'):
+            now = time.perf_counter()
+            run.latency.record(now - published[run.done])
+            run.done += 1
+            if run.done == messages:
+                run.finished = now
+                run.future.set_result(None)
+
+    subscriber.subscribe(channel, onmessage)
+    await subscribed
+
+    #Publishes are queued as a burst, latency runs from queueing one to its delivery
+    run.start()
+    for i in range(messages):
+        published.append(time.perf_counter())
+        db.publish(channel, payload, lambda error, value: None)
+    await run.future
+    results['pubsub'] = run.result(payload_size=len(payload))
+
+    subscriber.unsubscribe(channel)
+
+
+def make_client(options, port, capture=None):
+    transport = None
+    if options.transport == 'asyncio':
+        transport = AsyncioTransport(loop=ioloop.IOLoop.current().asyncio_loop)
+    return Redis(options.host, port, options.db, transport=transport, capture=capture)
+
+
+BENCHMARKS = ('strings', 'fields', 'bursts', 'pubsub')
+
+
+async def run_benchmarks(options):
+    port = options.port
+    if options.server == 'standin':
+        port = FakeRedisServer().listen_tcp()
+
+    capture = Capture(options.capture) if options.capture else None
+    db = make_client(options, port, capture)
+    db.connect()
+    await _call(db.select, options.db)
+
+    results = {}
+    if 'strings' in options.only:
+        await bench_strings(db, results, options)
+    if 'fields' in options.only:
+        await bench_many_fields(db, results, options)
+    if 'bursts' in options.only:
+        await bench_bursts(db, results, options)
+    if 'pubsub' in options.only:
+        subscriber = make_client(options, port)
+        subscriber.connect()
+        await bench_pubsub(db, subscriber, results, options)
+        subscriber.disconnect()
+
+    await _call(db.delete, *[KEY_PREFIX + name for name in ('small', 'large', 'hash')])
+    db.disconnect()
+    if capture is not None:
+        capture.close()
+
+    return results
+
+
+def compare(results, baseline):
+    '''
+        Return lines describing the change of every result against baseline.
+    '''
+    lines = []
+    for name, result in sorted(results.items()):
+        before = baseline.get(name)
+        if before is None or not before['ops_per_sec']:
+            continue
+        change = (result['ops_per_sec'] / before['ops_per_sec'] - 1) * 100
+        lines.append('%-12s %12.0f ops/s %+7.1f%%   p99 %8.3fms -> %8.3fms' % (
+            name, result['ops_per_sec'], change, before['latency']['p99'] * 1000, result['latency']['p99'] * 1000))
+    return lines
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--server', choices=('redis', 'standin'), default='standin',
+                        help='run against a redis-server or the in-process fake server')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=6379)
+    parser.add_argument('--db', type=int, default=9)
+    parser.add_argument('--transport', choices=('iostream', 'asyncio'), default='iostream')
+    parser.add_argument('--requests', type=int, default=10000, help='commands per sequential benchmark')
+    parser.add_argument('--burst', type=int, default=10000, help='commands per burst, and pub/sub messages')
+    parser.add_argument('--fields', type=int, default=100, help='keys per MGET and fields per HGETALL')
+    parser.add_argument('--small-size', type=int, default=16)
+    parser.add_argument('--large-size', type=int, default=100 * 1024)
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, default=BENCHMARKS)
+    parser.add_argument('--label', default=None, help='recorded with the results, e.g. a git revision')
+    parser.add_argument('--output', default=None, help='write the JSON results here instead of stdout')
+    parser.add_argument('--compare', default=None, help='print the change against an earlier JSON result file')
+    parser.add_argument('--capture', default=None, help='record the traffic for replay.py to this file')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+
+    #The client logs every call at DEBUG, which would be all the benchmarks measured
+    logging.getLogger('redis').setLevel(logging.WARNING)
+
+    results = ioloop.IOLoop.current().run_sync(lambda: run_benchmarks(options))
+
+    report = {
+        'label': options.label,
+        'time': time.time(),
+        'host': socket.gethostname(),
+        'python': platform.python_version(),
+        'tornado': tornado.version,
+        'server': options.server,
+        'transport': options.transport,
+        'results': results,
+    }
+
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)
+        for line in compare(results, baseline['results']):
+            print(line, file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
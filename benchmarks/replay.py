@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+    Replay captured traffic through the client's encoder and reply parser.
+
+    Record real traffic with Redis(capture=Capture(path)), or with
+    bench.py --capture, then replay it without a socket:
+
+        PYTHONPATH=. python3 benchmarks/replay.py traffic.capture --repeat 10 --output parser.json
+
+    Commands are paired with their replies in order and the replies are fed
+    to a client whose transport is an in-memory buffer, so only the client's
+    own work is timed.  Encoding is reported per command name and parsing
+    per reply type, as ns/op and, with --allocations, as the peak bytes
+    allocated per op as seen by tracemalloc.  Replies after a (P)SUBSCRIBE
+    are pub/sub messages without a command of their own and are not replayed.
+"""
+
+import sys
+import json
+import time
+import logging
+import argparse
+import tracemalloc
+
+from redis.redis import Redis, _command_size
+from redis.metrics import Histogram
+from redis.capture import OUTBOUND, INBOUND, read_capture
+
+REPLY_TYPES = {b'+': 'status', b'-': 'error', b':': 'integer', b'$': 'bulk', b'*': 'multi_bulk'}
+
+
+def _value_end(data, pos):
+    '''
+        Return the offset just past the RESP value starting at pos.
+    '''
+    end = data.index(b'\r\n', pos) + 2
+    prefix = data[pos:pos + 1]
+
+    if prefix == b'$':
+        length = int(data[pos + 1:end - 2])
+        end = end + length + 2 if length >= 0 else end
+    elif prefix == b'*':
+        for i in range(int(data[pos + 1:end - 2])):
+            end = _value_end(data, end)
+
+    if end > len(data):
+        raise ValueError('truncated value')
+    return end
+
+
+def split_values(data):
+    '''
+        Split a RESP stream into its top level values, dropping a truncated last one.
+    '''
+    values = []
+    pos = 0
+    while pos < len(data):
+        try:
+            end = _value_end(data, pos)
+        except ValueError:
+            break
+        values.append(data[pos:end])
+        pos = end
+    return values
+
+
+def command_args(data):
+    '''
+        Return the arguments of an encoded command.
+    '''
+    args = []
+    pos = data.index(b'\r\n') + 2
+    for i in range(int(data[1:pos - 2])):
+        end = data.index(b'\r\n', pos)
+        start = end + 2
+        length = int(data[pos + 1:end])
+        args.append(data[start:start + length])
+        pos = start + length + 2
+    return args
+
+
+def load_pairs(path):
+    '''
+        Return (cmd, args, reply) for every command in the capture that got a reply.
+    '''
+    outbound = bytearray()
+    inbound = bytearray()
+    for direction, timestamp, data in read_capture(path):
+        if direction == OUTBOUND:
+            outbound += data
+        elif direction == INBOUND:
+            inbound += data
+
+    replies = iter(split_values(bytes(inbound)))
+    pairs = []
+
+    for command in split_values(bytes(outbound)):
+        args = command_args(command)
+        cmd = args[0].decode('ascii').upper()
+
+        #Multi word commands such as CONFIG GET go out as two arguments
+        if len(args) > 1:
+            name = '%s %s' % (cmd, args[1].decode('ascii', 'replace').upper())
+            if name in Redis._cmd_map:
+                cmd, args = name, args[1:]
+
+        if cmd in ('SUBSCRIBE', 'PSUBSCRIBE'):
+            break
+        if cmd == 'QUIT':
+            #The client answers QUIT itself without reading the reply
+            continue
+
+        reply = next(replies, None)
+        if reply is None:
+            break
+        pairs.append((cmd, args[1:], reply))
+
+    return pairs
+
+
+class ReplayTransport(object):
+    """
+        Serve reads from the bytes handed to feed(); writes go nowhere.
+    """
+
+    def __init__(self):
+        self._data = b''
+        self._pos = 0
+        self._delimiter = None
+        self._num_bytes = None
+        self._callback = None
+        self._reading = False
+
+    def connect(self, host, port, close_callback=None):
+        pass
+
+    def write(self, data, callback=None):
+        if callback:
+            callback()
+
+    def read_until(self, delimiter, callback):
+        self._delimiter = delimiter
+        self._callback = callback
+        if not self._reading:
+            self._process()
+
+    def read_bytes(self, num_bytes, callback):
+        self._num_bytes = num_bytes
+        self._callback = callback
+        if not self._reading:
+            self._process()
+
+    def pause_reading(self):
+        pass
+
+    def resume_reading(self):
+        pass
+
+    def close(self):
+        pass
+
+    def abandon(self):
+        pass
+
+    def closed(self):
+        return False
+
+    def feed(self, data):
+        self._data = data
+        self._pos = 0
+        self._process()
+
+    def _process(self):
+        data = self._data
+
+        self._reading = True
+        try:
+            while self._callback:
+                start = self._pos
+                if self._num_bytes is not None:
+                    end = start + self._num_bytes
+                    if end > len(data):
+                        break
+                else:
+                    end = data.find(self._delimiter, start)
+                    if end == -1:
+                        break
+                    end += len(self._delimiter)
+
+                callback = self._callback
+                self._callback = self._delimiter = self._num_bytes = None
+                self._pos = end
+                callback(data[start:end])
+        finally:
+            self._reading = False
+
+
+class _Stats(object):
+
+    def __init__(self):
+        self.ops = 0
+        self.ns = 0
+        self.bytes = 0
+        self.allocated = 0
+        self.allocation_ops = 0
+        self.latency = Histogram()
+
+    def add(self, elapsed_ns, num_bytes):
+        self.ops += 1
+        self.ns += elapsed_ns
+        self.bytes += num_bytes
+        self.latency.record(elapsed_ns / 1e9)
+
+    def result(self):
+        result = {
+            'ops': self.ops,
+            'ns_per_op': self.ns / self.ops,
+            'bytes_per_op': self.bytes / self.ops,
+            'p50_ns': self.latency.percentile(0.5) * 1e9,
+            'p99_ns': self.latency.percentile(0.99) * 1e9,
+        }
+        if self.allocation_ops:
+            result['peak_alloc_bytes_per_op'] = self.allocated / self.allocation_ops
+        return result
+
+
+def _ignore(error, value):
+    pass
+
+
+def replay(pairs, repeat=1, decode_responses=False, allocations=False):
+    '''
+        Replay pairs repeat times and return the encode and parse stats.
+    '''
+    transport = ReplayTransport()
+    client = Redis(transport=transport, decode_responses=decode_responses)
+    client.connect()
+
+    encode = {}
+    parse = {}
+    perf_counter_ns = time.perf_counter_ns
+
+    for i in range(repeat):
+        for cmd, args, reply in pairs:
+            stats = encode.get(cmd)
+            if stats is None:
+                stats = encode[cmd] = _Stats()
+            start = perf_counter_ns()
+            encoded = client._pack_command(cmd, args)
+            stats.add(perf_counter_ns() - start, _command_size(encoded))
+
+            #Queueing sends the command and leaves the client waiting for its reply
+            client._queue_command(cmd, *(args + [_ignore]))
+
+            reply_type = REPLY_TYPES.get(reply[:1], 'unknown')
+            stats = parse.get(reply_type)
+            if stats is None:
+                stats = parse[reply_type] = _Stats()
+            start = perf_counter_ns()
+            transport.feed(reply)
+            stats.add(perf_counter_ns() - start, len(reply))
+
+    if allocations:
+        #A pass of its own, tracemalloc would distort the times
+        tracemalloc.start()
+        try:
+            for cmd, args, reply in pairs:
+                client._queue_command(cmd, *(args + [_ignore]))
+
+                stats = parse[REPLY_TYPES.get(reply[:1], 'unknown')]
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                transport.feed(reply)
+                stats.allocated += tracemalloc.get_traced_memory()[1] - before
+                stats.allocation_ops += 1
+        finally:
+            tracemalloc.stop()
+
+    return {
+        'encode': dict((cmd, stats.result()) for cmd, stats in encode.items()),
+        'parse': dict((reply_type, stats.result()) for reply_type, stats in parse.items()),
+    }
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('capture', help='a file recorded with redis.capture.Capture')
+    parser.add_argument('--repeat', type=int, default=10, help='times to replay the capture')
+    parser.add_argument('--decode-responses', action='store_true', help='decode replies to str as they are parsed')
+    parser.add_argument('--allocations', action='store_true', help='measure allocations with tracemalloc')
+    parser.add_argument('--output', default=None, help='write the JSON results here instead of stdout')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+
+    #The client logs every call at DEBUG, which would be all the replay measured
+    logging.getLogger('redis').setLevel(logging.WARNING)
+
+    pairs = load_pairs(options.capture)
+    if not pairs:
+        sys.exit('%s holds no replies to replay' % options.capture)
+
+    results = replay(pairs, options.repeat, options.decode_responses, options.allocations)
+    results.update(capture=options.capture, commands=len(pairs), repeat=options.repeat,
+                   decode_responses=options.decode_responses)
+
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    for section in ('parse', 'encode'):
+        for name, result in sorted(results[section].items()):
+            print('%-6s %-16s %8d ops %10.0f ns/op %10.0f bytes/op' % (
+                section, name, result['ops'], result['ns_per_op'], result['bytes_per_op']), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+"""
+    Connections of their own for commands that block on the server.
+
+    Commands on a connection are answered in order, so a BLPOP waiting 30
+    seconds for an element holds up every command queued behind it.  A
+    client with blocking connections hands such commands to a BlockingPool
+    instead.  It does so once the commands queued before them have been
+    answered, then carries on with the rest of its queue.  The pool runs each
+    one on an idle connection, opening one when none is idle, and keeps the
+    connection for the next blocking command.
+"""
+
+import asyncio
+import logging
+from collections import deque
+
+from . import forksafe
+
+logger = logging.getLogger('redis')
+
+#Position of the timeout in seconds in each command's arguments
+TIMEOUT_ARGS = {
+    'BLPOP': -1,
+    'BRPOP': -1,
+    'BRPOPLPUSH': -1,
+    'BLMOVE': -1,
+    'BZPOPMIN': -1,
+    'BZPOPMAX': -1,
+    'BLMPOP': 0,
+    'BZMPOP': 0,
+}
+
+#Commands that only block when sent with BLOCK milliseconds
+BLOCK_OPTION_COMMANDS = frozenset(['XREAD', 'XREADGROUP'])
+
+
+def _text(arg):
+    if isinstance(arg, bytes):
+        return arg.decode('ascii', 'replace')
+    return str(arg)
+
+
+def block_seconds(cmd, args):
+    '''
+        Return how long cmd may block on the server, 0 meaning forever, or None if it doesn't block.
+    '''
+    try:
+        if cmd in BLOCK_OPTION_COMMANDS:
+            for i, arg in enumerate(args[:-1]):
+                if isinstance(arg, (bytes, str)) and _text(arg).upper() == 'BLOCK':
+                    return float(_text(args[i + 1])) / 1000
+            return None
+
+        index = TIMEOUT_ARGS.get(cmd)
+        if index is None:
+            return None
+        return float(_text(args[index]))
+
+    except (IndexError, ValueError):
+        #The server will reject the command, it doesn't block either way
+        return 0
+
+
+class BlockingPool(object):
+    """
+        Up to max_connections clients made by factory() running blocking
+        commands, None for no limit.  Commands arriving while every
+        connection is busy wait for one in order.
+
+        A command gets timeout_margin seconds beyond its server side block to
+        be answered.  After that its callback gets an error and the
+        connection is dropped, as it can no longer be told apart from a dead
+        one.  With timeout_margin None, or a command blocking forever, there
+        is no deadline.
+    """
+
+    def __init__(self, factory, max_connections=4, timeout_margin=5.0):
+        self._factory = factory
+        self._max_connections = max_connections
+        self._timeout_margin = timeout_margin
+
+        self._idle = []
+        self._busy = set()
+        #(entry, db, response_callbacks, block) waiting for a connection
+        self._waiting = deque()
+        self._forks = forksafe.forks
+
+        self.connections_made = 0
+        self.timeouts = 0
+
+    def execute(self, entry, db, response_callbacks, block):
+        '''
+            Run the queue entry of a client on a blocking connection.
+        '''
+        if self._forks != forksafe.forks:
+            #The connections and commands are the parent process's
+            self._forks = forksafe.forks
+            self._idle = []
+            self._busy = set()
+            self._waiting.clear()
+
+        if self._idle:
+            client = self._idle.pop()
+        elif self._max_connections is None or len(self._busy) < self._max_connections:
+            client = self._factory()
+            client.connect()
+            self.connections_made += 1
+        else:
+            logger.debug('every blocking connection is busy, %s waits for one' % entry[0])
+            self._waiting.append((entry, db, response_callbacks, block))
+            return
+
+        self._run(client, entry, db, response_callbacks, block)
+
+    def _run(self, client, entry, db, response_callbacks, block):
+        (cmd, arglist, callback, cmdstr, reply_options, queued_at) = entry
+        self._busy.add(client)
+        timer = None
+        finished = []
+
+        def _done(error, value):
+            if finished:
+                return
+            finished.append(True)
+
+            if timer is not None:
+                timer.cancel()
+            self._release(client)
+
+            if callback:
+                callback(error, value)
+            self._next()
+
+        def _expired():
+            if finished:
+                return
+            finished.append(True)
+
+            self.timeouts += 1
+            self._busy.discard(client)
+            client.disconnect()
+
+            if callback:
+                callback('ERR no reply to %s within %.3gs of its %.3gs block, its connection was dropped' % (
+                    cmd, block + self._timeout_margin, block), None)
+            self._next()
+
+        #Converters and profiling see the caller's callback
+        if callback:
+            _done.__wrapped__ = callback
+
+        if block and self._timeout_margin is not None:
+            timer = asyncio.get_event_loop().call_later(block + self._timeout_margin, _expired)
+
+        #The pool's clients run it themselves
+        reply_options = reply_options[:3] + (None,) + reply_options[4:]
+        client._run_entry((cmd, arglist, _done, cmdstr, reply_options, queued_at), db, response_callbacks)
+
+    def _release(self, client):
+        self._busy.discard(client)
+
+        #A connection lost while blocking is not handed out again
+        if client.closed():
+            logger.debug('dropping a closed blocking connection')
+        else:
+            self._idle.append(client)
+
+    def _next(self):
+        if self._waiting and (self._idle or self._max_connections is None or
+                              len(self._busy) < self._max_connections):
+            self.execute(*self._waiting.popleft())
+
+    def close(self):
+        '''
+            Disconnect every connection and forget the commands waiting for one.
+        '''
+        clients = self._idle + list(self._busy)
+        self._idle = []
+        self._busy = set()
+        self._waiting.clear()
+
+        for client in clients:
+            client.disconnect()
+
+    def stats(self):
+        return {
+            'idle': len(self._idle),
+            'busy': len(self._busy),
+            'waiting': len(self._waiting),
+            'max_connections': self._max_connections,
+            'connections_made': self.connections_made,
+            'timeouts': self.timeouts,
+        }
@@ -0,0 +1,235 @@
+"""
+    Load large numbers of commands the way redis-cli --pipe does.
+
+    Commands queued on a Redis client go out one at a time, each waiting for
+    the previous reply and each with a callback of its own.  A BulkLoader
+    pulls commands from an iterable on a connection of its own, encodes them
+    into chunks written in one go, and reads the replies back only to count
+    them and their errors.  At most window commands are unanswered at a
+    time, so a generator is consumed as fast as the server keeps up rather
+    than all at once.
+"""
+
+import time
+import logging
+from itertools import islice
+
+logger = logging.getLogger('redis')
+
+
+class BulkLoader(object):
+    """
+        Send commands over transport, connected by connect(close_callback),
+        encoded by pack_command(cmd, args) after selecting db.
+
+        Commands are written chunk_size at a time, as long as no more than
+        window are left unanswered.  Error replies are counted and the first
+        error_samples kept as (index, message), index being the command's
+        position in the iterable.  Once max_errors have come back no more
+        commands are sent.  progress(stats) runs every chunk_size replies.
+    """
+
+    def __init__(self, transport, connect, pack_command, db=0, chunk_size=1000, window=10000, max_errors=None,
+                 error_samples=10, progress=None):
+        if not isinstance(chunk_size, int) or chunk_size < 1:
+            raise TypeError('chunk_size must be a positive integer')
+        if not isinstance(window, int) or window < chunk_size:
+            raise TypeError('window must be an integer of at least chunk_size')
+        if max_errors is not None and (not isinstance(max_errors, int) or max_errors < 1):
+            raise TypeError('max_errors must be a positive integer or None')
+
+        self._transport = transport
+        self._connect = connect
+        self._pack_command = pack_command
+        self._db = db
+        self._chunk_size = chunk_size
+        self._window = window
+        self._max_errors = max_errors
+        self._error_samples = error_samples
+        self._progress = progress
+
+        self._commands = None
+        self._callback = None
+        #Nothing more is taken from the iterable once it is exhausted or the load is stopped
+        self._exhausted = False
+        self._error = None
+        #Replies to skip before counting, the SELECT's
+        self._skip = 0
+        #Elements left in each multi bulk reply being read, outermost first
+        self._nested = []
+
+        self.sent = 0
+        self.replies = 0
+        self.errors = 0
+        self.error_samples = []
+        self.bytes = 0
+        self.chunks = 0
+
+        self._started = None
+        self._finished = None
+
+    def load(self, commands, callback=None):
+        '''
+            Send every command in commands, an iterable of (name, arg, ...) sequences.
+            callback(error, stats) runs once they have all been answered, error being
+            set if the load stopped early.
+        '''
+        self._commands = iter(commands)
+        self._callback = callback
+        self._started = time.monotonic()
+
+        self._connect(self._on_close)
+        if self._db:
+            #Nothing goes out before the SELECT is known to have worked
+            self._transport.write(self._pack_command('SELECT', [self._db]))
+            self._skip = 1
+        else:
+            self._fill()
+        self._read()
+
+    def _fill(self):
+        #Whole chunks only, so a window opening up a reply at a time doesn't mean a write per command
+        while not self._exhausted and self.sent - self.replies + self._chunk_size <= self._window:
+            parts = []
+            size = 0
+            count = 0
+
+            try:
+                for command in islice(self._commands, self._chunk_size):
+                    if isinstance(command, (str, bytes)):
+                        raise TypeError('commands must be (name, arg, ...) sequences, not %r' % (command,))
+                    cmd = command[0]
+                    if isinstance(cmd, bytes):
+                        cmd = cmd.decode('ascii')
+
+                    cmdstr = self._pack_command(cmd.upper(), list(command[1:]))
+                    if type(cmdstr) is bytes:
+                        parts.append(cmdstr)
+                        size += len(cmdstr)
+                    else:
+                        #Large values stay buffers of their own, see Redis._pack_command
+                        parts.extend(cmdstr)
+                        size += sum([len(buf) for buf in cmdstr])
+                    count += 1
+
+            except Exception as e:
+                self._stop('ERR bulk load stopped at command %d: %s' % (self.sent + count, e))
+
+            if count < self._chunk_size:
+                self._exhausted = True
+
+            if count:
+                self._transport.write(parts)
+                self.sent += count
+                self.bytes += size
+                self.chunks += 1
+
+        if self._exhausted and self.sent == self.replies:
+            self._finish()
+
+    def _stop(self, error):
+        if self._error is None:
+            logger.warning(error)
+            self._error = error
+        self._exhausted = True
+
+    def _read(self):
+        if self._finished is None:
+            self._transport.read_until(b'\r\n', self._on_line)
+
+    def _on_line(self, line):
+        kind = line[:1]
+
+        if kind == b'$':
+            length = int(line[1:-2])
+            if length >= 0:
+                self._transport.read_bytes(length + 2, self._on_bulk)
+                return
+
+        elif kind == b'*':
+            count = int(line[1:-2])
+            if count > 0:
+                self._nested.append(count)
+                self._read()
+                return
+
+        elif kind == b'-' and not self._nested:
+            #Errors inside a multi bulk reply, such as EXEC's, are part of a reply that succeeded
+            self._reply(line[1:-2].decode('utf-8', 'replace'))
+            return
+
+        self._element()
+
+    def _on_bulk(self, data):
+        self._element()
+
+    def _element(self):
+        nested = self._nested
+        while nested:
+            nested[-1] -= 1
+            if nested[-1]:
+                self._read()
+                return
+            nested.pop()
+
+        self._reply(None)
+
+    def _reply(self, error):
+        if self._skip:
+            self._skip -= 1
+            if error is not None:
+                self._stop('ERR unable to select database %s: %s' % (self._db, error))
+            self._fill()
+            self._read()
+            return
+
+        if error is not None:
+            if len(self.error_samples) < self._error_samples:
+                self.error_samples.append((self.replies, error))
+            self.errors += 1
+            if self._max_errors is not None and self.errors >= self._max_errors:
+                self._stop('ERR bulk load stopped after %d errors' % self.errors)
+
+        self.replies += 1
+        if self._progress is not None and self.replies % self._chunk_size == 0:
+            self._progress(self.stats())
+
+        self._fill()
+        self._read()
+
+    def _on_close(self):
+        if self._finished is None:
+            self._stop('ERR connection lost with %d commands unanswered' % (self.sent - self.replies))
+            self._finish()
+
+    def _finish(self):
+        if self._finished is not None:
+            return
+        self._finished = time.monotonic()
+        self._transport.close()
+
+        if self._callback:
+            self._callback(self._error, self.stats())
+
+    def done(self):
+        return self._finished is not None
+
+    def stats(self):
+        '''
+            Return the commands sent and answered so far and the rate they were answered at.
+        '''
+        elapsed = ((self._finished or time.monotonic()) - self._started) if self._started is not None else 0.0
+
+        return {
+            'sent': self.sent,
+            'replies': self.replies,
+            'in_flight': self.sent - self.replies,
+            'errors': self.errors,
+            'error_samples': list(self.error_samples),
+            'bytes': self.bytes,
+            'chunks': self.chunks,
+            'elapsed': elapsed,
+            'commands_per_second': self.replies / elapsed if elapsed > 0 else 0.0,
+            'bytes_per_second': self.bytes / elapsed if elapsed > 0 else 0.0,
+            'done': self._finished is not None,
+        }
@@ -0,0 +1,121 @@
+"""
+    Record the raw bytes a Redis client writes and reads.
+
+    A Capture handed to Redis(capture=...) wraps the client's transport and
+    appends every command written and every piece of reply read to a file,
+    as the bytes went over the wire.  benchmarks/replay.py replays such a
+    file through the encoder and the reply parser without a socket.
+
+    Each record is a header of a direction byte (b'>' written, b'<' read), a
+    timestamp and a length, followed by that many bytes.
+"""
+
+import time
+import struct
+
+OUTBOUND = b'>'
+INBOUND = b'<'
+
+_HEADER = struct.Struct('!cdI')
+
+
+class Capture(object):
+    """
+        Append records to the file at path, or to a binary file object.
+    """
+
+    def __init__(self, path):
+        if hasattr(path, 'write'):
+            self._file = path
+        else:
+            self._file = open(path, 'ab')
+
+        self.records = 0
+        self.bytes = 0
+
+    def record(self, direction, data):
+        self._file.write(_HEADER.pack(direction, time.time(), len(data)))
+        self._file.write(data)
+        self.records += 1
+        self.bytes += len(data)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def read_capture(path):
+    '''
+        Yield (direction, timestamp, data) for every record in the capture file at path.
+    '''
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                return
+
+            (direction, timestamp, length) = _HEADER.unpack(header)
+            data = f.read(length)
+            if len(data) < length:
+                #The last record of a capture cut short by a crash
+                return
+
+            yield (direction, timestamp, data)
+
+
+class CapturingTransport(object):
+    """
+        Wrap a transport so everything written and read is recorded to a Capture.
+
+        Reads are recorded as the parser consumes them, so the inbound records
+        joined together are exactly the reply stream the client parsed.
+    """
+
+    def __init__(self, transport, capture):
+        self._transport = transport
+        self._capture = capture
+
+    def _recorded(self, callback):
+        def _callback(data):
+            self._capture.record(INBOUND, data)
+            callback(data)
+
+        return _callback
+
+    def connect(self, host, port, close_callback=None):
+        return self._transport.connect(host, port, close_callback)
+
+    def connect_unix(self, path, close_callback=None):
+        return self._transport.connect_unix(path, close_callback)
+
+    def write(self, data, callback=None):
+        #Only the recorded copy is joined, the transport still gets the separate buffers
+        self._capture.record(OUTBOUND, data if type(data) is bytes else b''.join(data))
+        self._transport.write(data, callback)
+
+    def read_until(self, delimiter, callback):
+        self._transport.read_until(delimiter, self._recorded(callback))
+
+    def read_bytes(self, num_bytes, callback):
+        self._transport.read_bytes(num_bytes, self._recorded(callback))
+
+    def pause_reading(self):
+        self._transport.pause_reading()
+
+    def resume_reading(self):
+        self._transport.resume_reading()
+
+    def close(self):
+        self._transport.close()
+
+    def abandon(self):
+        self._transport.abandon()
+
+    def copy(self):
+        #Only the client the Capture was handed to is recorded
+        return self._transport.copy()
+
+    def closed(self):
+        return self._transport.closed()
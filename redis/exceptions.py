@@ -0,0 +1,9 @@
+"""
+    Exceptions raised where an error can't be handed to a callback as text.
+"""
+
+
+class RedisError(Exception):
+    """
+        An error reply from the server, or one produced while handling a reply.
+    """
@@ -0,0 +1,760 @@
+"""
+    An in-process fake redis server for tests and benchmarks.
+
+    FakeRedisServer is a Tornado TCPServer that keeps its data in memory and
+    speaks real RESP over TCP or a Unix socket, so the client's transports and
+    parser run exactly as they would against redis.  It implements the common
+    connection, key, string, hash, list, set, sorted set and pub/sub commands,
+    and can be told to misbehave while a test runs:
+
+        server = FakeRedisServer()
+        port = server.listen_tcp()
+
+        server.latency = 0.05        #Seconds before each reply, or latency(cmd, args)
+        server.chunk_size = 3        #Write replies a few bytes at a time
+        server.drop_after = 10       #Close a connection instead of answering its 10th command
+        server.drop_connections()    #Close every connection now
+        server.fill('big', 8 << 20)  #An 8MB value for large replies
+"""
+
+import time
+import fnmatch
+import inspect
+import logging
+
+from tornado import gen, netutil
+from tornado.tcpserver import TCPServer
+from tornado.iostream import StreamClosedError
+
+logger = logging.getLogger('redis')
+
+
+class _CommandError(Exception):
+    pass
+
+
+class _Status(bytes):
+    pass
+
+
+class _Replies(list):
+    """
+        Several replies to one command, as SUBSCRIBE sends one per channel.
+    """
+    pass
+
+
+OK = _Status(b'OK')
+
+_WRONGTYPE = 'WRONGTYPE Operation against a key holding the wrong kind of value'
+
+#Commands a connection in subscribe mode may still send
+_SUBSCRIBE_MODE_COMMANDS = frozenset(['SUBSCRIBE', 'UNSUBSCRIBE', 'PSUBSCRIBE', 'PUNSUBSCRIBE', 'PING', 'QUIT'])
+
+
+def encode_reply(value):
+    '''
+        Encode a reply the way the fake server sends it: bytes as bulk strings,
+        ints as integers, lists as arrays and None as a nil bulk string.
+    '''
+    if isinstance(value, _Replies):
+        return b''.join([encode_reply(reply) for reply in value])
+    elif isinstance(value, _Status):
+        return b'+%s\r\n' % value
+    elif isinstance(value, _CommandError):
+        return b'-%s\r\n' % str(value).encode('utf-8')
+    elif isinstance(value, bytes):
+        return b'$%d\r\n%s\r\n' % (len(value), value)
+    elif isinstance(value, int):
+        return b':%d\r\n' % value
+    elif value is None:
+        return b'$-1\r\n'
+    return b'*%d\r\n%s' % (len(value), b''.join([encode_reply(item) for item in value]))
+
+
+def _int(value):
+    try:
+        return int(value)
+    except ValueError:
+        raise _CommandError('ERR value is not an integer or out of range')
+
+
+def _float(value):
+    try:
+        return float(value)
+    except ValueError:
+        raise _CommandError('ERR value is not a valid float')
+
+
+def _format_float(value):
+    return (b'%.17g' % value)
+
+
+def _range(seq, start, stop):
+    #Redis ranges include their end and count negative indexes from the end
+    length = len(seq)
+    start, stop = _int(start), _int(stop)
+    if start < 0:
+        start = max(length + start, 0)
+    if stop < 0:
+        stop = length + stop
+    if start > stop:
+        return []
+    return seq[start:stop + 1]
+
+
+async def _after(seconds, reply):
+    await gen.sleep(seconds)
+    return reply
+
+
+class _SortedSet(dict):
+    """
+        Scores by member.
+    """
+    pass
+
+
+class _Database(object):
+    """
+        One numbered database, with keys expiring lazily when they are looked at.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+
+    def _expire(self, key):
+        deadline = self.expires.get(key)
+        if deadline is not None and deadline <= time.time():
+            del self.expires[key]
+            del self.data[key]
+
+    def get(self, key, kind=None):
+        self._expire(key)
+        value = self.data.get(key)
+        if value is not None and kind is not None and not isinstance(value, kind):
+            raise _CommandError(_WRONGTYPE)
+        return value
+
+    def setdefault(self, key, kind):
+        value = self.get(key, kind)
+        if value is None:
+            value = self.data[key] = kind()
+        return value
+
+    def set(self, key, value):
+        self.data[key] = value
+        self.expires.pop(key, None)
+
+    def delete(self, key):
+        self._expire(key)
+        self.expires.pop(key, None)
+        return self.data.pop(key, None) is not None
+
+    def keys(self):
+        for key in list(self.data):
+            self._expire(key)
+        return list(self.data)
+
+    def drop_empty(self, key):
+        #Redis removes containers once their last element is gone
+        if not self.data.get(key, True):
+            self.delete(key)
+
+    def clear(self):
+        self.data.clear()
+        self.expires.clear()
+
+
+class _Connection(object):
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.db = 0
+        self.channels = set()
+        self.patterns = set()
+        self.commands = 0
+
+    def subscriptions(self):
+        return len(self.channels) + len(self.patterns)
+
+
+class FakeRedisServer(TCPServer):
+    """
+        In memory redis server speaking RESP, with knobs to inject faults.
+
+        latency is a number of seconds, or a callable latency(cmd, args)
+        returning one, to wait before each reply.  With chunk_size set,
+        replies are written chunk_size bytes at a time with chunk_delay
+        seconds between writes.  With drop_after set, a connection is closed
+        instead of answering its drop_after-th command.
+    """
+
+    def __init__(self, databases=16):
+        super(FakeRedisServer, self).__init__()
+
+        self.latency = 0
+        self.chunk_size = None
+        self.chunk_delay = 0
+        self.drop_after = None
+
+        self._databases = [_Database() for i in range(databases)]
+        self._connections = set()
+        self._channels = {}
+        self._patterns = {}
+        self._signatures = {}
+
+        #Commands received over every connection
+        self.commands = 0
+        self.connections_made = 0
+
+    def listen_tcp(self, port=0, address='127.0.0.1'):
+        '''
+            Listen on address:port, by default an ephemeral loopback port, and return the port.
+        '''
+        sockets = netutil.bind_sockets(port, address)
+        self.add_sockets(sockets)
+        return sockets[0].getsockname()[1]
+
+    def listen_unix(self, path):
+        '''
+            Listen on a Unix socket at path and return the path.
+        '''
+        sock = netutil.bind_unix_socket(path)
+        self.add_socket(sock)
+        return path
+
+    def database(self, db=0):
+        '''
+            Return the keys and values of database db, for tests to look at or seed.
+        '''
+        return self._databases[db].data
+
+    def fill(self, key, size, db=0):
+        '''
+            Store a size byte value under key, for large replies.
+        '''
+        key = key.encode('utf-8') if isinstance(key, str) else key
+        self._databases[db].set(key, b'x' * size)
+
+    def fill_list(self, key, length, size=16, db=0):
+        '''
+            Store a list of length elements of size bytes under key.
+        '''
+        key = key.encode('utf-8') if isinstance(key, str) else key
+        self._databases[db].set(key, [b'%0*d' % (size, i) for i in range(length)])
+
+    def drop_connections(self):
+        '''
+            Close every client connection, as a server restart or network failure would.
+        '''
+        for conn in list(self._connections):
+            conn.stream.close()
+
+    def connection_count(self):
+        return len(self._connections)
+
+    async def handle_stream(self, stream, address):
+        conn = _Connection(stream)
+        self._connections.add(conn)
+        self.connections_made += 1
+
+        try:
+            while True:
+                args = await self._read_command(stream)
+                conn.commands += 1
+                self.commands += 1
+
+                if self.drop_after is not None and conn.commands >= self.drop_after:
+                    logger.debug('fake server dropping connection at command %d' % conn.commands)
+                    stream.close()
+                    break
+
+                cmd = args[0].decode('utf-8', 'replace').upper()
+                reply = self._execute(conn, cmd, args[1:])
+                if inspect.isawaitable(reply):
+                    reply = await reply
+
+                latency = self.latency(cmd, args[1:]) if callable(self.latency) else self.latency
+                if latency:
+                    await gen.sleep(latency)
+
+                await self._write(stream, encode_reply(reply))
+
+                if cmd == 'QUIT':
+                    stream.close()
+                    break
+        except StreamClosedError:
+            pass
+        finally:
+            self._connections.discard(conn)
+            for channel in conn.channels:
+                self._channels[channel].discard(conn)
+            for pattern in conn.patterns:
+                self._patterns[pattern].discard(conn)
+
+    async def _read_command(self, stream):
+        line = await stream.read_until(b'\r\n')
+        if line[:1] != b'*':
+            #Inline commands, as typed into telnet
+            return line.split()
+
+        args = []
+        for i in range(int(line[1:-2])):
+            header = await stream.read_until(b'\r\n')
+            data = await stream.read_bytes(int(header[1:-2]) + 2)
+            args.append(data[:-2])
+        return args
+
+    async def _write(self, stream, data):
+        if not self.chunk_size:
+            #Not waiting for the write keeps replies to pipelined commands flowing
+            stream.write(data)
+            return
+
+        for start in range(0, len(data), self.chunk_size):
+            await stream.write(data[start:start + self.chunk_size])
+            await gen.sleep(self.chunk_delay)
+
+    def _execute(self, conn, cmd, args):
+        handler = getattr(self, '_cmd_' + cmd.lower(), None)
+        if handler is None:
+            return _CommandError("ERR unknown command '%s'" % cmd.lower())
+
+        if conn.subscriptions() and cmd not in _SUBSCRIBE_MODE_COMMANDS:
+            return _CommandError("ERR Can't execute '%s': only (P)SUBSCRIBE / (P)UNSUBSCRIBE / PING / QUIT are allowed in this context" % cmd.lower())
+
+        signature = self._signatures.get(cmd)
+        if signature is None:
+            signature = self._signatures[cmd] = inspect.signature(handler)
+        try:
+            signature.bind(conn, *args)
+        except TypeError:
+            return _CommandError("ERR wrong number of arguments for '%s' command" % cmd.lower())
+
+        try:
+            return handler(conn, *args)
+        except _CommandError as e:
+            return e
+
+    def _db(self, conn):
+        return self._databases[conn.db]
+
+    #Connection commands
+
+    def _cmd_ping(self, conn, message=None):
+        if conn.subscriptions():
+            return [b'pong', message or b'']
+        return _Status(b'PONG') if message is None else message
+
+    def _cmd_echo(self, conn, message):
+        return message
+
+    def _cmd_select(self, conn, db):
+        db = _int(db)
+        if not 0 <= db < len(self._databases):
+            raise _CommandError('ERR DB index is out of range')
+        conn.db = db
+        return OK
+
+    def _cmd_auth(self, conn, *args):
+        return OK
+
+    def _cmd_quit(self, conn):
+        return OK
+
+    def _cmd_debug(self, conn, subcommand, *args):
+        if subcommand.upper() != b'SLEEP' or len(args) != 1:
+            raise _CommandError('ERR DEBUG SLEEP <seconds> is the only DEBUG subcommand')
+        #Only this connection waits, redis would block every client
+        return _after(_float(args[0]), OK)
+
+    #Server commands
+
+    def _cmd_dbsize(self, conn):
+        return len(self._db(conn).keys())
+
+    def _cmd_flushdb(self, conn, *args):
+        self._db(conn).clear()
+        return OK
+
+    def _cmd_flushall(self, conn, *args):
+        for db in self._databases:
+            db.clear()
+        return OK
+
+    def _cmd_time(self, conn):
+        now = time.time()
+        return [b'%d' % int(now), b'%d' % int((now % 1) * 1000000)]
+
+    #Key commands
+
+    def _cmd_del(self, conn, key, *keys):
+        db = self._db(conn)
+        return len([k for k in (key,) + keys if db.delete(k)])
+
+    _cmd_unlink = _cmd_del
+
+    def _cmd_exists(self, conn, key, *keys):
+        db = self._db(conn)
+        return len([k for k in (key,) + keys if db.get(k) is not None])
+
+    def _cmd_keys(self, conn, pattern):
+        pattern = pattern.decode('utf-8', 'surrogateescape')
+        return [key for key in self._db(conn).keys() if fnmatch.fnmatchcase(key.decode('utf-8', 'surrogateescape'), pattern)]
+
+    def _cmd_type(self, conn, key):
+        value = self._db(conn).get(key)
+        #A sorted set is a dict too, so it has to be checked before hashes
+        for kind, name in ((bytes, b'string'), (_SortedSet, b'zset'), (dict, b'hash'), (list, b'list'), (set, b'set')):
+            if isinstance(value, kind):
+                return _Status(name)
+        return _Status(b'none')
+
+    def _cmd_expire(self, conn, key, seconds):
+        return self._set_expire(conn, key, _int(seconds))
+
+    def _cmd_pexpire(self, conn, key, milliseconds):
+        return self._set_expire(conn, key, _int(milliseconds) / 1000.0)
+
+    def _set_expire(self, conn, key, seconds):
+        db = self._db(conn)
+        if db.get(key) is None:
+            return 0
+        db.expires[key] = time.time() + seconds
+        return 1
+
+    def _cmd_ttl(self, conn, key):
+        ttl = self._cmd_pttl(conn, key)
+        return ttl if ttl < 0 else int(round(ttl / 1000.0))
+
+    def _cmd_pttl(self, conn, key):
+        db = self._db(conn)
+        if db.get(key) is None:
+            return -2
+        deadline = db.expires.get(key)
+        if deadline is None:
+            return -1
+        return max(int((deadline - time.time()) * 1000), 0)
+
+    def _cmd_persist(self, conn, key):
+        db = self._db(conn)
+        return 1 if db.get(key) is not None and db.expires.pop(key, None) is not None else 0
+
+    def _cmd_rename(self, conn, key, newkey):
+        db = self._db(conn)
+        value = db.get(key)
+        if value is None:
+            raise _CommandError('ERR no such key')
+        deadline = db.expires.get(key)
+        db.delete(key)
+        db.set(newkey, value)
+        if deadline is not None:
+            db.expires[newkey] = deadline
+        return OK
+
+    #String commands
+
+    def _cmd_get(self, conn, key):
+        return self._db(conn).get(key, bytes)
+
+    def _cmd_set(self, conn, key, value, *options):
+        db = self._db(conn)
+        expire = None
+        condition = None
+        get = False
+
+        options = [option.upper() for option in options]
+        i = 0
+        while i < len(options):
+            option = options[i]
+            if option in (b'EX', b'PX') and i + 1 < len(options):
+                expire = _int(options[i + 1]) / (1.0 if option == b'EX' else 1000.0)
+                i += 1
+            elif option in (b'NX', b'XX'):
+                condition = option
+            elif option == b'GET':
+                get = True
+            else:
+                raise _CommandError('ERR syntax error')
+            i += 1
+
+        old = db.get(key, bytes if get else None)
+        if (condition == b'NX' and old is not None) or (condition == b'XX' and old is None):
+            return old if get else None
+
+        db.set(key, value)
+        if expire is not None:
+            db.expires[key] = time.time() + expire
+        return old if get else OK
+
+    def _cmd_setnx(self, conn, key, value):
+        return 1 if self._cmd_set(conn, key, value, b'NX') is OK else 0
+
+    def _cmd_setex(self, conn, key, seconds, value):
+        return self._cmd_set(conn, key, value, b'EX', seconds)
+
+    def _cmd_getset(self, conn, key, value):
+        return self._cmd_set(conn, key, value, b'GET')
+
+    def _cmd_getdel(self, conn, key):
+        value = self._cmd_get(conn, key)
+        self._db(conn).delete(key)
+        return value
+
+    def _cmd_mget(self, conn, key, *keys):
+        db = self._db(conn)
+        values = [db.get(k) for k in (key,) + keys]
+        #MGET answers nil for keys of other types instead of failing
+        return [value if isinstance(value, bytes) else None for value in values]
+
+    def _cmd_mset(self, conn, key, value, *pairs):
+        if len(pairs) % 2:
+            raise _CommandError("ERR wrong number of arguments for 'mset' command")
+        db = self._db(conn)
+        pairs = (key, value) + pairs
+        for i in range(0, len(pairs), 2):
+            db.set(pairs[i], pairs[i + 1])
+        return OK
+
+    def _cmd_incrby(self, conn, key, increment):
+        db = self._db(conn)
+        value = _int(db.get(key, bytes) or b'0') + _int(increment)
+        deadline = db.expires.get(key)
+        db.set(key, b'%d' % value)
+        if deadline is not None:
+            db.expires[key] = deadline
+        return value
+
+    def _cmd_incr(self, conn, key):
+        return self._cmd_incrby(conn, key, b'1')
+
+    def _cmd_decr(self, conn, key):
+        return self._cmd_incrby(conn, key, b'-1')
+
+    def _cmd_decrby(self, conn, key, decrement):
+        return self._cmd_incrby(conn, key, b'%d' % -_int(decrement))
+
+    def _cmd_append(self, conn, key, value):
+        db = self._db(conn)
+        value = (db.get(key, bytes) or b'') + value
+        db.data[key] = value
+        return len(value)
+
+    def _cmd_strlen(self, conn, key):
+        return len(self._db(conn).get(key, bytes) or b'')
+
+    #Hash commands
+
+    def _cmd_hset(self, conn, key, field, value, *pairs):
+        if len(pairs) % 2:
+            raise _CommandError("ERR wrong number of arguments for 'hset' command")
+        fields = self._db(conn).setdefault(key, dict)
+        pairs = (field, value) + pairs
+        added = 0
+        for i in range(0, len(pairs), 2):
+            added += pairs[i] not in fields
+            fields[pairs[i]] = pairs[i + 1]
+        return added
+
+    def _cmd_hmset(self, conn, key, field, value, *pairs):
+        self._cmd_hset(conn, key, field, value, *pairs)
+        return OK
+
+    def _cmd_hget(self, conn, key, field):
+        return (self._db(conn).get(key, dict) or {}).get(field)
+
+    def _cmd_hmget(self, conn, key, field, *fields):
+        values = self._db(conn).get(key, dict) or {}
+        return [values.get(f) for f in (field,) + fields]
+
+    def _cmd_hgetall(self, conn, key):
+        values = self._db(conn).get(key, dict) or {}
+        return [item for pair in values.items() for item in pair]
+
+    def _cmd_hdel(self, conn, key, field, *fields):
+        db = self._db(conn)
+        values = db.get(key, dict) or {}
+        removed = len([f for f in (field,) + fields if values.pop(f, None) is not None])
+        db.drop_empty(key)
+        return removed
+
+    def _cmd_hlen(self, conn, key):
+        return len(self._db(conn).get(key, dict) or {})
+
+    def _cmd_hexists(self, conn, key, field):
+        return int(field in (self._db(conn).get(key, dict) or {}))
+
+    def _cmd_hkeys(self, conn, key):
+        return list(self._db(conn).get(key, dict) or {})
+
+    def _cmd_hvals(self, conn, key):
+        return list((self._db(conn).get(key, dict) or {}).values())
+
+    def _cmd_hincrby(self, conn, key, field, increment):
+        fields = self._db(conn).setdefault(key, dict)
+        value = _int(fields.get(field, b'0')) + _int(increment)
+        fields[field] = b'%d' % value
+        return value
+
+    #List commands
+
+    def _cmd_lpush(self, conn, key, value, *values):
+        items = self._db(conn).setdefault(key, list)
+        for value in (value,) + values:
+            items.insert(0, value)
+        return len(items)
+
+    def _cmd_rpush(self, conn, key, value, *values):
+        items = self._db(conn).setdefault(key, list)
+        items.extend((value,) + values)
+        return len(items)
+
+    def _pop(self, conn, key, index):
+        db = self._db(conn)
+        items = db.get(key, list)
+        if not items:
+            return None
+        value = items.pop(index)
+        db.drop_empty(key)
+        return value
+
+    def _cmd_lpop(self, conn, key):
+        return self._pop(conn, key, 0)
+
+    def _cmd_rpop(self, conn, key):
+        return self._pop(conn, key, -1)
+
+    def _cmd_lrange(self, conn, key, start, stop):
+        return _range(self._db(conn).get(key, list) or [], start, stop)
+
+    def _cmd_llen(self, conn, key):
+        return len(self._db(conn).get(key, list) or [])
+
+    def _cmd_lindex(self, conn, key, index):
+        items = self._db(conn).get(key, list) or []
+        index = _int(index)
+        return items[index] if -len(items) <= index < len(items) else None
+
+    #Set commands
+
+    def _cmd_sadd(self, conn, key, member, *members):
+        values = self._db(conn).setdefault(key, set)
+        before = len(values)
+        values.update((member,) + members)
+        return len(values) - before
+
+    def _cmd_srem(self, conn, key, member, *members):
+        db = self._db(conn)
+        values = db.get(key, set) or set()
+        before = len(values)
+        values.difference_update((member,) + members)
+        db.drop_empty(key)
+        return before - len(values)
+
+    def _cmd_smembers(self, conn, key):
+        return sorted(self._db(conn).get(key, set) or ())
+
+    def _cmd_sismember(self, conn, key, member):
+        return int(member in (self._db(conn).get(key, set) or ()))
+
+    def _cmd_scard(self, conn, key):
+        return len(self._db(conn).get(key, set) or ())
+
+    #Sorted set commands
+
+    def _cmd_zadd(self, conn, key, score, member, *pairs):
+        if len(pairs) % 2:
+            raise _CommandError('ERR syntax error')
+        scores = self._db(conn).setdefault(key, _SortedSet)
+        pairs = (score, member) + pairs
+        added = 0
+        for i in range(0, len(pairs), 2):
+            added += pairs[i + 1] not in scores
+            scores[pairs[i + 1]] = _float(pairs[i])
+        return added
+
+    def _cmd_zincrby(self, conn, key, increment, member):
+        scores = self._db(conn).setdefault(key, _SortedSet)
+        scores[member] = scores.get(member, 0.0) + _float(increment)
+        return _format_float(scores[member])
+
+    def _cmd_zscore(self, conn, key, member):
+        score = (self._db(conn).get(key, _SortedSet) or {}).get(member)
+        return None if score is None else _format_float(score)
+
+    def _cmd_zcard(self, conn, key):
+        return len(self._db(conn).get(key, _SortedSet) or ())
+
+    def _cmd_zrem(self, conn, key, member, *members):
+        db = self._db(conn)
+        scores = db.get(key, _SortedSet) or {}
+        removed = len([m for m in (member,) + members if scores.pop(m, None) is not None])
+        db.drop_empty(key)
+        return removed
+
+    def _cmd_zrange(self, conn, key, start, stop, *options):
+        if [option.upper() for option in options] not in ([], [b'WITHSCORES']):
+            raise _CommandError('ERR syntax error')
+        scores = self._db(conn).get(key, _SortedSet) or {}
+        members = _range(sorted(scores, key=lambda member: (scores[member], member)), start, stop)
+        if options:
+            return [item for member in members for item in (member, _format_float(scores[member]))]
+        return members
+
+    #PubSub commands
+
+    def _cmd_publish(self, conn, channel, message):
+        receivers = 0
+
+        data = encode_reply([b'message', channel, message])
+        for subscriber in list(self._channels.get(channel, ())):
+            receivers += self._deliver(subscriber, data)
+
+        name = channel.decode('utf-8', 'surrogateescape')
+        for pattern, subscribers in list(self._patterns.items()):
+            if subscribers and fnmatch.fnmatchcase(name, pattern.decode('utf-8', 'surrogateescape')):
+                data = encode_reply([b'pmessage', pattern, channel, message])
+                for subscriber in list(subscribers):
+                    receivers += self._deliver(subscriber, data)
+
+        return receivers
+
+    def _deliver(self, subscriber, data):
+        try:
+            subscriber.stream.write(data)
+        except StreamClosedError:
+            return 0
+        return 1
+
+    def _cmd_subscribe(self, conn, channel, *channels):
+        return self._subscribe(conn, conn.channels, self._channels, b'subscribe', (channel,) + channels)
+
+    def _cmd_psubscribe(self, conn, pattern, *patterns):
+        return self._subscribe(conn, conn.patterns, self._patterns, b'psubscribe', (pattern,) + patterns)
+
+    def _cmd_unsubscribe(self, conn, *channels):
+        return self._unsubscribe(conn, conn.channels, self._channels, b'unsubscribe', channels)
+
+    def _cmd_punsubscribe(self, conn, *patterns):
+        return self._unsubscribe(conn, conn.patterns, self._patterns, b'punsubscribe', patterns)
+
+    def _subscribe(self, conn, subscribed, subscribers, kind, names):
+        replies = _Replies()
+        for name in names:
+            subscribed.add(name)
+            subscribers.setdefault(name, set()).add(conn)
+            replies.append([kind, name, conn.subscriptions()])
+        return replies
+
+    def _unsubscribe(self, conn, subscribed, subscribers, kind, names):
+        replies = _Replies()
+        for name in names or sorted(subscribed):
+            subscribed.discard(name)
+            subscribers.get(name, set()).discard(conn)
+            replies.append([kind, name, conn.subscriptions()])
+        if not replies:
+            #Nothing to unsubscribe from still gets an answer
+            replies.append([kind, None, conn.subscriptions()])
+        return replies
@@ -0,0 +1,92 @@
+"""
+    Flow control on the bytes a client has accepted but not yet written.
+"""
+
+import asyncio
+
+
+class WriteFlowControl(object):
+    """
+        Count the bytes of commands that are queued or sitting in the
+        transport's write buffer.
+
+        Once the count reaches high_watermark the client counts as paused
+        until transport write completions bring it down to low_watermark.
+        Nothing is refused while paused; producers that care await
+        wait_writable() before submitting more.
+    """
+
+    def __init__(self, high_watermark=None, low_watermark=None, loop=None):
+        if high_watermark is not None and high_watermark < 1:
+            raise TypeError('write_buffer_limit must be at least 1')
+
+        if low_watermark is None:
+            low_watermark = high_watermark // 2 if high_watermark is not None else None
+        elif high_watermark is None or not 0 <= low_watermark < high_watermark:
+            raise TypeError('write_buffer_low_watermark must be below write_buffer_limit')
+
+        self._high_watermark = high_watermark
+        self._low_watermark = low_watermark
+        self._loop = loop
+
+        self._paused = False
+        self._waiters = []
+
+        self.pending_bytes = 0
+        self.max_pending_bytes = 0
+        self.pauses = 0
+
+    def add(self, num_bytes):
+        self.pending_bytes += num_bytes
+
+        if self.pending_bytes > self.max_pending_bytes:
+            self.max_pending_bytes = self.pending_bytes
+
+        if not self._paused and self._high_watermark is not None and self.pending_bytes >= self._high_watermark:
+            self._paused = True
+            self.pauses += 1
+
+    def done(self, num_bytes):
+        self.pending_bytes -= num_bytes
+
+        if self._paused and self.pending_bytes <= self._low_watermark:
+            self._paused = False
+
+            waiters, self._waiters = self._waiters, []
+            for future in waiters:
+                if not future.done():
+                    future.set_result(None)
+
+    def paused(self):
+        return self._paused
+
+    def clear(self):
+        '''
+            Forget the pending bytes, for a child process that inherited them.
+        '''
+        self.pending_bytes = 0
+        self._paused = False
+        self._waiters = []
+
+    def wait_writable(self):
+        '''
+            Return a Future that resolves once the client is not paused.
+        '''
+        future = (self._loop or asyncio.get_event_loop()).create_future()
+
+        if self._paused:
+            self._waiters.append(future)
+        else:
+            future.set_result(None)
+
+        return future
+
+    def stats(self):
+        return {
+            'pending_bytes': self.pending_bytes,
+            'max_pending_bytes': self.max_pending_bytes,
+            'high_watermark': self._high_watermark,
+            'low_watermark': self._low_watermark,
+            'paused': self._paused,
+            'pauses': self.pauses,
+        }
@@ -0,0 +1,54 @@
+"""
+    Notice when the process has forked.
+
+    A client created before tornado.process.fork_processes, or any other
+    os.fork(), is copied into every child along with its socket and its
+    queue of commands.  Children sharing a socket read each other's replies.
+    Clients compare the fork count below against the one they last saw and
+    start over with a connection of their own when it has changed, which
+    costs a global lookup per command rather than a getpid() call.
+"""
+
+import os
+
+#Forks this process is a child of, bumped in the child by os.fork()
+forks = 0
+
+
+def _count_fork():
+    global forks
+    forks += 1
+
+
+os.register_at_fork(after_in_child=_count_fork)
+
+
+class PerProcess(object):
+    """
+        Build a value with factory() on first use in each process.
+
+        Create clients, executors and anything else that must not be shared
+        with a parent process through one of these at import time, and get()
+        them where they are used:
+
+            cache = PerProcess(lambda: Redis(unix_socket_path='/run/redis.sock'))
+            ...
+            cache.get().get('key', callback)
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._value = None
+        self._forks = None
+
+    def get(self):
+        if self._forks != forks:
+            self._value = self._factory()
+            self._forks = forks
+        return self._value
+
+    def built(self):
+        '''
+            Return True if get() has built the value in this process.
+        '''
+        return self._forks == forks
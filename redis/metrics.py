@@ -0,0 +1,401 @@
+"""
+    Per command metrics for Redis clients, and sinks to report them to.
+
+    A ClientMetrics is handed to one or more clients with Redis(metrics=...)
+    and records, per command name, counts, errors, bytes sent and received
+    and histograms of the time spent waiting in the command queue and of the
+    round trip to the server.  Clients with priorities also record, per
+    lane, the commands waiting, sent and dropped and how long they waited.
+    snapshot() turns it into plain dicts, which a sink's emit(snapshot) then
+    reports.
+"""
+
+import time
+import socket
+import logging
+
+logger = logging.getLogger('redis')
+
+#Each power of two is split into 2**(_SUB_BUCKET_BITS - 1) linear buckets, about 3% precision
+_SUB_BUCKET_BITS = 6
+_HALF_BUCKET_COUNT = 1 << (_SUB_BUCKET_BITS - 1)
+
+QUANTILES = (('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('p999', 0.999))
+
+
+def _bucket_index(value):
+    shift = value.bit_length() - _SUB_BUCKET_BITS
+    if shift <= 0:
+        #Small values are counted exactly
+        return value
+    return shift * _HALF_BUCKET_COUNT + (value >> shift)
+
+
+def _bucket_upper_bound(index):
+    if index < 2 * _HALF_BUCKET_COUNT:
+        return index
+    shift = index // _HALF_BUCKET_COUNT - 1
+    top = index - shift * _HALF_BUCKET_COUNT
+    return ((top + 1) << shift) - 1
+
+
+class Histogram(object):
+    """
+        HDR style histogram of durations, recorded in whole microseconds.
+
+        Buckets are kept in a dict keyed by bucket index, so a histogram only
+        costs memory for the ranges it has actually seen.
+    """
+
+    def __init__(self):
+        self._buckets = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def record(self, seconds):
+        value = int(seconds * 1000000)
+        if value < 0:
+            value = 0
+
+        index = _bucket_index(value)
+        self._buckets[index] = self._buckets.get(index, 0) + 1
+
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, quantile):
+        '''
+            Return the value in seconds that quantile of the recorded values are at or below.
+        '''
+        if not self.count:
+            return 0.0
+
+        wanted = quantile * self.count
+        seen = 0
+        for index in sorted(self._buckets):
+            seen += self._buckets[index]
+            if seen >= wanted:
+                return min(_bucket_upper_bound(index), self.max) / 1000000.0
+
+        return self.max / 1000000.0
+
+    def snapshot(self):
+        snapshot = {
+            'count': self.count,
+            'sum': self.total / 1000000.0,
+            'min': (self.min or 0) / 1000000.0,
+            'max': self.max / 1000000.0,
+        }
+        for name, quantile in QUANTILES:
+            snapshot[name] = self.percentile(quantile)
+        return snapshot
+
+
+class CommandMetrics(object):
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.queue_wait = Histogram()
+        self.round_trip = Histogram()
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'bytes_out': self.bytes_out,
+            'bytes_in': self.bytes_in,
+            'queue_wait': self.queue_wait.snapshot(),
+            'round_trip': self.round_trip.snapshot(),
+        }
+
+
+class LaneMetrics(object):
+
+    def __init__(self):
+        self.queued = 0
+        self.sent = 0
+        self.dropped = 0
+        self.queue_wait = Histogram()
+
+    def snapshot(self):
+        return {
+            'queued': self.queued,
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'queue_wait': self.queue_wait.snapshot(),
+        }
+
+
+class ClientMetrics(object):
+    """
+        Metrics shared by every client it is handed to.
+    """
+
+    def __init__(self):
+        self._commands = {}
+        self._lanes = {}
+
+        #Gauges
+        self.in_flight = 0
+        self.queued = 0
+
+        #Connection counters
+        self.connects = 0
+        self.reconnects = 0
+        self.disconnects = 0
+
+    def _command(self, cmd):
+        metrics = self._commands.get(cmd)
+        if metrics is None:
+            metrics = self._commands[cmd] = CommandMetrics()
+        return metrics
+
+    def _lane(self, lane):
+        metrics = self._lanes.get(lane)
+        if metrics is None:
+            metrics = self._lanes[lane] = LaneMetrics()
+        return metrics
+
+    def command_queued(self, lane=None):
+        self.queued += 1
+        if lane is not None:
+            self._lane(lane).queued += 1
+
+    def command_moved(self, lane=None):
+        #Handed to another client's queue, which counts it again
+        self.queued -= 1
+        if lane is not None:
+            self._lane(lane).queued -= 1
+
+    def command_dropped(self, cmd, lane=None):
+        self.queued -= 1
+        self._command(cmd).errors += 1
+        if lane is not None:
+            metrics = self._lane(lane)
+            metrics.queued -= 1
+            metrics.dropped += 1
+
+    def command_sent(self, cmd, queue_wait, num_bytes, lane=None):
+        metrics = self._command(cmd)
+        metrics.queue_wait.record(queue_wait)
+        metrics.bytes_out += num_bytes
+
+        self.queued -= 1
+        self.in_flight += 1
+
+        if lane is not None:
+            metrics = self._lane(lane)
+            metrics.queued -= 1
+            metrics.sent += 1
+            metrics.queue_wait.record(queue_wait)
+
+    def command_done(self, cmd, round_trip, num_bytes, failed):
+        metrics = self._command(cmd)
+        metrics.count += 1
+        metrics.bytes_in += num_bytes
+        metrics.round_trip.record(round_trip)
+        if failed:
+            metrics.errors += 1
+
+        self.in_flight -= 1
+
+    def connected(self, reconnect):
+        self.connects += 1
+        if reconnect:
+            self.reconnects += 1
+
+    def disconnected(self):
+        self.disconnects += 1
+
+    def snapshot(self):
+        return {
+            'commands': dict((cmd, metrics.snapshot()) for cmd, metrics in self._commands.items()),
+            'lanes': dict((lane, metrics.snapshot()) for lane, metrics in self._lanes.items()),
+            'in_flight': self.in_flight,
+            'queued': self.queued,
+            'connects': self.connects,
+            'reconnects': self.reconnects,
+            'disconnects': self.disconnects,
+            'time': time.time(),
+        }
+
+    def report(self, sink):
+        '''
+            Hand a snapshot to sink.emit(snapshot).
+        '''
+        sink.emit(self.snapshot())
+
+
+class SnapshotSink(object):
+    """
+        Keep the latest snapshot as a dict.
+    """
+
+    def __init__(self):
+        self.snapshot = None
+
+    def emit(self, snapshot):
+        self.snapshot = snapshot
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_text(snapshot, prefix='redis_client'):
+    '''
+        Render a snapshot in the Prometheus text exposition format.
+    '''
+    lines = []
+    commands = sorted(snapshot['commands'].items())
+
+    for name, key, kind, doc in (('commands_total', 'count', 'counter', 'Commands completed'),
+                                 ('command_errors_total', 'errors', 'counter', 'Commands that failed or were dropped'),
+                                 ('command_sent_bytes_total', 'bytes_out', 'counter', 'Bytes of commands written'),
+                                 ('command_received_bytes_total', 'bytes_in', 'counter', 'Bytes of replies read')):
+        lines.append('# HELP %s_%s %s' % (prefix, name, doc))
+        lines.append('# TYPE %s_%s %s' % (prefix, name, kind))
+        for cmd, metrics in commands:
+            lines.append('%s_%s{command="%s"} %d' % (prefix, name, _label(cmd), metrics[key]))
+
+    for name, key, doc in (('queue_wait_seconds', 'queue_wait', 'Time commands waited in the command queue'),
+                           ('round_trip_seconds', 'round_trip', 'Time from writing a command to reading its reply')):
+        lines.append('# HELP %s_%s %s' % (prefix, name, doc))
+        lines.append('# TYPE %s_%s summary' % (prefix, name))
+        for cmd, metrics in commands:
+            histogram = metrics[key]
+            for label, quantile in QUANTILES:
+                lines.append('%s_%s{command="%s",quantile="%s"} %r' % (prefix, name, _label(cmd), quantile, histogram[label]))
+            lines.append('%s_%s_sum{command="%s"} %r' % (prefix, name, _label(cmd), histogram['sum']))
+            lines.append('%s_%s_count{command="%s"} %d' % (prefix, name, _label(cmd), histogram['count']))
+
+    #Hand built snapshots may leave the lanes out
+    lanes = sorted(snapshot.get('lanes', {}).items())
+    if lanes:
+        for name, key, kind, doc in (('lane_queued', 'queued', 'gauge', 'Commands waiting in each priority lane'),
+                                     ('lane_sent_total', 'sent', 'counter', 'Commands sent from each priority lane'),
+                                     ('lane_dropped_total', 'dropped', 'counter', 'Commands turned away by a full lane')):
+            lines.append('# HELP %s_%s %s' % (prefix, name, doc))
+            lines.append('# TYPE %s_%s %s' % (prefix, name, kind))
+            for lane, metrics in lanes:
+                lines.append('%s_%s{lane="%s"} %d' % (prefix, name, _label(lane), metrics[key]))
+
+        name = 'lane_queue_wait_seconds'
+        lines.append('# HELP %s_%s Time commands waited in each priority lane' % (prefix, name))
+        lines.append('# TYPE %s_%s summary' % (prefix, name))
+        for lane, metrics in lanes:
+            histogram = metrics['queue_wait']
+            for label, quantile in QUANTILES:
+                lines.append('%s_%s{lane="%s",quantile="%s"} %r' % (prefix, name, _label(lane), quantile, histogram[label]))
+            lines.append('%s_%s_sum{lane="%s"} %r' % (prefix, name, _label(lane), histogram['sum']))
+            lines.append('%s_%s_count{lane="%s"} %d' % (prefix, name, _label(lane), histogram['count']))
+
+    for name, key, kind, doc in (('in_flight', 'in_flight', 'gauge', 'Commands written and waiting for a reply'),
+                                 ('queued', 'queued', 'gauge', 'Commands waiting in the command queue'),
+                                 ('connects_total', 'connects', 'counter', 'Connections made'),
+                                 ('reconnects_total', 'reconnects', 'counter', 'Connections made after the first'),
+                                 ('disconnects_total', 'disconnects', 'counter', 'Connections lost or closed')):
+        lines.append('# HELP %s_%s %s' % (prefix, name, doc))
+        lines.append('# TYPE %s_%s %s' % (prefix, name, kind))
+        lines.append('%s_%s %d' % (prefix, name, snapshot[key]))
+
+    return '\n'.join(lines) + '\n'
+
+
+class PrometheusSink(object):
+    """
+        Keep the latest snapshot rendered for a Prometheus scrape handler.
+    """
+
+    def __init__(self, prefix='redis_client'):
+        self.prefix = prefix
+        self.text = prometheus_text({'commands': {}, 'lanes': {}, 'in_flight': 0, 'queued': 0,
+                                     'connects': 0, 'reconnects': 0, 'disconnects': 0}, prefix)
+
+    def emit(self, snapshot):
+        self.text = prometheus_text(snapshot, self.prefix)
+
+
+class StatsdSink(object):
+    """
+        Push snapshots to statsd over UDP.
+
+        Counters are sent as the increase since the previous push, gauges and
+        latency percentiles (in milliseconds) as gauges.
+    """
+
+    def __init__(self, host='localhost', port=8125, prefix='redis', max_packet_size=512):
+        self._address = (host, port)
+        self._prefix = prefix
+        self._max_packet_size = max_packet_size
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+        self._last = {}
+
+    def _counter(self, lines, name, value):
+        delta = value - self._last.get(name, 0)
+        self._last[name] = value
+        if delta:
+            lines.append('%s.%s:%d|c' % (self._prefix, name, delta))
+
+    def _gauge(self, lines, name, value):
+        lines.append('%s.%s:%s|g' % (self._prefix, name, value))
+
+    def lines(self, snapshot):
+        lines = []
+
+        for cmd, metrics in sorted(snapshot['commands'].items()):
+            cmd = cmd.lower().replace(' ', '_')
+            for key in ('count', 'errors', 'bytes_out', 'bytes_in'):
+                self._counter(lines, 'command.%s.%s' % (cmd, key), metrics[key])
+            for key in ('queue_wait', 'round_trip'):
+                for name, quantile in QUANTILES:
+                    self._gauge(lines, 'command.%s.%s.%s' % (cmd, key, name), '%.3f' % (metrics[key][name] * 1000))
+
+        for lane, metrics in sorted(snapshot.get('lanes', {}).items()):
+            lane = lane.lower().replace(' ', '_')
+            self._gauge(lines, 'lane.%s.queued' % lane, metrics['queued'])
+            for key in ('sent', 'dropped'):
+                self._counter(lines, 'lane.%s.%s' % (lane, key), metrics[key])
+            for name, quantile in QUANTILES:
+                self._gauge(lines, 'lane.%s.queue_wait.%s' % (lane, name), '%.3f' % (metrics['queue_wait'][name] * 1000))
+
+        self._gauge(lines, 'in_flight', snapshot['in_flight'])
+        self._gauge(lines, 'queued', snapshot['queued'])
+        for key in ('connects', 'reconnects', 'disconnects'):
+            self._counter(lines, key, snapshot[key])
+
+        return lines
+
+    def emit(self, snapshot):
+        packet = []
+        size = 0
+
+        for line in self.lines(snapshot):
+            if packet and size + len(line) + 1 > self._max_packet_size:
+                self._send('\n'.join(packet))
+                packet, size = [], 0
+            packet.append(line)
+            size += len(line) + 1
+
+        if packet:
+            self._send('\n'.join(packet))
+
+    def _send(self, data):
+        try:
+            self._socket.sendto(data.encode('ascii', 'replace'), self._address)
+        except (socket.error, OSError) as e:
+            #Metrics must never take the application down
+            logger.debug('statsd push failed: %s' % e)
+
+    def close(self):
+        self._socket.close()
@@ -0,0 +1,215 @@
+"""
+    Attribute the IOLoop time a Redis client uses to parsing, encoding and
+    the user callbacks it runs.
+
+    Reply callbacks run inline from the read path, so a slow callback holds
+    up every reply behind it on the connection.  A LoopProfiler handed to
+    Redis(profiler=...) times each transport read callback, subtracts the
+    user callbacks run from inside it to get the parse time, times each user
+    callback by command and call site, and times command encoding.
+"""
+
+import time
+import logging
+import functools
+
+logger = logging.getLogger('redis')
+
+
+def _unwrap(callback):
+    #Look through partials, decorators and bound methods to the function itself
+    func = callback
+    while True:
+        if isinstance(func, functools.partial):
+            func = func.func
+        elif hasattr(func, '__wrapped__'):
+            func = func.__wrapped__
+        elif hasattr(func, '__func__'):
+            func = func.__func__
+        else:
+            return func
+
+
+def call_site(callback):
+    '''
+        Describe where a callback was defined, as file:line(name).
+    '''
+    func = _unwrap(callback)
+    code = getattr(func, '__code__', None)
+    if code is None:
+        return repr(func)
+
+    return '%s:%d(%s)' % (code.co_filename, code.co_firstlineno, getattr(func, '__qualname__', code.co_name))
+
+
+class _Timer(object):
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.over_budget = 0
+
+    def add(self, elapsed):
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+
+    def report(self):
+        return {'count': self.count, 'total': self.total, 'max': self.max}
+
+
+class LoopProfiler(object):
+    """
+        Time spent by the clients it is handed to, see report().
+
+        Callbacks running longer than callback_budget seconds are counted
+        and, with log_level set, logged with their call site.
+    """
+
+    def __init__(self, callback_budget=0.01, log_level=logging.WARNING):
+        self.callback_budget = callback_budget
+        self._log_level = log_level
+        self._sites = {}
+        self.reset()
+
+    def reset(self):
+        self._started = time.perf_counter()
+        self._parse = _Timer()
+        self._encode = _Timer()
+        self._callbacks = {}
+
+        #User callback time inside the read callback being timed
+        self._nested = 0.0
+        self._in_callback = False
+        #Encoding done from inside user callbacks is already part of their time
+        self._encode_outside = 0.0
+
+    def _site(self, callback):
+        #Callbacks are often fresh closures, so cache by code object rather than by callback
+        func = _unwrap(callback)
+        key = getattr(func, '__code__', None) or func
+
+        site = self._sites.get(key)
+        if site is None:
+            site = self._sites[key] = call_site(callback)
+        return site
+
+    def wrap_read(self, callback):
+        '''
+            Return callback timed as parse work.
+        '''
+        def timed(data):
+            outer = self._nested
+            self._nested = 0.0
+            start = time.perf_counter()
+            try:
+                callback(data)
+            finally:
+                elapsed = time.perf_counter() - start
+                self._parse.add(elapsed - self._nested)
+                self._nested = outer
+
+        return timed
+
+    def run_callback(self, cmd, callback, error, value):
+        site = self._site(callback)
+        in_callback, self._in_callback = self._in_callback, True
+
+        start = time.perf_counter()
+        try:
+            callback(error, value)
+        finally:
+            elapsed = time.perf_counter() - start
+            self._in_callback = in_callback
+            self._nested += elapsed
+
+            timer = self._callbacks.get((cmd, site))
+            if timer is None:
+                timer = self._callbacks[(cmd, site)] = _Timer()
+            timer.add(elapsed)
+
+            if elapsed > self.callback_budget:
+                timer.over_budget += 1
+                if self._log_level is not None:
+                    logger.log(self._log_level, 'callback %s for %s took %.3fms, over its %.3fms budget' % (
+                        site, cmd, elapsed * 1000, self.callback_budget * 1000))
+
+    def encoded(self, elapsed):
+        self._encode.add(elapsed)
+
+        #Encoding from inside a user callback is already part of that callback's time
+        if not self._in_callback:
+            self._encode_outside += elapsed
+
+    def report(self):
+        '''
+            Return the times spent so far and the share of the elapsed time they make up.
+        '''
+        elapsed = time.perf_counter() - self._started
+
+        callbacks = []
+        callback_total = 0.0
+        for (cmd, site), timer in self._callbacks.items():
+            entry = timer.report()
+            entry.update(command=cmd, site=site, over_budget=timer.over_budget)
+            callbacks.append(entry)
+            callback_total += timer.total
+        callbacks.sort(key=lambda entry: entry['total'], reverse=True)
+
+        client_time = self._parse.total + callback_total + self._encode_outside
+
+        return {
+            'elapsed': elapsed,
+            'client_time': client_time,
+            'loop_share': client_time / elapsed if elapsed > 0 else 0.0,
+            'parse': self._parse.report(),
+            'encode': self._encode.report(),
+            'callbacks': callbacks,
+            'callback_budget': self.callback_budget,
+        }
+
+
+class ProfiledTransport(object):
+    """
+        Wrap a transport so its read callbacks are timed by a LoopProfiler.
+    """
+
+    def __init__(self, transport, profiler):
+        self._transport = transport
+        self._profiler = profiler
+
+    def connect(self, host, port, close_callback=None):
+        return self._transport.connect(host, port, close_callback)
+
+    def connect_unix(self, path, close_callback=None):
+        return self._transport.connect_unix(path, close_callback)
+
+    def write(self, data, callback=None):
+        self._transport.write(data, callback)
+
+    def read_until(self, delimiter, callback):
+        self._transport.read_until(delimiter, self._profiler.wrap_read(callback))
+
+    def read_bytes(self, num_bytes, callback):
+        self._transport.read_bytes(num_bytes, self._profiler.wrap_read(callback))
+
+    def pause_reading(self):
+        self._transport.pause_reading()
+
+    def resume_reading(self):
+        self._transport.resume_reading()
+
+    def close(self):
+        self._transport.close()
+
+    def abandon(self):
+        self._transport.abandon()
+
+    def copy(self):
+        #The client the copy is for wraps it again
+        return self._transport.copy()
+
+    def closed(self):
+        return self._transport.closed()
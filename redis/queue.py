@@ -0,0 +1,304 @@
+"""
+    The queue of commands waiting for their turn on the connection.
+
+    A client has a single CommandQueue, or with priorities a LaneQueue of
+    one CommandQueue per priority.  Both take the lane a command was queued
+    in, which a CommandQueue ignores.
+"""
+
+import asyncio
+from collections import deque
+
+
+class CommandQueue(object):
+    """
+        A deque of queued commands, optionally bounded.
+
+        Once max_size commands are waiting the queue counts as full until it
+        drains to low_watermark.  A command arriving at a full queue is turned
+        away: with the 'fail' policy it is the new command, with 'shed' the
+        oldest waiting one is dropped to make room.  Producers can await
+        wait_for_room() instead of running into the limit.
+    """
+
+    POLICIES = ('fail', 'shed')
+
+    def __init__(self, max_size=None, low_watermark=None, policy='fail', loop=None):
+        if max_size is not None and max_size < 1:
+            raise TypeError('max_size must be at least 1')
+
+        if policy not in self.POLICIES:
+            raise TypeError('policy must be one of %s, not %r' % (', '.join(self.POLICIES), policy))
+
+        if low_watermark is None:
+            low_watermark = max_size // 2 if max_size is not None else None
+        elif max_size is None or not 0 <= low_watermark < max_size:
+            raise TypeError('low_watermark must be below max_size')
+
+        self._queue = deque()
+        self._max_size = max_size
+        self._low_watermark = low_watermark
+        self._policy = policy
+        self._loop = loop
+
+        self._full = False
+        #Futures of producers waiting for the queue to drain
+        self._waiters = []
+
+        self.max_depth = 0
+        self.enqueued = 0
+        self.rejected = 0
+        self.shed = 0
+
+    def __len__(self):
+        return len(self._queue)
+
+    def push(self, entry, lane=None):
+        '''
+            Queue entry, returning the entry turned away if the queue is full, else None.
+        '''
+        queue = self._queue
+
+        if self._max_size is not None and len(queue) >= self._max_size:
+            if self._policy == 'fail':
+                self.rejected += 1
+                return entry
+
+            self.shed += 1
+            dropped = queue.popleft()
+            queue.append(entry)
+            self.enqueued += 1
+            return dropped
+
+        queue.append(entry)
+        self.enqueued += 1
+
+        depth = len(queue)
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+        if self._max_size is not None and depth >= self._max_size:
+            self._full = True
+
+        return None
+
+    def push_front(self, entry):
+        '''
+            Queue entry ahead of every waiting command, even when the queue is full.
+        '''
+        self._queue.appendleft(entry)
+        self.enqueued += 1
+
+        if len(self._queue) > self.max_depth:
+            self.max_depth = len(self._queue)
+
+    def pop(self):
+        entry = self._queue.popleft()
+
+        if self._full and len(self._queue) <= self._low_watermark:
+            self._full = False
+            self._wake()
+
+        return entry
+
+    def full(self, lane=None):
+        return self._full
+
+    def clear(self):
+        '''
+            Drop every waiting command, for a child process that inherited them.
+            Their callbacks are not run, the commands are the parent's.
+        '''
+        self._queue.clear()
+        self._full = False
+        self._waiters = []
+
+    def wait_for_room(self, lane=None):
+        '''
+            Return a Future that resolves once the queue is below its high watermark,
+            or has drained to the low watermark after filling up.
+        '''
+        future = (self._loop or asyncio.get_event_loop()).create_future()
+
+        if self._full:
+            self._waiters.append(future)
+        else:
+            future.set_result(None)
+
+        return future
+
+    def _wake(self):
+        waiters, self._waiters = self._waiters, []
+        for future in waiters:
+            if not future.done():
+                future.set_result(None)
+
+    def stats(self):
+        return {
+            'depth': len(self._queue),
+            'max_depth': self.max_depth,
+            'high_watermark': self._max_size,
+            'low_watermark': self._low_watermark,
+            'full': self._full,
+            'enqueued': self.enqueued,
+            'rejected': self.rejected,
+            'shed': self.shed,
+        }
+
+
+class LaneQueue(object):
+    """
+        Commands queued in lanes, given as (name, weight) pairs highest
+        priority first.  Each lane is a CommandQueue bounded on its own, so a
+        bulk lane filling up doesn't turn away interactive commands.
+
+        pop() takes from the highest priority lane that has commands and
+        credit left.  Lanes start with their weight in credits and spend one
+        per command, and once every lane with commands has spent its credits
+        they are all refilled.  With weights of 8 and 1 a busy second lane
+        gets one command in for every 8 from the first, and all of them while
+        the first is empty.
+
+        Commands are only kept in order within a lane.  A transaction is the
+        exception: from MULTI until EXEC or DISCARD only its lane is popped,
+        so other lanes' commands can't end up inside it.
+    """
+
+    def __init__(self, lanes, max_size=None, low_watermark=None, policy='fail', loop=None):
+        lanes = list(lanes)
+        if not lanes:
+            raise TypeError('priorities must name at least one lane')
+
+        self.names = []
+        self._weights = []
+        self._queues = []
+        self._index = {}
+        for lane in lanes:
+            try:
+                (name, weight) = lane
+            except (TypeError, ValueError):
+                raise TypeError('priorities must be (name, weight) pairs, not %r' % (lane,))
+            if not isinstance(weight, int) or weight < 1:
+                raise TypeError('the weight of priority %r must be a positive integer' % name)
+            if name in self._index:
+                raise TypeError('priority %r is given twice' % name)
+
+            self._index[name] = len(self.names)
+            self.names.append(name)
+            self._weights.append(weight)
+            self._queues.append(CommandQueue(max_size, low_watermark, policy, loop))
+
+        #Commands without a lane go in the first
+        self.default = self.names[0]
+
+        self._credits = list(self._weights)
+        #Commands queued ahead of every lane, such as the SELECT sent on connect
+        self._front = deque()
+        #Index of the lane a transaction is being popped from
+        self._held = None
+        self._size = 0
+
+        self.max_depth = 0
+        self.refills = 0
+
+    def __len__(self):
+        return self._size
+
+    def _queue(self, lane):
+        return self._queues[self._index[self.default if lane is None else lane]]
+
+    def push(self, entry, lane=None):
+        '''
+            Queue entry in lane, returning the entry turned away if the lane is full, else None.
+        '''
+        turned_away = self._queue(lane).push(entry)
+
+        if turned_away is None:
+            self._size += 1
+            if self._size > self.max_depth:
+                self.max_depth = self._size
+
+        return turned_away
+
+    def push_front(self, entry):
+        '''
+            Queue entry ahead of every lane, even when they are full.
+        '''
+        self._front.append(entry)
+        self._size += 1
+
+    def pop(self):
+        '''
+            Return the next command to send, or None while a transaction waits for the rest of its commands.
+        '''
+        if self._front:
+            self._size -= 1
+            return self._front.popleft()
+
+        queues = self._queues
+        if self._held is not None:
+            index = self._held
+            if not len(queues[index]):
+                return None
+        else:
+            credits = self._credits
+            for index, queue in enumerate(queues):
+                if credits[index] and len(queue):
+                    break
+            else:
+                #Every lane with commands has spent its credits
+                self.refills += 1
+                self._credits = credits = list(self._weights)
+                for index, queue in enumerate(queues):
+                    if len(queue):
+                        break
+            credits[index] -= 1
+
+        entry = queues[index].pop()
+        self._size -= 1
+
+        if entry[0] == 'MULTI':
+            self._held = index
+        elif entry[0] == 'EXEC' or entry[0] == 'DISCARD':
+            self._held = None
+
+        return entry
+
+    def full(self, lane=None):
+        return self._queue(lane).full()
+
+    def clear(self):
+        '''
+            Drop every waiting command, see CommandQueue.clear.
+        '''
+        for queue in self._queues:
+            queue.clear()
+        self._front.clear()
+        self._credits = list(self._weights)
+        self._held = None
+        self._size = 0
+
+    def wait_for_room(self, lane=None):
+        '''
+            Return a Future that resolves once lane has room, see CommandQueue.wait_for_room.
+        '''
+        return self._queue(lane).wait_for_room()
+
+    def stats(self):
+        lanes = dict((name, queue.stats()) for name, queue in zip(self.names, self._queues))
+        for name, weight in zip(self.names, self._weights):
+            lanes[name]['weight'] = weight
+
+        first = self._queues[0]
+        return {
+            'depth': self._size,
+            'max_depth': self.max_depth,
+            'high_watermark': first._max_size,
+            'low_watermark': first._low_watermark,
+            'full': any(queue.full() for queue in self._queues),
+            'enqueued': sum(queue.enqueued for queue in self._queues),
+            'rejected': sum(queue.rejected for queue in self._queues),
+            'shed': sum(queue.shed for queue in self._queues),
+            'refills': self.refills,
+            'lanes': lanes,
+        }
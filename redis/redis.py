@@ -1,11 +1,34 @@
-#!/usr/bin/python2 
+#!/usr/bin/python3
 
-from tornado import iostream
-import socket
+import os
 import sys
+import time
+import asyncio
 import logging
-import trace
+import itertools
+from array import array
 from functools import partial
+from urllib.parse import urlsplit, parse_qs, unquote
+
+from . import trace
+from . import forksafe
+from .transport import IOStreamTransport
+from .responses import RESPONSE_CALLBACKS
+from .stream import ReplyStream
+from .scan import ScanIterator
+from .queue import CommandQueue, LaneQueue
+from .flow import WriteFlowControl
+from .profiler import ProfiledTransport
+from .capture import CapturingTransport
+from .serializer import Serializer, VALUE_REPLIES
+from .blocking import BlockingPool, block_seconds
+from .bulk import BulkLoader
+from .exceptions import RedisError
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 logging.basicConfig()
 
@@ -22,159 +45,307 @@ class enum(object):
 #Reply types
 ReplyType = enum('MULTI_BULK','BULK','STATUS','INTEGER','SUBSCRIBE')
 
-class Redis(object):
+#Ids of the connections made by every client, see the slow log
+_connection_ids = itertools.count(1)
+
+#Encoded '$len\r\nNAME\r\n' part of each command, built on first use
+_command_headers = {}
+
+def _command_size(cmdstr):
+    #Commands carrying large values are a list of buffers, see _pack_command
+    if type(cmdstr) is bytes:
+        return len(cmdstr)
+    return sum([len(buf) for buf in cmdstr])
+
+def parse_url(url):
+    '''
+        Return the constructor arguments for a redis://[host][:port][/db],
+        redis+unix:///path or unix:///path URL, with the database also given as ?db=N.
+    '''
+    parts = urlsplit(url)
+    query = parse_qs(parts.query)
+
+    if parts.username or parts.password:
+        raise TypeError('credentials in redis URLs are not supported, send AUTH after connecting')
+
+    options = {}
+    if parts.scheme in ('redis+unix', 'unix'):
+        if not parts.path:
+            raise TypeError('%s has no socket path' % url)
+        options['unix_socket_path'] = unquote(parts.path)
+        db = None
+    elif parts.scheme == 'redis':
+        options['host'] = parts.hostname or 'localhost'
+        options['port'] = parts.port or 6379
+        db = parts.path.lstrip('/') or None
+    else:
+        raise TypeError('unsupported redis URL scheme %r, expected redis, redis+unix or unix' % parts.scheme)
+
+    if 'db' in query:
+        db = query['db'][0]
+    if db is not None:
+        try:
+            options['db'] = int(db)
+        except ValueError:
+            raise TypeError('database in %s is not a number' % url)
 
+    return options
 
-    def __init__(self, host='localhost', port=6379, db=0):
+class Redis(object):
+
+    #Instances only hold connection and parser state, the command table and the command
+    #methods live on the class so a new client costs a handful of attribute assignments
+    __slots__ = ('_host', '_port', '_unix_socket_path', '_db', '_encoding', '_encoding_errors', '_decode_responses',
+                 '_zero_copy_threshold', '_serializer', '_decode_executor', '_decode_threshold', '_forks',
+                 '_close_callback', '_blocking', '_in_multi', '_multi_lane', '_default_lane',
+                 '_transport', '_flow', '_metrics', '_slowlog', '_profiler', '_timed', '_connections', '_connection_id',
+                 '_response_callbacks', '_subscriptions', '_subscribed', '_cmd_queue',
+                 '_cur_cmd', '_cur_cmd_args', '_cur_callback', '_cur_reply_handler', '_cur_reply_type',
+                 '_cur_columnar', '_cur_stream', '_cur_loads', '_cur_decode', '_cur_multi_bulk_reply_left', '_cur_multi_bulk_reply_data',
+                 '_cur_multi_bulk_stack', '_cur_column', '_cur_column_error', '_cur_stream_count',
+                 '_cur_queue_wait', '_cur_sent_at', '_cur_reply_bytes',
+                 '__weakref__')
+
+    #The reply type is what a command normally returns, the reply itself is read by its
+    #RESP type byte so variants such as SET ... GET or a nil multi bulk still parse
+    _cmd_map = {
+        #Connection commands
+        'SELECT': ReplyType.STATUS,
+        'ECHO': ReplyType.BULK,
+        'PING': ReplyType.STATUS,
+        'QUIT': ReplyType.STATUS,
+        'AUTH': ReplyType.STATUS,
+        'TIME': ReplyType.MULTI_BULK,
+
+        #Server commands
+        'BGREWRITEAOF': ReplyType.STATUS,
+        'DBSIZE': ReplyType.INTEGER,
+        'INFO': ReplyType.BULK,
+        'SLAVEOF': ReplyType.STATUS,
+        'BGSAVE': ReplyType.STATUS,
+        'SAVE': ReplyType.STATUS,
+        'LASTSAVE': ReplyType.INTEGER,
+        'CONFIG GET': ReplyType.BULK,
+        'CONFIG SET': ReplyType.BULK,
+        'CONFIG RESETSTAT': ReplyType.STATUS,
+        'FLUSHALL': ReplyType.STATUS,
+        'FLUSHDB': ReplyType.STATUS,
+        'SHUTDOWN': ReplyType.STATUS,
+
+        #Sorted set commands
+        'ZADD': ReplyType.INTEGER,
+        'ZINTERSTORE': ReplyType.INTEGER,
+        'ZUNIONSTORE': ReplyType.INTEGER,
+        'ZREM': ReplyType.INTEGER,
+        'ZREVRANGEBYSCORE': ReplyType.MULTI_BULK,
+        'ZCARD': ReplyType.INTEGER,
+        'ZRANGE': ReplyType.MULTI_BULK,
+        'ZREVRANGE': ReplyType.MULTI_BULK,
+        'ZREMRANGEBYRANK': ReplyType.INTEGER,
+        'ZCOUNT': ReplyType.INTEGER,
+        'ZRANGEBYSCORE': ReplyType.MULTI_BULK,
+        'ZREMRANGEBYSCORE': ReplyType.INTEGER,
+        'ZSCORE': ReplyType.BULK,
+        'ZINCRBY': ReplyType.BULK,
+        'ZREVRANK': ReplyType.INTEGER,
+        'ZRANK': ReplyType.INTEGER,
+        'ZSCAN': ReplyType.MULTI_BULK,
+        'ZMSCORE': ReplyType.MULTI_BULK,
+        'ZPOPMIN': ReplyType.MULTI_BULK,
+        'ZPOPMAX': ReplyType.MULTI_BULK,
+
+
+        #Set commands
+        'SADD': ReplyType.INTEGER,
+        'SMOVE': ReplyType.INTEGER,
+        'SCARD': ReplyType.INTEGER,
+        'SREM': ReplyType.INTEGER,
+        'SINTERSTORE': ReplyType.INTEGER,
+        'SUNIONSTORE': ReplyType.INTEGER,
+        'SDIFFSTORE': ReplyType.INTEGER,
+        'SISMEMBER': ReplyType.INTEGER,
+        'SPOP': ReplyType.BULK,
+        'SRANDMEMBER': ReplyType.BULK,
+        'SINTER': ReplyType.MULTI_BULK,
+        'SUNION': ReplyType.MULTI_BULK,
+        'SDIFF': ReplyType.MULTI_BULK,
+        'SMEMBERS': ReplyType.MULTI_BULK,
+        'SSCAN': ReplyType.MULTI_BULK,
+        'SMISMEMBER': ReplyType.MULTI_BULK,
+
+        #List commands
+        'BLPOP': ReplyType.MULTI_BULK,
+        'BRPOP': ReplyType.MULTI_BULK,
+        'LRANGE': ReplyType.MULTI_BULK,
+        'LLEN': ReplyType.INTEGER,
+        'LREM': ReplyType.INTEGER,
+        'RPUSH': ReplyType.INTEGER,
+        'RPUSHX': ReplyType.INTEGER,
+        'LPUSH': ReplyType.INTEGER,
+        'LPUSHX': ReplyType.INTEGER,
+        'LSET': ReplyType.STATUS,
+        'LTRIM': ReplyType.STATUS,
+        'RPOP': ReplyType.BULK,
+        'LPOP': ReplyType.BULK,
+        'LINDEX': ReplyType.BULK,
+        'LINSERT': ReplyType.INTEGER,
+        'BRPOPLPUSH': ReplyType.BULK,
+        'RPOPLPUSH': ReplyType.BULK,
+        'LMOVE': ReplyType.BULK,
+        'BLMOVE': ReplyType.BULK,
+        'LPOS': ReplyType.INTEGER,
+        'LMPOP': ReplyType.MULTI_BULK,
+        'BLMPOP': ReplyType.MULTI_BULK,
+
+        #Hash commands
+        'HDEL': ReplyType.INTEGER,
+        'HLEN': ReplyType.INTEGER,
+        'HSET': ReplyType.INTEGER,
+        'HGET': ReplyType.BULK,
+        'HMGET': ReplyType.MULTI_BULK,
+        'HKEYS': ReplyType.MULTI_BULK,
+        'HVALS': ReplyType.MULTI_BULK,
+        'HMSET': ReplyType.STATUS,
+        'HSETNX': ReplyType.INTEGER,
+        'HEXISTS': ReplyType.INTEGER,
+        'HINCRBY': ReplyType.INTEGER,
+        'HINCRBYFLOAT': ReplyType.BULK,
+        'HSTRLEN': ReplyType.INTEGER,
+        'HGETALL': ReplyType.MULTI_BULK,
+        'HSCAN': ReplyType.MULTI_BULK,
+
+        #String commands
+        'SET': ReplyType.STATUS,
+        'SETNX': ReplyType.INTEGER,
+        'SETEX': ReplyType.INTEGER,
+        'MSET': ReplyType.STATUS,
+        'MSETNX': ReplyType.INTEGER,
+        'APPEND': ReplyType.INTEGER,
+        'GETRANGE': ReplyType.BULK,
+        'SETRANGE': ReplyType.INTEGER,
+        'PSETEX': ReplyType.STATUS,
+        'DECR': ReplyType.INTEGER,
+        'DECRBY': ReplyType.INTEGER,
+        'INCR': ReplyType.INTEGER,
+        'INCRBY': ReplyType.INTEGER,
+        'INCRBYFLOAT': ReplyType.BULK,
+        'GET': ReplyType.BULK,
+        'GETSET': ReplyType.BULK,
+        'GETEX': ReplyType.BULK,
+        'GETDEL': ReplyType.BULK,
+        'STRLEN': ReplyType.INTEGER,
+        'MGET': ReplyType.MULTI_BULK,
+
+        #Bit commands
+        'SETBIT': ReplyType.INTEGER,
+        'GETBIT': ReplyType.INTEGER,
+        'BITCOUNT': ReplyType.INTEGER,
+        'BITPOS': ReplyType.INTEGER,
+        'BITOP': ReplyType.INTEGER,
+        'BITFIELD': ReplyType.MULTI_BULK,
+
+        #HyperLogLog commands
+        'PFADD': ReplyType.INTEGER,
+        'PFCOUNT': ReplyType.INTEGER,
+        'PFMERGE': ReplyType.STATUS,
+
+        #Key commands
+        'DEL': ReplyType.INTEGER,
+        'KEYS': ReplyType.MULTI_BULK,
+        'RENAME': ReplyType.STATUS,
+        'TYPE': ReplyType.STATUS,
+        'EXISTS': ReplyType.INTEGER,
+        'MOVE': ReplyType.INTEGER,
+        'RENAMENX': ReplyType.INTEGER,
+        'EXPIRE': ReplyType.INTEGER,
+        'PEXPIRE': ReplyType.INTEGER,
+        'PERSIST': ReplyType.INTEGER,
+        'PTTL': ReplyType.INTEGER,
+        'UNLINK': ReplyType.INTEGER,
+        'SORT': ReplyType.MULTI_BULK,
+        'EXPIREAT': ReplyType.INTEGER,
+        'RANDOMKEY': ReplyType.BULK,
+        'TTL': ReplyType.INTEGER,
+        'SCAN': ReplyType.MULTI_BULK,
+
+        #PubSub commands, the subscribe family has methods of its own
+        'PUBLISH': ReplyType.INTEGER,
+        'SUBSCRIBE': ReplyType.SUBSCRIBE,
+        'PSUBSCRIBE': ReplyType.SUBSCRIBE,
+        'UNSUBSCRIBE': ReplyType.SUBSCRIBE,
+        'PUNSUBSCRIBE': ReplyType.SUBSCRIBE,
+    }
+
+    def __init__(self, host='localhost', port=6379, db=0, transport=None, unix_socket_path=None,
+                 encoding='utf-8', encoding_errors='strict', decode_responses=False,
+                 queue_size=None, queue_low_watermark=None, queue_policy='fail',
+                 write_buffer_limit=None, write_buffer_low_watermark=None, metrics=None, slowlog=None,
+                 profiler=None, capture=None, socket_options=None, zero_copy_threshold=64 * 1024,
+                 serializer=None, decode_executor=None, decode_threshold=64 * 1024,
+                 blocking_connections=4, blocking_timeout_margin=5.0, priorities=None):
 
         self._host = host
         self._port = port
+        #Connect to this Unix socket instead of host:port
+        self._unix_socket_path = unix_socket_path
+        #Selected again on every connect, a new connection starts on database 0
         self._db = db
 
-        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM, 0)
-
-        self.STATUS_REPLY = (ReplyType.STATUS, self._handle_status_reply)
-        self.INTEGER_REPLY = (ReplyType.INTEGER, self._handle_integer_reply)
-        self.BULK_REPLY = (ReplyType.BULK, self._handle_bulk_reply)
-        self.MULTI_BULK_REPLY = (ReplyType.MULTI_BULK, self._handle_multi_bulk_reply)
-        self.SUBSCRIBE_REPLY = (ReplyType.SUBSCRIBE, self._handle_multi_bulk_reply)
-
-        self._cmd_map = {
-            #Connection commands
-            'SELECT': self.STATUS_REPLY,
-            'ECHO': self.BULK_REPLY,
-            'PING': self.STATUS_REPLY,
-            'QUIT': self.STATUS_REPLY,
-            'AUTH': self.STATUS_REPLY,
-
-            #Server commands
-            'BGREWRITEAOF': self.STATUS_REPLY,
-            'DBSIZE': self.INTEGER_REPLY,
-            'INFO': self.BULK_REPLY,
-            'SLAVEOF': self.STATUS_REPLY,
-            'BGSAVE': self.STATUS_REPLY,
-            'SAVE': self.STATUS_REPLY,
-            'LASTSAVE': self.INTEGER_REPLY,
-            'CONFIG GET': self.BULK_REPLY,
-            'CONFIG SET': self.BULK_REPLY,
-            'CONFIG RESETSTAT': self.STATUS_REPLY,
-            'FLUSHALL': self.STATUS_REPLY,
-            'FLUSHDB': self.STATUS_REPLY,
-            'SHUTDOWN': self.STATUS_REPLY,
-
-            #Sorted set commands
-            'ZADD': self.INTEGER_REPLY,
-            'ZINTERSTORE': self.INTEGER_REPLY,
-            'ZUNIONSTORE': self.INTEGER_REPLY,
-            'ZREM': self.INTEGER_REPLY,
-            #'ZREVRANGEBYSCORE': self.MULTI_BULK_REPLY, #Redis > 2.1
-            'ZCARD': self.INTEGER_REPLY,
-            'ZRANGE': self.MULTI_BULK_REPLY,
-            'ZREVRANGE': self.MULTI_BULK_REPLY,
-            'ZREMRANGEBYRANK': self.INTEGER_REPLY,
-            'ZCOUNT': self.INTEGER_REPLY,
-            'ZRANGEBYSCORE': self.MULTI_BULK_REPLY,
-            'ZREMRANGEBYSCORE': self.INTEGER_REPLY,
-            'ZSCORE': self.BULK_REPLY,
-            'ZINCRBY': self.BULK_REPLY,
-            'ZREVRANK': self.INTEGER_REPLY,
-            'ZRANK': self.INTEGER_REPLY,
-
-
-            #Set commands
-            'SADD': self.INTEGER_REPLY,
-            'SMOVE': self.INTEGER_REPLY,
-            'SCARD': self.INTEGER_REPLY,
-            'SREM': self.INTEGER_REPLY,
-            'SINTERSTORE': self.INTEGER_REPLY,
-            'SUNIONSTORE': self.INTEGER_REPLY,
-            'SDIFFSTORE': self.INTEGER_REPLY,
-            'SISMEMBER': self.INTEGER_REPLY,
-            'SPOP': self.BULK_REPLY,
-            'SRANDMEMBER': self.BULK_REPLY,
-            'SINTER': self.MULTI_BULK_REPLY,
-            'SUNION': self.MULTI_BULK_REPLY,
-            'SDIFF': self.MULTI_BULK_REPLY,
-            'SMEMBERS': self.MULTI_BULK_REPLY,
-
-            #List commands
-            'BLPOP': self.MULTI_BULK_REPLY,
-            'BRPOP': self.MULTI_BULK_REPLY,
-            'LRANGE': self.MULTI_BULK_REPLY,
-            'LLEN': self.INTEGER_REPLY,
-            'LREM': self.INTEGER_REPLY,
-            'RPUSH': self.INTEGER_REPLY,
-            #'RPUSHX': self.INTEGER_REPLY, #Redis > 2.1
-            'LPUSH': self.INTEGER_REPLY,
-            #'LPUSHX': self.INTEGER_REPLY, #Redis > 2.1
-            'LSET': self.STATUS_REPLY,
-            'LTRIM': self.STATUS_REPLY,
-            'RPOP': self.BULK_REPLY,
-            'LPOP': self.BULK_REPLY,
-            'LINDEX': self.BULK_REPLY,
-            #'LINSERT': self.INTEGER_REPLY, #Redis > 2.1
-            #'BRPOPLPUSH': self.BULK_REPLY, #Redis > 2.1
-            'RPOPLPUSH': self.BULK_REPLY,
-
-            #Hash commands
-            'HDEL': self.INTEGER_REPLY,
-            'HLEN': self.INTEGER_REPLY,
-            'HSET': self.INTEGER_REPLY,
-            'HGET': self.BULK_REPLY,
-            'HMGET': self.MULTI_BULK_REPLY,
-            'HKEYS': self.MULTI_BULK_REPLY,
-            'HVALS': self.MULTI_BULK_REPLY,
-            'HMSET': self.STATUS_REPLY,
-            'HSETNX': self.INTEGER_REPLY,
-            'HEXISTS': self.INTEGER_REPLY,
-            'HINCRBY': self.INTEGER_REPLY,
-            'HGETALL': self.MULTI_BULK_REPLY,
-
-            #String commands
-            'SET': self.STATUS_REPLY,
-            'SETNX': self.INTEGER_REPLY,
-            'SETEX': self.INTEGER_REPLY,
-            'MSET': self.STATUS_REPLY,
-            'MSETNX': self.INTEGER_REPLY,
-            'APPEND': self.INTEGER_REPLY,
-            #'GETRANGE': self.BULK_REPLY, #Redis > 2.1
-            #'SETRANGE': self.INTEGER_REPLY, #Redis > 2.1
-            'DECR': self.INTEGER_REPLY,
-            'DECRBY': self.INTEGER_REPLY,
-            'INCR': self.INTEGER_REPLY,
-            'INCRBY': self.INTEGER_REPLY,
-            'GET': self.BULK_REPLY,
-            'GETSET': self.BULK_REPLY,
-            #'STRLEN': self.INTEGER_REPLY, #Redis > 2.1
-            'MGET': self.MULTI_BULK_REPLY,
-            #'SETBIT': self.INTEGER_REPLY, #Redis > 2.1
-            #'GETBIT': self.INTEGER_REPLY, #Redis > 2.1
-
-            #Key commands
-            'DEL': self.INTEGER_REPLY,
-            'KEYS': self.MULTI_BULK_REPLY,
-            'RENAME': self.STATUS_REPLY,
-            'TYPE': self.STATUS_REPLY,
-            'EXISTS': self.INTEGER_REPLY,
-            'MOVE': self.INTEGER_REPLY,
-            'RENAMENX': self.INTEGER_REPLY,
-            'EXPIRE': self.INTEGER_REPLY,
-            #'PERSIST': self.INTEGER_REPLY, #Redis > 2.1
-            'SORT': self.MULTI_BULK_REPLY,
-            'EXPIREAT': self.INTEGER_REPLY,
-            'RANDOMKEY': self.BULK_REPLY,
-            'TTL': self.INTEGER_REPLY,
-
-            #PubSub commands
-            'PUBLISH': self.INTEGER_REPLY,
-        }
-        self._build_cmds()
-
-        #Add these after we build the functions because these are handled differently
-        self._cmd_map['SUBSCRIBE'] = self.SUBSCRIBE_REPLY
-        self._cmd_map['PSUBSCRIBE'] = self.SUBSCRIBE_REPLY
-        self._cmd_map['UNSUBSCRIBE'] = self.SUBSCRIBE_REPLY
-        self._cmd_map['PUNSUBSCRIBE'] = self.SUBSCRIBE_REPLY
+        #Arguments are always encoded with this encoding, replies are only decoded when asked to
+        self._encoding = encoding
+        self._encoding_errors = encoding_errors
+        self._decode_responses = decode_responses
+
+        #bytes, bytearray and memoryview arguments of at least this many bytes are handed to the
+        #transport as they are instead of being copied into the command, None copies everything
+        if zero_copy_threshold is not None and (not isinstance(zero_copy_threshold, int) or zero_copy_threshold < 1):
+            raise TypeError('zero_copy_threshold must be a positive integer or None')
+        self._zero_copy_threshold = zero_copy_threshold
+
+        #A serializer.Serializer, which encodes the values of string, hash and list commands
+        if serializer is not None and not isinstance(serializer, Serializer):
+            raise TypeError('serializer must be a serializer.Serializer')
+        self._serializer = serializer
+
+        #A concurrent.futures executor the serializer decodes replies of decode_threshold bytes or
+        #more on, so large values don't hold up the IOLoop.  Smaller ones are decoded inline.
+        if decode_executor is not None and serializer is None:
+            raise TypeError('decode_executor needs a serializer to decode with')
+        if not isinstance(decode_threshold, int) or decode_threshold < 0:
+            raise TypeError('decode_threshold must be a non negative integer')
+        self._decode_executor = decode_executor
+        self._decode_threshold = decode_threshold
+
+        #Defaults to an IOStream on the Tornado IOLoop, see transport.py for alternatives
+        if transport is not None and socket_options is not None:
+            raise TypeError('pass socket_options to the transport when handing one in')
+        self._transport = transport or IOStreamTransport(socket_options)
+
+        #A metrics.ClientMetrics, which may be shared with other clients
+        self._metrics = metrics
+        #A slowlog.SlowLog, which may also be shared
+        self._slowlog = slowlog
+        #Commands are only timed when something wants the times
+        self._timed = metrics is not None or slowlog is not None
+
+        #A capture.Capture, everything written and read is recorded to it
+        if capture is not None:
+            self._transport = CapturingTransport(self._transport, capture)
+
+        #A profiler.LoopProfiler, reads go through a wrapper that times them
+        self._profiler = profiler
+        if profiler is not None:
+            self._transport = ProfiledTransport(self._transport, profiler)
+
+        self._connections = 0
+        self._connection_id = None
+        self._close_callback = None
+
+        #Fork count of the process this client was made in, see _after_fork
+        self._forks = forksafe.forks
+
+        #Shared until set_response_callback changes this client's converters
+        self._response_callbacks = RESPONSE_CALLBACKS
 
         #A map of subscriptions to callbacks
         self._subscriptions = {}
@@ -182,27 +353,177 @@ class Redis(object):
 
         self._clear_state()
 
-        self._cmd_queue = []
+        #Commands waiting to be sent, unbounded unless queue_size is given.  With priorities, a list
+        #of (name, weight) pairs highest first, each priority is a lane of its own bounded by queue_size.
+        if priorities is not None:
+            self._cmd_queue = LaneQueue(priorities, queue_size, queue_low_watermark, queue_policy)
+            self._default_lane = self._cmd_queue.default
+        else:
+            self._cmd_queue = CommandQueue(queue_size, queue_low_watermark, queue_policy)
+            self._default_lane = None
+
+        #Bytes of commands queued or not yet written out, see writable()
+        self._flow = WriteFlowControl(write_buffer_limit, write_buffer_low_watermark)
+
+        #Blocking commands such as BLPOP run on up to blocking_connections connections of their
+        #own, None for no limit, rather than holding up this one.  0 runs them here.
+        if blocking_connections is not None and (not isinstance(blocking_connections, int) or blocking_connections < 0):
+            raise TypeError('blocking_connections must be a non negative integer or None')
+        if blocking_timeout_margin is not None and blocking_timeout_margin < 0:
+            raise TypeError('blocking_timeout_margin must not be negative')
+        self._blocking = None
+        if blocking_connections != 0:
+            self._blocking = BlockingPool(self._blocking_client, blocking_connections, blocking_timeout_margin)
+        #Set from MULTI until EXEC or DISCARD are queued, the commands between them stay on this
+        #connection and in the lane of the MULTI
+        self._in_multi = False
+        self._multi_lane = None
 
 
     @tracer
     def connect(self, close_callback=None):
-        try:
-            self._socket.connect((self._host, self._port))
-        except socket.error, e:
-            raise e
+        if self._forks != forksafe.forks:
+            self._after_fork()
+
+        if self._metrics is not None:
+            self._metrics.connected(self._connections > 0)
 
-        self._stream = iostream.IOStream(self._socket)
+        self._connections += 1
+        self._connection_id = next(_connection_ids)
+        self._close_callback = close_callback
+
+        close_callback = partial(self._on_close, self._connection_id, close_callback)
+        if self._unix_socket_path is not None:
+            result = self._transport.connect_unix(self._unix_socket_path, close_callback)
+        else:
+            result = self._transport.connect(self._host, self._port, close_callback)
+
+        if self._db:
+            cmdstr = self._pack_command('SELECT', [self._db])
+            self._flow.add(_command_size(cmdstr))
+            self._cmd_queue.push_front(('SELECT', [self._db], self._on_select, cmdstr, (None, None, None, None, None),
+                                        time.monotonic() if self._timed else None))
+            if self._metrics is not None:
+                self._metrics.command_queued()
+
+        #Commands that queued up behind one lost with the previous connection go out on this one
+        if self._cur_cmd is None and len(self._cmd_queue):
+            self._send_next()
+
+        return result
+
+    def _after_fork(self, reconnect=True):
+        '''
+            Drop the connection, commands and subscriptions inherited from the parent process,
+            and connect again if the parent was connected.
+        '''
+        logger.debug('process %d forked, reopening the connection' % os.getpid())
+        self._forks = forksafe.forks
+        connected = self._connection_id is not None
+
+        self._transport.abandon()
+        self._connection_id = None
+        self._clear_state()
+        self._cmd_queue.clear()
+        self._flow.clear()
+        self._subscriptions = {}
+        self._subscribed = False
+        self._in_multi = False
+
+        if connected and reconnect:
+            self.connect(self._close_callback)
+
+    def _on_select(self, error, value):
+        if error is not None:
+            logger.error('unable to select database %s: %s' % (self._db, error))
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        '''
+            Return a client for a redis://host:port/db, redis+unix:///path?db=N or unix:///path URL.
+            Keyword arguments are passed on to the constructor.
+        '''
+        options = parse_url(url)
+        options.update(kwargs)
+        return cls(**options)
+
+    def _on_close(self, connection_id, close_callback):
+        if self._metrics is not None:
+            self._metrics.disconnected()
+
+        #Only a connection lost under us fails its command, not one closed by disconnect() or replaced by connect().
+        #A reply being decoded off the loop has arrived in full and is still delivered.
+        if (connection_id == self._connection_id and self._cur_cmd is not None and not self._subscribed and
+                self._cur_decode is None):
+            (cmd, callback) = (self._cur_cmd, self._cur_callback)
+            if self._metrics is not None and self._cur_sent_at is not None:
+                self._metrics.command_done(cmd, time.monotonic() - self._cur_sent_at, self._cur_reply_bytes, True)
+
+            self._clear_state()
+            if callback:
+                callback('ERR connection closed before the reply to %s arrived' % cmd, None)
 
         if close_callback:
-            self._stream.set_close_callback(close_callback)
+            close_callback()
+
+    @property
+    def metrics(self):
+        return self._metrics
+
+    @property
+    def slowlog(self):
+        return self._slowlog
+
+    @property
+    def db(self):
+        '''
+            The database selected on connect, kept up to date by SELECT.
+        '''
+        return self._db
+
+    def closed(self):
+        '''
+            Return True if the client is not connected, or its connection was lost.
+        '''
+        return self._connection_id is None or self._transport.closed()
+
+    @property
+    def connection_id(self):
+        '''
+            Id of the current connection, a new one is taken on every connect() and
+            disconnect() clears it.
+        '''
+        return self._connection_id
 
     @tracer
     def disconnect(self):
-        self._stream.close()
+        if self._forks != forksafe.forks:
+            #The inherited connection is the parent's to close
+            self._after_fork(reconnect=False)
+            return
+
+        self._connection_id = None
+        self._in_multi = False
+        self._transport.close()
+        if self._blocking is not None:
+            self._blocking.close()
+
+    def set_response_callback(self, cmd, callback):
+        '''
+            Convert replies to cmd with callback(value, args) before they reach the caller.
+            Passing None returns the raw reply.
+        '''
+        if self._response_callbacks is RESPONSE_CALLBACKS:
+            self._response_callbacks = dict(RESPONSE_CALLBACKS)
+
+        if callback is None:
+            self._response_callbacks.pop(cmd.upper(), None)
+        else:
+            self._response_callbacks[cmd.upper()] = callback
 
     @tracer
     def _notify_subscribers(self, channel, msg):
+        channel = self._encode(channel)
         if channel in self._subscriptions:
             callbacks = self._subscriptions.get(channel, [])
             for callback in callbacks:
@@ -214,6 +535,9 @@ class Redis(object):
             msg_type = msg[0]
             channel = msg[1]
 
+            if isinstance(msg_type, bytes):
+                msg_type = msg_type.decode('ascii')
+
             logger.debug('msg_type: %s'%msg_type)
             logger.debug('msg:%s'%msg)
 
@@ -235,50 +559,66 @@ class Redis(object):
                 self._notify_subscribers(channel, msg)
 
                 #Delete this after so we can notify subscribers of the unsubscription
-                del self._subscriptions[channel]
+                del self._subscriptions[self._encode(channel)]
 
             elif msg_type == 'message' or msg_type == 'pmessage':
                 self._notify_subscribers(channel, msg)
 
     @tracer
     def subscribe(self, channel, onmessage):
-        if channel in self._subscriptions: 
+        #Subscriptions are keyed by the encoded channel so they match raw and decoded replies
+        key = self._encode(channel)
+        if key in self._subscriptions: 
             #Just a new callback becuase we're already subscribed to the channel
-            self._subscriptions[channel].append(onmessage)
+            self._subscriptions[key].append(onmessage)
         else:
-            self._subscriptions[channel] = [onmessage]
+            self._subscriptions[key] = [onmessage]
             self._queue_command('SUBSCRIBE',channel, self._subscribe_callback) 
 
     @tracer
     def psubscribe(self, channel, onmessage):
-        if channel in self._subscriptions: 
+        key = self._encode(channel)
+        if key in self._subscriptions: 
             #Just a new callback becuase we're already subscribed to the channel
-            self._subscriptions[channel].append(onmessage)
+            self._subscriptions[key].append(onmessage)
         else:
-            self._subscriptions[channel] = [onmessage]
+            self._subscriptions[key] = [onmessage]
             self._queue_command('PSUBSCRIBE',channel, self._subscribe_callback) 
 
     @tracer
     def unsubscribe(self, channel):
-        if channel in self._subscriptions: 
+        if self._encode(channel) in self._subscriptions: 
             self._queue_command('UNSUBSCRIBE',channel, self._subscribe_callback) 
 
     @tracer
     def punsubscribe(self, channel):
-        if channel in self._subscriptions: 
+        if self._encode(channel) in self._subscriptions: 
             self._queue_command('PUNSUBSCRIBE',channel, self._subscribe_callback) 
 
     @tracer
-    def _queue_command(self, cmd, *args):
+    def _queue_command(self, cmd, *args, **options):
+        if self._forks != forksafe.forks:
+            self._after_fork()
+
         arglist = list(args)
         callback = None
 
-        if hasattr(arglist[-1], '__call__'):
+        if arglist and callable(arglist[-1]):
             logger.debug('last argument is a function, using as callback')
             callback = arglist.pop()
 
+        #Encode now so bad arguments raise to the caller rather than inside the read path
+        if self._profiler is not None:
+            start = time.perf_counter()
+            cmdstr = self._pack_command(cmd, arglist)
+            self._profiler.encoded(time.perf_counter() - start)
+        else:
+            cmdstr = self._pack_command(cmd, arglist)
+        reply_options = self._reply_options(cmd, arglist, **options)
+        queued_at = time.monotonic() if self._timed else None
+
         if cmd == 'SUBSCRIBE' or cmd == 'UNSUBSCRIBE' or cmd == 'PSUBSCRIBE' or cmd == 'PUNSUBSCRIBE':
-            self._cmd_queue.append((cmd, arglist, callback))
+            self._push_command((cmd, arglist, callback, cmdstr, reply_options, queued_at))
 
             #Only send this if we are the only comamnd queued up, otherwise wait our turn
             if len(self._cmd_queue) == 1:
@@ -287,149 +627,681 @@ class Redis(object):
         elif not self._subscribed:
             logger.debug('appending %s to cmd_queue'%cmd)
 
-            self._cmd_queue.append((cmd, arglist, callback))
+            self._push_command((cmd, arglist, callback, cmdstr, reply_options, queued_at))
             if not self._cur_cmd:
                 self._send_next()
 
         else:
             self._execute_callback('ERR In publish subscribe mode', None)
 
+    def _push_command(self, entry):
+        lane = entry[4][4]
+        self._flow.add(_command_size(entry[3]))
+        turned_away = self._cmd_queue.push(entry, lane)
+
+        if self._metrics is not None:
+            self._metrics.command_queued(lane)
+
+        if turned_away is not None:
+            (cmd, callback, cmdstr) = (turned_away[0], turned_away[2], turned_away[3])
+            self._flow.done(_command_size(cmdstr))
+
+            if self._metrics is not None:
+                self._metrics.command_dropped(cmd, turned_away[4][4])
+            logger.warning('command queue is full, dropping %s'%cmd)
+
+            if callback:
+                callback('ERR command queue is full, %s was not sent' % cmd, None)
+
+    def wait_for_room(self, priority=None):
+        '''
+            Return a Future that resolves when the command queue, or the lane of priority, has room again.
+        '''
+        return self._cmd_queue.wait_for_room(self._lane(priority))
+
+    def writable(self):
+        '''
+            False while the bytes of queued and unwritten commands are above write_buffer_limit.
+        '''
+        return not self._flow.paused()
+
+    def wait_writable(self):
+        '''
+            Return a Future that resolves once writable() is True, for producers that throttle themselves.
+        '''
+        return self._flow.wait_writable()
+
+    def write_buffer_stats(self):
+        '''
+            Outstanding bytes and pause counters, see WriteFlowControl.stats.
+        '''
+        return self._flow.stats()
+
+    def queue_stats(self):
+        '''
+            Depth and counters of the command queue, see CommandQueue.stats.
+        '''
+        return self._cmd_queue.stats()
+
+    def blocking_stats(self):
+        '''
+            Connections and counters of the blocking connection pool, see BlockingPool.stats.
+        '''
+        return self._blocking.stats() if self._blocking is not None else None
+
+    def bulk_load(self, commands, callback=None, chunk_size=1000, window=10000, max_errors=None, progress=None):
+        '''
+            Send every command in commands, an iterable of (name, arg, ...) sequences, over a
+            connection of its own as redis-cli --pipe does, see BulkLoader.  Arguments are encoded,
+            and values serialized, as this client's are.  callback(error, stats) runs once every
+            command has been answered.  Returns the BulkLoader, whose stats() report progress.
+        '''
+        transport = self._transport.copy()
+        if self._unix_socket_path is not None:
+            connect = partial(transport.connect_unix, self._unix_socket_path)
+        else:
+            connect = partial(transport.connect, self._host, self._port)
+
+        loader = BulkLoader(transport, connect, self._pack_command, self._db, chunk_size, window, max_errors,
+                            progress=progress)
+        loader.load(commands, callback)
+        return loader
+
+    def _blocking_client(self):
+        #A client for the BlockingPool, connected like this one but never blocking itself
+        return Redis(self._host, self._port, self._db, transport=self._transport.copy(),
+                     unix_socket_path=self._unix_socket_path, encoding=self._encoding,
+                     encoding_errors=self._encoding_errors, decode_responses=self._decode_responses,
+                     metrics=self._metrics, slowlog=self._slowlog, profiler=self._profiler,
+                     zero_copy_threshold=self._zero_copy_threshold, serializer=self._serializer,
+                     decode_executor=self._decode_executor, decode_threshold=self._decode_threshold,
+                     blocking_connections=0)
+
+    def _run_entry(self, entry, db, response_callbacks):
+        '''
+            Run a queue entry handed over by the client whose BlockingPool this client is in.
+        '''
+        if self._forks != forksafe.forks:
+            self._after_fork()
+
+        self._response_callbacks = response_callbacks
+        if db != self._db:
+            self._queue_command('SELECT', db)
+
+        self._push_command(entry)
+        if not self._cur_cmd:
+            self._send_next()
+
     @tracer
     def _send_next(self):
-        if len(self._cmd_queue) == 0:
-            logger.debug('cmd queue is empty')
-        else:
-            (self._cur_cmd, self._cur_cmd_args, self._cur_callback) = self._cmd_queue.pop(0)
+        while len(self._cmd_queue):
+            entry = self._cmd_queue.pop()
+            if entry is None:
+                logger.debug('waiting for the rest of the transaction')
+                return
+
+            block = entry[4][3]
+            if block is not None:
+                #Everything queued before it has been answered, it waits on a connection of its own
+                self._flow.done(_command_size(entry[3]))
+                if self._metrics is not None:
+                    self._metrics.command_moved(entry[4][4])
+                self._blocking.execute(entry, self._db, self._response_callbacks, block)
+                continue
+
+            (self._cur_cmd, self._cur_cmd_args, self._cur_callback, cmdstr, reply_options, queued_at) = entry
+            (self._cur_columnar, self._cur_stream, self._cur_loads, block, lane) = reply_options
+            self._cur_reply_bytes = 0
+
+            if queued_at is not None:
+                self._cur_sent_at = time.monotonic()
+                self._cur_queue_wait = self._cur_sent_at - queued_at
+
+                if self._metrics is not None:
+                    self._metrics.command_sent(self._cur_cmd, self._cur_queue_wait, _command_size(cmdstr), lane)
 
             logger.debug('popped next command: %s'%self._cur_cmd)
-            self._send_command()
+            self._send_command(cmdstr)
+            return
+
+        logger.debug('cmd queue is empty')
+
+    def _reply_options(self, cmd, args, columnar=None, use_numpy=False, stream=None, chunk_size=1000, priority=None):
+        if stream is not None and columnar:
+            raise TypeError('stream and columnar can not be combined')
+
+        options = (self._columnar_options(cmd, args, columnar, use_numpy),
+                   self._stream_options(cmd, stream, chunk_size),
+                   self._value_reply(cmd, columnar or stream is not None))
+        lane = self._lane(priority)
+
+        #Only once the options are known to be valid, as a command raising here is never queued
+        block = None
+        if self._in_multi:
+            #A transaction goes out whole, in the lane it was opened in
+            lane = self._multi_lane
+            if cmd == 'EXEC' or cmd == 'DISCARD':
+                self._in_multi = False
+        elif cmd == 'MULTI':
+            self._in_multi = True
+            self._multi_lane = lane
+        elif self._blocking is not None:
+            block = block_seconds(cmd, args)
+
+        return options + (block, lane)
+
+    def _lane(self, priority):
+        '''
+            Return the lane of the command queue for priority, None if the client has no priorities.
+        '''
+        if priority is None:
+            return self._default_lane
+
+        if self._default_lane is None:
+            raise TypeError('priority needs a client created with priorities')
+        if priority not in self._cmd_queue.names:
+            raise TypeError('unknown priority %r, expected one of %s' % (priority, ', '.join(map(str, self._cmd_queue.names))))
+        return priority
+
+    def _value_reply(self, cmd, raw):
+        '''
+            Return the kind of values in replies to cmd the serializer decodes, None if there are none.
+        '''
+        if self._serializer is None:
+            return None
+
+        kind = VALUE_REPLIES.get(cmd)
+        if kind is not None and raw:
+            raise TypeError('%s replies carry serialized values, they can not be streamed or read as columns' % cmd)
+        return kind
+
+    def _stream_options(self, cmd, stream, chunk_size):
+        '''
+            Validate the streaming options of a multi bulk command.
+
+            With stream=callable the elements are handed to stream(chunk) in lists of up to
+            chunk_size as they are parsed, and the command callback gets the element count.
+            If stream returns a Future, reading stops until it resolves.
+        '''
+        if stream is None:
+            return None
+
+        if not callable(stream):
+            raise TypeError('stream must be callable')
+
+        if chunk_size < 1:
+            raise TypeError('chunk_size must be at least 1')
+
+        if self._cmd_map.get(cmd) != ReplyType.MULTI_BULK:
+            raise TypeError('%s does not return a multi bulk reply' % cmd)
+
+        return (stream, chunk_size)
+
+    def iter_reply(self, cmd, *args, chunk_size=1000, max_chunks=4):
+        '''
+            Stream a multi bulk reply into a ReplyStream for use with `async for`.
+        '''
+        reply_stream = ReplyStream(max_chunks)
+        self._queue_command(cmd.upper(), *(args + (reply_stream.finish,)), stream=reply_stream.feed, chunk_size=chunk_size)
+        return reply_stream
+
+    def scan_iter(self, match=None, count=None, prefetch=False, dedupe=False):
+        '''
+            Iterate over the keyspace with SCAN, see ScanIterator.
+        '''
+        return ScanIterator(self, 'SCAN', None, match, count, prefetch, dedupe)
+
+    def sscan_iter(self, key, match=None, count=None, prefetch=False, dedupe=False):
+        '''
+            Iterate over the members of a set with SSCAN.
+        '''
+        return ScanIterator(self, 'SSCAN', key, match, count, prefetch, dedupe)
+
+    def hscan_iter(self, key, match=None, count=None, prefetch=False, dedupe=False):
+        '''
+            Iterate over the (field, value) pairs of a hash with HSCAN.
+        '''
+        return ScanIterator(self, 'HSCAN', key, match, count, prefetch, dedupe)
+
+    def zscan_iter(self, key, match=None, count=None, prefetch=False, dedupe=False):
+        '''
+            Iterate over the (member, score) pairs of a sorted set with ZSCAN.
+        '''
+        return ScanIterator(self, 'ZSCAN', key, match, count, prefetch, dedupe)
+
+    def _columnar_options(self, cmd, args, columnar=None, use_numpy=False):
+        '''
+            Validate the columnar options of a multi bulk command.
+
+            columnar='d' (or True) decodes the numbers of the reply straight into an array('d'),
+            columnar='q' into an array('q').  With WITHSCORES the reply becomes (members, scores)
+            with the members in a list, otherwise every element is a number.  use_numpy=True hands
+            the numbers back as a NumPy array sharing the array's memory.
+        '''
+        if not columnar:
+            if use_numpy:
+                raise TypeError('use_numpy=True needs a columnar typecode')
+            return None
+
+        if columnar is True:
+            columnar = 'd'
+
+        if columnar not in ('d', 'q'):
+            raise TypeError("columnar must be 'd' or 'q', not %r" % (columnar,))
+
+        if self._cmd_map.get(cmd) != ReplyType.MULTI_BULK:
+            raise TypeError('%s does not return a multi bulk reply' % cmd)
+
+        if use_numpy and numpy is None:
+            raise TypeError('use_numpy=True requires NumPy to be installed')
+
+        withscores = cmd in ('ZRANGE', 'ZREVRANGE', 'ZRANGEBYSCORE', 'ZREVRANGEBYSCORE') and any(
+            isinstance(arg, (bytes, str)) and arg.upper() in ('WITHSCORES', b'WITHSCORES') for arg in args)
+
+        return (columnar, withscores, use_numpy)
+
+    def execute_command(self, *args, **options):
+        '''
+            Send any command, the first argument being its name, e.g.
+            execute_command('OBJECT', 'ENCODING', 'key', callback).
+
+            The reply is read by its type byte, so this works for commands missing from the
+            command table too; converters registered for the name still apply.
+        '''
+        cmd = args[0]
+        if isinstance(cmd, bytes):
+            cmd = cmd.decode('ascii')
+
+        return self._queue_command(cmd.upper(), *args[1:], **options)
 
     @tracer
-    def _send_command(self):
-        (self._cur_reply_type, self._cur_reply_handler) = self._cmd_map.get(self._cur_cmd, None)
-
-        if not self._cur_reply_type or not self._cur_reply_handler:
-            self._execute_callback('Uknown command: %s'%self._cur_cmd, None)
+    def _send_command(self, cmdstr):
+        self._cur_reply_type = self._cmd_map.get(self._cur_cmd)
 
-        argstr = ''
-        for arg in self._cur_cmd_args:
-            argstr += '$%d\r\n%s\r\n'%(len(str(arg)),arg)
-
-        cmdstr = "*%d\r\n$%d\r\n%s\r\n%s" % ( len(self._cur_cmd_args)+1, 
-                                                  len(self._cur_cmd),
-                                                  self._cur_cmd,
-                                                  argstr)
+        if self._cur_reply_type == ReplyType.SUBSCRIBE:
+            self._cur_reply_handler = self._handle_multi_bulk_reply
+        else:
+            self._cur_reply_handler = self._handle_reply
 
-        logger.debug('write: %s'%cmdstr)
-        self._stream.write(cmdstr)
+        #Formatted only when debug logging is on, a large value would otherwise be copied by repr()
+        logger.debug('write: %r', cmdstr)
+        self._transport.write(cmdstr, partial(self._flow.done, _command_size(cmdstr)))
 
         if self._cur_cmd == 'QUIT':
-            self._execute_callback(None,'OK')
+            self._execute_callback(None, self._decode(b'OK'))
         elif not self._subscribed:
             logger.debug('read_until(%s)'%self._cur_reply_handler)
-            self._stream.read_until('\r\n', self._cur_reply_handler)
+            self._transport.read_until(b'\r\n', self._cur_reply_handler)
+
+    def _pack_command(self, cmd, args):
+        header = _command_headers.get(cmd)
+        if header is None:
+            #Multi word commands such as 'CONFIG GET' go out as separate arguments
+            names = [name.encode('ascii') for name in cmd.split(' ')]
+            header = (len(names), b''.join([b'$%d\r\n%s\r\n' % (len(name), name) for name in names]))
+            _command_headers[cmd] = header
+
+        if self._serializer is not None:
+            args = self._serializer.dump_args(cmd, args)
+
+        encode = self._encode
+        threshold = self._zero_copy_threshold
+        parts = [b'*%d\r\n' % (header[0] + len(args)), header[1]]
+        buffers = None
+
+        for arg in args:
+            if type(arg) is memoryview and threshold is not None:
+                #Sized in bytes whatever its format, a non contiguous view has to be copied
+                try:
+                    arg = arg.cast('B')
+                except TypeError:
+                    arg = encode(arg)
+            elif type(arg) is not bytearray or threshold is None:
+                arg = encode(arg)
+
+            parts.append(b'$%d\r\n' % len(arg))
+
+            if threshold is not None and len(arg) >= threshold:
+                #Large values go to the transport as buffers of their own rather than being joined
+                if buffers is None:
+                    buffers = []
+                buffers.append(b''.join(parts))
+                buffers.append(arg)
+                parts = [b'\r\n']
+            else:
+                parts.append(arg)
+                parts.append(b'\r\n')
+
+        if buffers is None:
+            return b''.join(parts)
+
+        buffers.append(b''.join(parts))
+        return buffers
+
+    def _encode(self, value):
+        #Check the exact type first, these cover nearly every argument we are handed
+        value_type = type(value)
+        if value_type is bytes:
+            return value
+        elif value_type is str:
+            return value.encode(self._encoding, self._encoding_errors)
+        elif value_type is int:
+            return b'%d' % value
+        elif value_type is float:
+            return repr(value).encode('ascii')
+        elif value_type is bool or value is None:
+            #Neither has an unambiguous encoding, so make the caller pick one
+            raise TypeError('Invalid argument %r, convert bools and None to bytes, str or a number first' % value)
+        elif isinstance(value, (bytes, bytearray, memoryview)):
+            return bytes(value)
+        elif isinstance(value, str):
+            return value.encode(self._encoding, self._encoding_errors)
+        elif isinstance(value, int):
+            return b'%d' % value
+        elif isinstance(value, float):
+            return repr(float(value)).encode('ascii')
+        else:
+            raise TypeError('Invalid argument of type %s, expected bytes, str, int or float' % value_type.__name__)
+
+    def _decode(self, value):
+        if self._decode_responses and value is not None:
+            return value.decode(self._encoding, self._encoding_errors)
+        return value
+
+    def _decode_error(self, value):
+        #Errors are always handed to callbacks as text
+        return value.decode(self._encoding, 'replace')
+
+    @tracer
+    def _handle_reply(self, line):
+        prefix = line[:1]
+        if prefix != b'$':
+            #Bulk lines are counted by _handle_bulk_reply, which reads multi bulk elements too
+            self._cur_reply_bytes += len(line)
+
+        if prefix == b'+' or prefix == b'-':
+            self._cur_reply_type = ReplyType.STATUS
+            self._handle_status_reply(line)
+        elif prefix == b':':
+            self._cur_reply_type = ReplyType.INTEGER
+            self._handle_integer_reply(line)
+        elif prefix == b'$':
+            self._cur_reply_type = ReplyType.BULK
+            self._handle_bulk_reply(line)
+        elif prefix == b'*':
+            self._cur_reply_type = ReplyType.MULTI_BULK
+            self._handle_multi_bulk_reply(line)
+        else:
+            self._execute_callback('bad reply: %s'%self._decode_error(line[:-2]), None)
 
     @tracer
     def _handle_status_reply(self, data):
-        data = data.strip()
-        if not data[0] == '+':
-            self._execute_callback('%s'%data[1:], None)
+        data = data[:-2]
+        if not data[:1] == b'+':
+            self._execute_callback(self._decode_error(data[1:]), None)
         else:
-            self._execute_callback(None, data[1:])
+            self._execute_callback(None, self._decode(data[1:]))
 
     @tracer
     def _handle_integer_reply(self, data):
-        data = data.strip()
-        if not data[0] == ':':
+        data = data[:-2]
+        if not data[:1] == b':':
 
             #Check for a nil response
-            if data[0] == '$' and data[1:] == '-1':
+            if data == b'$-1':
                 self._execute_callback(None, None)
             else:
-                self._execute_callback(data[1:], None)
+                self._execute_callback(self._decode_error(data[1:]), None)
         else:
 
             #The last thing we get from a subscription is an integer reply
             if self._cur_reply_type == ReplyType.SUBSCRIBE:
-                self._cur_multi_bulk_reply_data.append(data[1:])
+                self._cur_multi_bulk_reply_data.append(int(data[1:]))
                 self._execute_callback(None, self._cur_multi_bulk_reply_data)
             else:
                 self._execute_callback(None, int(data[1:]))
 
     @tracer
     def _handle_multi_bulk_reply(self, data):
-        data = data.strip()
-        if not data[0] == '*':
-            self._execute_callback('bad multi bulk reply: %s'%data, None)
+        data = data[:-2]
+        if not data[:1] == b'*':
+            self._execute_callback('bad multi bulk reply: %s'%self._decode_error(data), None)
         else:
             self._cur_multi_bulk_reply_left = int(data[1:])
             logger.debug('self._cur_multi_bulk_reply_left == %d'%self._cur_multi_bulk_reply_left)
+
+            if self._cur_columnar:
+                self._cur_column = array(self._cur_columnar[0])
+
             if self._cur_multi_bulk_reply_left <= 0:
-                self._execute_callback(None, [None])
+                if self._cur_columnar:
+                    self._execute_callback(None, self._columnar_reply())
+                elif self._cur_stream:
+                    self._execute_callback(None, 0)
+                else:
+                    self._execute_callback(None, [None])
             else:
-                self._stream.read_until('\r\n', self._handle_bulk_reply)
+                self._transport.read_until(b'\r\n', self._handle_bulk_reply)
 
 
     @tracer
-    def _handle_bulk_reply(self, data):
-        data = data.strip()
+    def _handle_bulk_reply(self, line):
+        self._cur_reply_bytes += len(line)
+        data = line[:-2]
+
+        nested = self._cur_reply_type == ReplyType.MULTI_BULK and not self._cur_stream and self._cur_column is None
+
+        if nested and data[:1] == b'*':
+            count = int(data[1:])
+            if count > 0:
+                #A reply inside the reply, such as SCAN's [cursor, [elements]], is read before its parent carries on
+                self._cur_multi_bulk_stack.append((self._cur_multi_bulk_reply_data, self._cur_multi_bulk_reply_left))
+                self._cur_multi_bulk_reply_data = []
+                self._cur_multi_bulk_reply_left = count
+                self._transport.read_until(b'\r\n', self._handle_bulk_reply)
+            else:
+                self._add_multi_bulk_element([] if count == 0 else None)
 
-        #Clear out the current data since this is the start of a new bulk reply
-        self._cur_bulk_reply_data = ''
+        elif nested and data[:1] == b':':
+            self._add_multi_bulk_element(int(data[1:]))
 
-        if not data[0] == '$':
-            if self._cur_reply_type == ReplyType.SUBSCRIBE and data[0] == ':':
-                self._handle_integer_reply(data)
+        elif not data[:1] == b'$':
+            if self._cur_reply_type == ReplyType.SUBSCRIBE and data[:1] == b':':
+                self._handle_integer_reply(line)
             else:
-                self._execute_callback(data[1:], None)
+                self._execute_callback(self._decode_error(data[1:]), None)
         else:
             bulk_len = int(data[1:])
-            if bulk_len > 0:
-                self._stream.read_until('\r\n', partial(self._handle_bulk_reply_data, bulk_len))
+            if bulk_len >= 0:
+                #The payload may itself contain CRLF, so read it by length along with its terminator
+                self._transport.read_bytes(bulk_len + 2, self._handle_bulk_reply_data)
             else:
-                self._handle_bulk_reply_data(0,None)
+                self._handle_bulk_reply_data(None)
 
     @tracer
-    def _handle_bulk_reply_data(self, length, data):
-        if data:
-            self._cur_bulk_reply_data += data.strip()
-            datalen = len(self._cur_bulk_reply_data)
+    def _handle_bulk_reply_data(self, data):
+        if data is not None:
+            self._cur_reply_bytes += len(data)
 
-            logger.debug('self._cur_bulk_reply_data=%s.'%self._cur_bulk_reply_data)
-        else:
-            datalen = 0
-            self._cur_bulk_reply_data = None
-
-        logger.debug('datalen: %d, expecting: %d'%(datalen, length))
+        if self._cur_column is not None:
+            self._handle_column_data(data)
+            return
 
-        if datalen == length:
-            if self._cur_bulk_reply_data and not self._cur_bulk_reply_data == '' and self._cur_bulk_reply_data.isdigit():
-                self._cur_bulk_reply_data = int(self._cur_bulk_reply_data)
+        if data is not None:
+            #Serialized values are decoded from the raw bytes once the reply is complete
+            data = data[:-2] if self._cur_loads is not None else self._decode(data[:-2])
 
-            #This means we are done reading a multi bulk reply
-            logger.debug('self._cur_reply_type == %s'%self._cur_reply_type)
+        #This means we are done reading a multi bulk reply
+        logger.debug('self._cur_reply_type == %s'%self._cur_reply_type)
 
-            if self._cur_reply_type == ReplyType.MULTI_BULK or self._cur_reply_type == ReplyType.SUBSCRIBE:
-                self._cur_multi_bulk_reply_data.append(self._cur_bulk_reply_data)
+        if self._cur_reply_type == ReplyType.MULTI_BULK or self._cur_reply_type == ReplyType.SUBSCRIBE:
+            if self._cur_stream:
+                self._cur_multi_bulk_reply_data.append(data)
                 self._cur_multi_bulk_reply_left -= 1
+                self._handle_stream_data()
+            else:
+                self._add_multi_bulk_element(data)
+
+        elif self._cur_reply_type == ReplyType.BULK:
+            self._execute_callback(None, data)
 
-                if self._cur_multi_bulk_reply_left == 0:
-                    self._execute_callback(None, self._cur_multi_bulk_reply_data)
+    def _add_multi_bulk_element(self, value):
+        self._cur_multi_bulk_reply_data.append(value)
+        self._cur_multi_bulk_reply_left -= 1
+
+        #Finished nested replies become an element of their parent
+        while self._cur_multi_bulk_reply_left == 0 and self._cur_multi_bulk_stack:
+            nested = self._cur_multi_bulk_reply_data
+            (self._cur_multi_bulk_reply_data, self._cur_multi_bulk_reply_left) = self._cur_multi_bulk_stack.pop()
+            self._cur_multi_bulk_reply_data.append(nested)
+            self._cur_multi_bulk_reply_left -= 1
+
+        if self._cur_multi_bulk_reply_left == 0:
+            self._execute_callback(None, self._cur_multi_bulk_reply_data)
+        else:
+            self._transport.read_until(b'\r\n', self._handle_bulk_reply)
+
+    def _handle_stream_data(self):
+        (stream, chunk_size) = self._cur_stream
+        chunk = self._cur_multi_bulk_reply_data
+        left = self._cur_multi_bulk_reply_left
+
+        if len(chunk) < chunk_size and left > 0:
+            self._transport.read_until(b'\r\n', self._handle_bulk_reply)
+            return
+
+        self._cur_multi_bulk_reply_data = []
+        self._cur_stream_count += len(chunk)
+        result = stream(chunk)
+
+        if left == 0:
+            self._execute_callback(None, self._cur_stream_count)
+        elif hasattr(result, 'add_done_callback') and not result.done():
+            #The consumer is behind, stop reading until it catches up
+            logger.debug('pausing streamed %s reply' % self._cur_cmd)
+            self._transport.pause_reading()
+            result.add_done_callback(self._resume_stream)
+        else:
+            self._transport.read_until(b'\r\n', self._handle_bulk_reply)
+
+    def _resume_stream(self, future):
+        logger.debug('resuming streamed %s reply' % self._cur_cmd)
+        self._transport.resume_reading()
+        self._transport.read_until(b'\r\n', self._handle_bulk_reply)
+
+    def _handle_column_data(self, data):
+        column = self._cur_column
+        withscores = self._cur_columnar[1]
+
+        if withscores and len(self._cur_multi_bulk_reply_data) == len(column):
+            #Members alternate with their scores, only the scores go in the array
+            self._cur_multi_bulk_reply_data.append(self._decode(data[:-2]))
+        elif self._cur_column_error is None:
+            try:
+                if data is None:
+                    if column.typecode == 'd':
+                        column.append(float('nan'))
+                    else:
+                        raise ValueError('nil element in an integer column')
+                elif column.typecode == 'd':
+                    column.append(float(data[:-2]))
                 else:
-                    self._stream.read_until('\r\n', self._handle_bulk_reply)
+                    column.append(int(data[:-2]))
+            except ValueError as e:
+                #Keep reading so the rest of the reply is consumed, then report it
+                self._cur_column_error = 'Unable to decode %s reply into array(%r): %s' % (self._cur_cmd, column.typecode, e)
 
-            elif self._cur_reply_type == ReplyType.BULK:
-                self._execute_callback(None, self._cur_bulk_reply_data)
+        self._cur_multi_bulk_reply_left -= 1
+
+        if self._cur_multi_bulk_reply_left == 0:
+            if self._cur_column_error:
+                self._execute_callback(self._cur_column_error, None)
+            else:
+                self._execute_callback(None, self._columnar_reply())
         else:
-            logger.debug('we have %d more bytes to read'%(length - datalen))
-            self._cur_bulk_reply_data += '\r\n'
-            self._stream.read_until('\r\n', partial(self._handle_bulk_reply_data, length))
+            self._transport.read_until(b'\r\n', self._handle_bulk_reply)
+
+    def _columnar_reply(self):
+        (typecode, withscores, use_numpy) = self._cur_columnar
+        column = self._cur_column
+
+        if use_numpy:
+            column = numpy.frombuffer(column, dtype=typecode)
+
+        if withscores:
+            return (self._cur_multi_bulk_reply_data, column)
+        return column
 
     @tracer
     def _execute_callback(self, error, value):
 
+        #Only the first reply to a SUBSCRIBE is its round trip, later ones are messages
+        if self._cur_sent_at is not None:
+            round_trip = time.monotonic() - self._cur_sent_at
+            self._cur_sent_at = None
+
+            if self._metrics is not None:
+                self._metrics.command_done(self._cur_cmd, round_trip, self._cur_reply_bytes, error is not None)
+            if self._slowlog is not None:
+                self._slowlog.record(self._cur_cmd, self._cur_cmd_args, self._cur_queue_wait, round_trip,
+                                     self._cur_reply_bytes, self._connection_id)
+
+        if self._cur_callback and self._cur_loads is not None and error is None:
+            if self._decode_executor is not None and self._cur_reply_bytes >= self._decode_threshold:
+                #The next command waits for this reply's callback, which keeps replies in order
+                self._decode_elsewhere(value)
+                return
+
+            try:
+                value = self._serializer.load_reply(self._cur_loads, value, self._decode)
+            except Exception as e:
+                error, value = 'Unable to decode %s reply: %s' % (self._cur_cmd, e), None
+
+        self._finish_reply(error, value)
+
+    def _decode_elsewhere(self, value):
+        #Handed to the executor as plain functions, so a process pool can take them too
+        if self._decode_responses:
+            decode = partial(_decode_value, self._encoding, self._encoding_errors)
+        else:
+            decode = _raw_value
+
+        future = self._decode_executor.submit(self._serializer.load_reply, self._cur_loads, value, decode)
+        self._cur_decode = asyncio.wrap_future(future)
+        self._cur_decode.add_done_callback(self._on_decoded)
+
+    def _on_decoded(self, future):
+        if future is not self._cur_decode:
+            logger.debug('dropping a decoded reply, its command was cleared meanwhile')
+            return
+        self._cur_decode = None
+
+        if future.cancelled():
+            error, value = 'Unable to decode %s reply: decoding was cancelled' % self._cur_cmd, None
+        elif future.exception() is not None:
+            error, value = 'Unable to decode %s reply: %s' % (self._cur_cmd, future.exception()), None
+        else:
+            error, value = None, future.result()
+
+        self._finish_reply(error, value)
+
+    def _finish_reply(self, error, value):
+        #Remembered so a reconnect, and the blocking connections, use the same database
+        if self._cur_cmd == 'SELECT' and error is None:
+            self._db = int(self._cur_cmd_args[0])
+
         if self._cur_callback:
-            self._cur_callback(error, value)
+            converter = self._response_callbacks.get(self._cur_cmd)
+            if converter and error is None and not self._cur_columnar and not self._cur_stream:
+                try:
+                    value = converter(value, self._cur_cmd_args)
+                except Exception as e:
+                    error, value = 'Unable to convert %s reply: %s' % (self._cur_cmd, e), None
+
+            if self._profiler is not None:
+                self._profiler.run_callback(self._cur_cmd, self._cur_callback, error, value)
+            else:
+                self._cur_callback(error, value)
 
             if not self._cur_reply_type == ReplyType.SUBSCRIBE:
                 self._clear_state()
@@ -441,7 +1313,7 @@ class Redis(object):
 
         #Start all over again 
         if self._subscribed:
-            self._stream.read_until('\r\n', self._handle_multi_bulk_reply)
+            self._transport.read_until(b'\r\n', self._handle_multi_bulk_reply)
         else:
             self._send_next()
 
@@ -452,21 +1324,47 @@ class Redis(object):
         self._cur_callback = None
         self._cur_reply_handler = None
         self._cur_reply_type = None
+        self._cur_columnar = None
+        self._cur_stream = None
+        self._cur_loads = None
+        self._cur_decode = None
+        self._cur_queue_wait = None
+        self._cur_sent_at = None
+        self._cur_reply_bytes = 0
         self._clear_bulk_data()
 
     @tracer
     def _clear_bulk_data(self):
         self._cur_multi_bulk_reply_left = 0
         self._cur_multi_bulk_reply_data = []
-        self._cur_bulk_reply_data = ''
+        self._cur_multi_bulk_stack = []
+        self._cur_column = None
+        self._cur_column_error = None
+        self._cur_stream_count = 0
 
-    @tracer
-    def _build_cmds(self):
-        for cmd in self._cmd_map:
-            if cmd == 'DEL':
-                name = 'delete'
-            else:
-                name = cmd.replace(' ','_').lower()
 
-            setattr(self, name, partial(self._queue_command, cmd))
+def _decode_value(encoding, errors, value):
+    if value is None:
+        return None
+    return value.decode(encoding, errors)
+
+def _raw_value(value):
+    return value
+
+def _command_name(cmd):
+    if cmd == 'DEL':
+        return 'delete'
+    return cmd.replace(' ','_').lower()
+
+def _command_method(cmd):
+    def command(self, *args, **options):
+        return self._queue_command(cmd, *args, **options)
+
+    command.__name__ = _command_name(cmd)
+    command.__doc__ = 'Send %s, the last positional argument may be the callback.' % cmd
+    return command
 
+#One method per command, defined once for every client
+for _cmd, _reply_type in Redis._cmd_map.items():
+    if _reply_type != ReplyType.SUBSCRIBE:
+        setattr(Redis, _command_name(_cmd), _command_method(_cmd))
@@ -0,0 +1,190 @@
+"""
+    Per command reply converters.
+
+    Each converter is called as converter(value, args) with the parsed reply
+    and the arguments the command was sent with, and returns the value handed
+    to the caller's callback.  Values may be bytes or str depending on the
+    client's decode_responses setting, so converters handle both.
+"""
+
+
+def _text(value):
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+    return value
+
+
+def _has_arg(args, name):
+    for arg in args:
+        if isinstance(arg, (bytes, str)) and _text(arg).upper() == name:
+            return True
+    return False
+
+
+def _items(value):
+    #An empty multi bulk reply is delivered as [None]
+    if value is None or value == [None]:
+        return []
+    return value
+
+
+def to_bool(value, args):
+    if value is None:
+        return None
+    return bool(value)
+
+
+def exists(value, args):
+    #EXISTS with several keys counts them, only a single key is a yes/no question
+    if len(args) == 1:
+        return to_bool(value, args)
+    return value
+
+
+def to_float(value, args):
+    if value is None:
+        return None
+    return float(value)
+
+
+def to_bools(value, args):
+    return [bool(item) for item in _items(value)]
+
+
+def to_floats(value, args):
+    return [None if item is None else float(item) for item in _items(value)]
+
+
+def pairs_to_dict(value, args):
+    items = _items(value)
+    it = iter(items)
+    return dict(zip(it, it))
+
+
+def zset_scores(value, args):
+    """
+        [member, score, ...] -> [(member, float(score)), ...] when WITHSCORES was sent.
+    """
+    if not _has_arg(args, 'WITHSCORES'):
+        return value
+
+    return zset_pairs(value, args)
+
+
+def zset_pairs(value, args):
+    items = _items(value)
+    it = iter(items)
+    return [(member, float(score)) for member, score in zip(it, it)]
+
+
+def key_and_items(value, args):
+    """
+        [key, [element, ...]] -> (key, [element, ...]), nil when nothing was popped.
+    """
+    if value is None or value == [None]:
+        return None
+
+    key, items = value
+    return key, items
+
+
+def scan_page(value, args):
+    """
+        [cursor, [element, ...]] -> (int(cursor), [element, ...])
+    """
+    cursor, items = value
+    return int(cursor), items or []
+
+
+def hscan_page(value, args):
+    cursor, items = scan_page(value, args)
+    it = iter(items)
+    return cursor, dict(zip(it, it))
+
+
+def zscan_page(value, args):
+    cursor, items = scan_page(value, args)
+    it = iter(items)
+    return cursor, [(member, float(score)) for member, score in zip(it, it)]
+
+
+def _info_value(value):
+    if ',' in value and '=' in value:
+        return dict(_info_field(field) for field in value.split(','))
+
+    try:
+        return int(value)
+    except ValueError:
+        pass
+
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def _info_field(field):
+    key, _, value = field.partition('=')
+    return key, _info_value(value)
+
+
+def parse_info(value, args):
+    """
+        Parse the INFO text into a dict, 'db0:keys=1,expires=0' becomes a nested dict.
+    """
+    if value is None:
+        return None
+
+    info = {}
+    for line in _text(value).splitlines():
+        if not line or line.startswith('#') or ':' not in line:
+            continue
+
+        key, _, field = line.partition(':')
+        info[key] = _info_value(field)
+
+    return info
+
+
+RESPONSE_CALLBACKS = {
+    'EXISTS': exists,
+    'SISMEMBER': to_bool,
+    'HEXISTS': to_bool,
+    'SETNX': to_bool,
+    'HSETNX': to_bool,
+    'MSETNX': to_bool,
+    'EXPIRE': to_bool,
+    'EXPIREAT': to_bool,
+    'PEXPIRE': to_bool,
+    'PERSIST': to_bool,
+    'MOVE': to_bool,
+    'RENAMENX': to_bool,
+    'SMOVE': to_bool,
+
+    'ZSCORE': to_float,
+    'ZINCRBY': to_float,
+    'INCRBYFLOAT': to_float,
+    'HINCRBYFLOAT': to_float,
+
+    'SMISMEMBER': to_bools,
+    'ZMSCORE': to_floats,
+
+    'HGETALL': pairs_to_dict,
+
+    'ZRANGE': zset_scores,
+    'ZREVRANGE': zset_scores,
+    'ZRANGEBYSCORE': zset_scores,
+    'ZREVRANGEBYSCORE': zset_scores,
+    'ZPOPMIN': zset_pairs,
+    'ZPOPMAX': zset_pairs,
+
+    'LMPOP': key_and_items,
+    'BLMPOP': key_and_items,
+
+    'INFO': parse_info,
+
+    'SCAN': scan_page,
+    'SSCAN': scan_page,
+    'HSCAN': hscan_page,
+    'ZSCAN': zscan_page,
+}
@@ -0,0 +1,100 @@
+"""
+    Async iteration over the SCAN family of commands.
+"""
+
+import asyncio
+from collections import deque
+
+from .exceptions import RedisError
+
+
+class ScanIterator(object):
+    """
+        Walk a SCAN/SSCAN/HSCAN/ZSCAN cursor with `async for`.
+
+        Pages are fetched one at a time until the server hands back cursor 0.
+        With prefetch the next page is requested as soon as a page is handed
+        over, so it is on the wire while the caller works through the current
+        one; no more than one page is ever fetched ahead.
+        SCAN may return an element more than once; dedupe drops repeats at the
+        cost of remembering every element seen.
+    """
+
+    def __init__(self, client, cmd, key=None, match=None, count=None,
+                 prefetch=False, dedupe=False, loop=None):
+        self._loop = loop or asyncio.get_event_loop()
+        self._client = client
+        self._cmd = cmd
+        self._key = key
+        self._match = match
+        self._count = count
+        self._prefetch = prefetch
+        self._seen = set() if dedupe else None
+
+        self._items = deque()
+        self._cursor = 0
+        self._finished = False
+
+        #Future of the page requested but not yet consumed, at most one ahead
+        self._page = None
+
+    def _request(self):
+        args = [] if self._key is None else [self._key]
+        args.append(self._cursor)
+
+        if self._match is not None:
+            args.extend(['MATCH', self._match])
+        if self._count is not None:
+            args.extend(['COUNT', self._count])
+
+        self._page = self._loop.create_future()
+        self._client._queue_command(self._cmd, *(args + [self._on_page]))
+
+    def _on_page(self, error, page):
+        future = self._page
+
+        if error:
+            self._finished = True
+            future.set_exception(RedisError(error))
+            return
+
+        cursor, items = page
+        self._cursor = cursor
+
+        if isinstance(items, dict):
+            items = list(items.items())
+        future.set_result(items)
+
+        if cursor == 0:
+            self._finished = True
+
+    def _keep(self, item):
+        if self._seen is None:
+            return True
+
+        if item in self._seen:
+            return False
+
+        self._seen.add(item)
+        return True
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self._items:
+            if self._page is None:
+                if self._finished:
+                    raise StopAsyncIteration
+                self._request()
+
+            items = await self._page
+            self._page = None
+
+            #Ask for the next page now so it is on the wire while these items are consumed
+            if self._prefetch and not self._finished:
+                self._request()
+
+            self._items.extend(item for item in items if self._keep(item))
+
+        return self._items.popleft()
@@ -0,0 +1,246 @@
+"""
+    Serialize the values stored with string, hash and list commands.
+
+    A Serializer handed to Redis(serializer=...) encodes the value arguments
+    of commands such as SET, HSET and RPUSH with its codec and decodes the
+    values in the replies to GET, HGETALL, LRANGE and the like.  Keys, hash
+    fields and other arguments are sent as they are.
+
+    Every serialized value starts with a three byte tag: a zero byte, the
+    codec and whether the rest is zlib compressed.  Values are decoded by
+    their tag rather than by the reading client's codec, so data written
+    with different codecs, compressed or not, reads back correctly.  Values
+    without a tag, written by a client without a serializer, are returned as
+    they are.
+"""
+
+import json
+import zlib
+import pickle
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MARKER = b'\x00'
+COMPRESSED = b'z'
+UNCOMPRESSED = b'-'
+
+
+class Codec(object):
+    """
+        A named way of turning values into bytes and back, tagged with a single byte.
+    """
+
+    def __init__(self, name, tag, dumps, loads):
+        self.name = name
+        self.tag = tag
+        self.dumps = dumps
+        self.loads = loads
+
+
+def _json_dumps(value):
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def _pickle_dumps(value):
+    return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+JSON = Codec('json', b'j', _json_dumps, json.loads)
+PICKLE = Codec('pickle', b'p', _pickle_dumps, pickle.loads)
+
+CODECS = {'json': JSON, 'pickle': PICKLE}
+
+
+def _msgpack_dumps(value):
+    return msgpack.packb(value, use_bin_type=True)
+
+
+def _msgpack_loads(data):
+    return msgpack.unpackb(data, raw=False)
+
+
+if msgpack is not None:
+    MSGPACK = Codec('msgpack', b'm', _msgpack_dumps, _msgpack_loads)
+    CODECS['msgpack'] = MSGPACK
+
+_CODEC_TAGS = dict((codec.tag, codec) for codec in CODECS.values())
+
+#Where the values are in each command's arguments, as (first, step), step 0 meaning only the first
+VALUE_ARGS = {
+    'SET': (1, 0),
+    'SETNX': (1, 0),
+    'SETEX': (2, 0),
+    'PSETEX': (2, 0),
+    'GETSET': (1, 0),
+    'MSET': (1, 2),
+    'MSETNX': (1, 2),
+
+    'HSET': (2, 2),
+    'HSETNX': (2, 0),
+    'HMSET': (2, 2),
+
+    'LPUSH': (1, 1),
+    'RPUSH': (1, 1),
+    'LPUSHX': (1, 1),
+    'RPUSHX': (1, 1),
+    'LSET': (2, 0),
+    'LREM': (2, 0),
+    'LINSERT': (2, 1),
+    'LPOS': (1, 0),
+}
+
+#Reply shapes, see Serializer.load_reply
+VALUE = 'value'
+VALUES = 'values'
+PAIRS = 'pairs'
+POPPED = 'popped'
+SCAN_PAIRS = 'scan_pairs'
+
+VALUE_REPLIES = {
+    #SET only replies with a value when sent with GET
+    'SET': VALUE,
+    'GET': VALUE,
+    'GETSET': VALUE,
+    'GETEX': VALUE,
+    'GETDEL': VALUE,
+    'MGET': VALUES,
+
+    'HGET': VALUE,
+    'HMGET': VALUES,
+    'HVALS': VALUES,
+    'HGETALL': PAIRS,
+    'HSCAN': SCAN_PAIRS,
+
+    #LPOP and RPOP reply with a list when sent with a count
+    'LPOP': VALUE,
+    'RPOP': VALUE,
+    'LINDEX': VALUE,
+    'RPOPLPUSH': VALUE,
+    'BRPOPLPUSH': VALUE,
+    'LMOVE': VALUE,
+    'BLMOVE': VALUE,
+    'LRANGE': VALUES,
+    'BLPOP': PAIRS,
+    'BRPOP': PAIRS,
+    'LMPOP': POPPED,
+    'BLMPOP': POPPED,
+}
+
+
+class Serializer(object):
+    """
+        Encode values with codec, 'json', 'pickle', 'msgpack' (when installed)
+        or a Codec, compressing those of compress_threshold bytes or more.
+
+        Values tagged as pickles are only loaded when codec is pickle, as
+        loading a pickle can run arbitrary code.
+    """
+
+    def __init__(self, codec='json', compress_threshold=None, compress_level=6):
+        if not isinstance(codec, Codec):
+            if codec == 'msgpack' and msgpack is None:
+                raise TypeError('the msgpack codec requires msgpack to be installed')
+            if codec not in CODECS:
+                raise TypeError('unknown codec %r, expected one of %s' % (codec, ', '.join(sorted(CODECS))))
+            codec = CODECS[codec]
+
+        if compress_threshold is not None and (not isinstance(compress_threshold, int) or compress_threshold < 0):
+            raise TypeError('compress_threshold must be a non negative integer or None')
+
+        self.codec = codec
+        self._prefix = MARKER + codec.tag
+        self._compress_threshold = compress_threshold
+        self._compress_level = compress_level
+
+        self._codecs = dict(_CODEC_TAGS)
+        self._codecs[codec.tag] = codec
+        if codec is not PICKLE:
+            self._codecs.pop(PICKLE.tag, None)
+
+    def dumps(self, value):
+        '''
+            Return value encoded and tagged, compressed when that makes it smaller.
+        '''
+        data = self.codec.dumps(value)
+
+        if self._compress_threshold is not None and len(data) >= self._compress_threshold:
+            compressed = zlib.compress(data, self._compress_level)
+            if len(compressed) < len(data):
+                return self._prefix + COMPRESSED + compressed
+
+        return self._prefix + UNCOMPRESSED + data
+
+    def loads(self, data, decode=None):
+        '''
+            Return the value data was tagged and encoded from.  Untagged data is
+            returned as it is, or passed through decode when that is given.
+        '''
+        if type(data) is not bytes or data[:1] != MARKER or len(data) < 3:
+            if decode is not None and type(data) is bytes:
+                return decode(data)
+            return data
+
+        codec = self._codecs.get(data[1:2])
+        if codec is None:
+            raise ValueError('no codec for values tagged %r' % data[1:2])
+
+        payload = data[3:]
+        if data[2:3] == COMPRESSED:
+            payload = zlib.decompress(payload)
+        return codec.loads(payload)
+
+    def dump_args(self, cmd, args):
+        '''
+            Return args with the values of cmd encoded.
+        '''
+        spec = VALUE_ARGS.get(cmd)
+        if spec is None:
+            return args
+
+        (first, step) = spec
+        args = list(args)
+        if step == 0:
+            if len(args) > first:
+                args[first] = self.dumps(args[first])
+        else:
+            for i in range(first, len(args), step):
+                args[i] = self.dumps(args[i])
+        return args
+
+    def load_reply(self, kind, value, decode):
+        '''
+            Decode the values in a reply of the given kind, from VALUE_REPLIES.
+            Keys, hash fields and cursors only go through decode.
+        '''
+        if value is None:
+            return None
+
+        loads = self.loads
+        if kind == VALUE:
+            if type(value) is list:
+                return [loads(item, decode) for item in value]
+            return loads(value, decode)
+
+        elif kind == VALUES:
+            return [loads(item, decode) for item in value]
+
+        elif kind == PAIRS:
+            return self._load_pairs(value, decode)
+
+        elif kind == POPPED:
+            if len(value) != 2:
+                return value
+            return [decode(value[0]), [loads(item, decode) for item in value[1]]]
+
+        elif kind == SCAN_PAIRS:
+            return [decode(value[0]), self._load_pairs(value[1] or [], decode)]
+
+        raise ValueError('unknown reply kind %r' % kind)
+
+    def _load_pairs(self, items, decode):
+        #Names at even positions, values at odd ones
+        loads = self.loads
+        return [loads(item, decode) if i % 2 else decode(item) for i, item in enumerate(items)]
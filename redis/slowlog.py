@@ -0,0 +1,90 @@
+"""
+    A slow command log kept by the client, like the server's SLOWLOG.
+
+    The server only sees the time it spends executing a command; the client
+    sees that plus the network, the time the command waited in the client's
+    queue and any IOLoop stall before the reply was handled.  Comparing the
+    two tells server side slowness from client side slowness.
+"""
+
+import time
+import logging
+from collections import deque
+
+logger = logging.getLogger('redis')
+
+#Commands whose first argument is not a key
+KEYLESS_COMMANDS = frozenset([
+    'SELECT', 'ECHO', 'PING', 'QUIT', 'AUTH', 'TIME', 'BGREWRITEAOF', 'DBSIZE', 'INFO',
+    'SLAVEOF', 'BGSAVE', 'SAVE', 'LASTSAVE', 'CONFIG GET', 'CONFIG SET', 'CONFIG RESETSTAT',
+    'FLUSHALL', 'FLUSHDB', 'SHUTDOWN', 'KEYS', 'SCAN', 'RANDOMKEY', 'PUBLISH', 'SUBSCRIBE',
+    'PSUBSCRIBE', 'UNSUBSCRIBE', 'PUNSUBSCRIBE', 'CONFIG', 'DEBUG', 'CLIENT', 'OBJECT',
+])
+
+
+class SlowLog(object):
+    """
+        Bounded log of commands that took at least threshold seconds from being
+        queued to their reply being handled.
+
+        Each entry is a dict with the command, its first max_args arguments cut
+        to max_arg_length, its key, the queue wait, the round trip, the total,
+        the size of the reply and the id of the connection it ran on.  With
+        log_level set, entries are logged as they are recorded.
+    """
+
+    def __init__(self, threshold=0.01, max_entries=128, max_args=8, max_arg_length=64, log_level=None):
+        self.threshold = threshold
+        self._entries = deque(maxlen=max_entries)
+        self._max_args = max_args
+        self._max_arg_length = max_arg_length
+        self._log_level = log_level
+        self._next_id = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _truncate(self, arg):
+        if isinstance(arg, (bytes, str)) and len(arg) > self._max_arg_length:
+            return arg[:self._max_arg_length] + (b'...' if isinstance(arg, bytes) else '...')
+        return arg
+
+    def record(self, cmd, args, queue_wait, round_trip, reply_bytes, connection_id):
+        duration = queue_wait + round_trip
+        if duration < self.threshold:
+            return
+
+        shown = [self._truncate(arg) for arg in args[:self._max_args]]
+        if len(args) > self._max_args:
+            shown.append('... (%d more arguments)' % (len(args) - self._max_args))
+
+        entry = {
+            'id': self._next_id,
+            'time': time.time(),
+            'command': cmd,
+            'args': shown,
+            'key': self._truncate(args[0]) if args and cmd not in KEYLESS_COMMANDS else None,
+            'queue_wait': queue_wait,
+            'round_trip': round_trip,
+            'duration': duration,
+            'reply_bytes': reply_bytes,
+            'connection': connection_id,
+        }
+        self._next_id += 1
+        self._entries.append(entry)
+
+        if self._log_level is not None:
+            logger.log(self._log_level, 'slow command %s %r: %.3fms (queued %.3fms, round trip %.3fms), %d reply bytes, connection %s' % (
+                cmd, shown, duration * 1000, queue_wait * 1000, round_trip * 1000, reply_bytes, connection_id))
+
+    def get(self, count=None):
+        '''
+            Return up to count entries, newest first.
+        '''
+        entries = list(reversed(self._entries))
+        if count is not None:
+            entries = entries[:count]
+        return entries
+
+    def reset(self):
+        self._entries.clear()
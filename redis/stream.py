@@ -0,0 +1,74 @@
+"""
+    Async iteration over a multi bulk reply that is delivered in chunks.
+"""
+
+import asyncio
+from collections import deque
+
+from .exceptions import RedisError
+
+
+class ReplyStream(object):
+    """
+        Buffer the chunks of a streamed reply for an `async for` loop.
+
+        At most max_chunks chunks are held; once that many are waiting, feed()
+        returns a Future and the client stops reading the reply until the
+        consumer has caught up.
+    """
+
+    def __init__(self, max_chunks=4, loop=None):
+        self._loop = loop or asyncio.get_event_loop()
+        self._max_chunks = max_chunks
+        self._chunks = deque()
+
+        #Resolved when a chunk arrives or the reply ends
+        self._waiter = None
+        #Resolved when there is room for another chunk
+        self._resume = None
+
+        self._done = False
+        self._error = None
+
+        #Total number of elements, set once the reply has been read
+        self.count = None
+
+    def feed(self, chunk):
+        self._chunks.append(chunk)
+        self._wake()
+
+        if len(self._chunks) >= self._max_chunks:
+            self._resume = self._loop.create_future()
+            return self._resume
+
+    def finish(self, error, count):
+        self._done = True
+        self._error = error
+        self.count = count
+        self._wake()
+
+    def _wake(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+        self._waiter = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self._chunks:
+            if self._done:
+                if self._error is not None:
+                    raise RedisError(self._error)
+                raise StopAsyncIteration
+
+            self._waiter = self._loop.create_future()
+            await self._waiter
+
+        chunk = self._chunks.popleft()
+
+        if self._resume is not None and len(self._chunks) < self._max_chunks:
+            resume, self._resume = self._resume, None
+            resume.set_result(None)
+
+        return chunk
@@ -25,21 +25,25 @@ def echo(logger, fn):
     """
     import functools
     # Unpack function's arg count, arg names, arg defaults
-    code = fn.func_code
+    code = fn.__code__
     argcount = code.co_argcount
     argnames = code.co_varnames[:argcount]
-    fn_defaults = fn.func_defaults or list()
+    fn_defaults = fn.__defaults__ or list()
     argdefs = dict(zip(argnames[-len(fn_defaults):], fn_defaults))
 
     @functools.wraps(fn)
     def wrapped(*v, **k):
+        #Formatting the arguments costs more than most calls, skip it when nobody is listening
+        if not logger.isEnabledFor(logging.DEBUG):
+            return fn(*v, **k)
+
         # Collect function arguments by chaining together positional,
         # defaulted, extra positional and keyword arguments.
-        positional = map(format_arg_value, zip(argnames, v))
+        positional = list(map(format_arg_value, zip(argnames, v)))
         defaulted = [format_arg_value((a, argdefs[a]))
         for a in argnames[len(v):] if a not in k]
-        nameless = map(repr, v[argcount:])
-        keyword = map(format_arg_value, k.items())
+        nameless = list(map(repr, v[argcount:]))
+        keyword = list(map(format_arg_value, k.items()))
         args = positional + defaulted + nameless + keyword
 
         logger.debug("--> %s(%s)" % (name(fn), ", ".join(args)))
@@ -0,0 +1,457 @@
+"""
+    Transports move raw bytes between a Redis client and the server.
+
+    The command layer in redis.Redis only ever asks a transport to write a
+    command (and to say when it has left the write buffer), to read up to a delimiter or to read a fixed number of bytes, and
+    occasionally to stop reading for a while, so any event loop that can
+    provide connect/connect_unix/write/read_until/read_bytes/pause_reading/
+    resume_reading/close can drive the client.
+"""
+
+import socket
+import asyncio
+import logging
+
+from tornado import iostream
+from tornado.iostream import StreamClosedError
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+logger = logging.getLogger('redis')
+
+
+def new_event_loop():
+    """
+        Return a new asyncio event loop, using uvloop when it is installed.
+    """
+    if uvloop is not None:
+        return uvloop.new_event_loop()
+
+    return asyncio.new_event_loop()
+
+
+class SocketOptions(object):
+    """
+        Options applied to every socket a transport connects.
+
+        tcp_nodelay turns off Nagle's algorithm so small commands are sent
+        at once instead of waiting for the previous write to be acknowledged.
+        keepalive has the kernel probe an idle connection so a dead peer is
+        noticed without writing to it: after keepalive_idle seconds, every
+        keepalive_interval seconds, giving up after keepalive_count probes;
+        unset values keep the system defaults.  send_buffer_size and
+        receive_buffer_size set SO_SNDBUF and SO_RCVBUF.  read_chunk_size is
+        how much an IOStream reads from the socket at a time, asyncio picks
+        its own.  TCP options are skipped on Unix sockets.
+    """
+
+    def __init__(self, tcp_nodelay=True, keepalive=False, keepalive_idle=None, keepalive_interval=None,
+                 keepalive_count=None, send_buffer_size=None, receive_buffer_size=None, read_chunk_size=None):
+        for name, value in (('keepalive_idle', keepalive_idle), ('keepalive_interval', keepalive_interval),
+                            ('keepalive_count', keepalive_count), ('send_buffer_size', send_buffer_size),
+                            ('receive_buffer_size', receive_buffer_size), ('read_chunk_size', read_chunk_size)):
+            if value is not None and (not isinstance(value, int) or value < 1):
+                raise TypeError('%s must be a positive integer, not %r' % (name, value))
+
+        self.tcp_nodelay = tcp_nodelay
+        self.keepalive = keepalive
+        self.keepalive_idle = keepalive_idle
+        self.keepalive_interval = keepalive_interval
+        self.keepalive_count = keepalive_count
+        self.send_buffer_size = send_buffer_size
+        self.receive_buffer_size = receive_buffer_size
+        self.read_chunk_size = read_chunk_size
+
+    def apply(self, sock):
+        tcp = sock.family in (socket.AF_INET, socket.AF_INET6)
+
+        if tcp and self.tcp_nodelay:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        if self.keepalive:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+            if tcp:
+                #macOS calls the idle time TCP_KEEPALIVE
+                for names, value in ((('TCP_KEEPIDLE', 'TCP_KEEPALIVE'), self.keepalive_idle),
+                                     (('TCP_KEEPINTVL',), self.keepalive_interval),
+                                     (('TCP_KEEPCNT',), self.keepalive_count)):
+                    if value is None:
+                        continue
+
+                    option = next((getattr(socket, name) for name in names if hasattr(socket, name)), None)
+                    if option is None:
+                        logger.debug('%s is not supported on this platform' % names[0])
+                    else:
+                        sock.setsockopt(socket.IPPROTO_TCP, option, value)
+
+        if self.send_buffer_size:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.send_buffer_size)
+        if self.receive_buffer_size:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.receive_buffer_size)
+
+
+def _on_read(callback):
+    """
+        Adapt a callback taking the read data to a Future done callback.
+
+        A read that fails because the stream closed is dropped here, the
+        stream's close callback is what reports it.
+    """
+    def _done(future):
+        if future.exception() is not None:
+            logger.debug('read failed: %s' % future.exception())
+        else:
+            callback(future.result())
+
+    return _done
+
+
+def _on_write(callback):
+    """
+        Adapt a write complete callback to a Future done callback.
+
+        A write that fails because the stream closed is no longer outstanding
+        either, so the callback runs in both cases.
+    """
+    def _done(future):
+        if future.exception() is not None:
+            logger.debug('write failed: %s' % future.exception())
+        callback()
+
+    return _done
+
+
+class IOStreamTransport(object):
+    """
+        Transport backed by a tornado IOStream on the Tornado IOLoop.
+    """
+
+    def __init__(self, socket_options=None):
+        self._stream = None
+        self._socket_options = socket_options or SocketOptions()
+
+    def connect(self, host, port, close_callback=None):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM, 0)
+        #Buffer sizes have to be set before connecting to affect the TCP window
+        self._socket_options.apply(sock)
+        sock.connect((host, port))
+        self._open(sock, close_callback)
+
+    def connect_unix(self, path, close_callback=None):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM, 0)
+        self._socket_options.apply(sock)
+        sock.connect(path)
+        self._open(sock, close_callback)
+
+    def _open(self, sock, close_callback):
+        if self._socket_options.read_chunk_size:
+            self._stream = iostream.IOStream(sock, read_chunk_size=self._socket_options.read_chunk_size)
+        else:
+            self._stream = iostream.IOStream(sock)
+
+        if close_callback:
+            self._stream.set_close_callback(close_callback)
+
+    def write(self, data, callback=None):
+        if type(data) is list:
+            #IOStream keeps large buffers as views rather than copying them into its own
+            for buf in data:
+                future = self._stream.write(buf)
+        else:
+            future = self._stream.write(data)
+
+        if callback:
+            future.add_done_callback(_on_write(callback))
+
+    def read_until(self, delimiter, callback):
+        self._stream.read_until(delimiter).add_done_callback(_on_read(callback))
+
+    def read_bytes(self, num_bytes, callback):
+        self._stream.read_bytes(num_bytes).add_done_callback(_on_read(callback))
+
+    def pause_reading(self):
+        #IOStream only reads from the socket while a read is pending, not asking is enough
+        pass
+
+    def resume_reading(self):
+        pass
+
+    def close(self):
+        self._stream.close()
+
+    def copy(self):
+        '''
+            Return a new, unconnected transport with the same settings.
+        '''
+        return IOStreamTransport(self._socket_options)
+
+    def abandon(self):
+        '''
+            Forget the connection without closing it, for a child process that inherited it.
+            Closing would take the socket out of the IOLoop's poller, which the parent shares.
+        '''
+        self._stream = None
+
+    def closed(self):
+        return self._stream is None or self._stream.closed()
+
+
+class AsyncioTransport(object):
+    """
+        Transport backed by an asyncio.Protocol.
+
+        Incoming data is appended to a buffer in data_received and pending
+        reads are satisfied right there, so reply handlers run directly from
+        the protocol callback instead of being rescheduled on the loop.
+    """
+
+    def __init__(self, loop=None, socket_options=None):
+        self._loop = loop
+        self._socket_options = socket_options or SocketOptions()
+        self._transport = None
+        #The protocol of the current connection, events from older ones only reach their close callback
+        self._protocol = None
+        self._connecting = None
+        self._close_callback = None
+        self._reset()
+
+    def _reset(self):
+        self._buffer = bytearray()
+        self._buffer_pos = 0
+        self._read_delimiter = None
+        self._read_num_bytes = None
+        self._read_callback = None
+        self._reading = False
+
+        #Writes issued while the connection is being made are held here
+        self._write_buffer = []
+        #Write complete callbacks waiting for the transport's buffer to empty
+        self._drain_callbacks = []
+        self._closed = False
+
+    def connect(self, host, port, close_callback=None):
+        loop = self._loop or asyncio.get_event_loop()
+        return self._connect(loop, lambda factory: loop.create_connection(factory, host, port), close_callback)
+
+    def connect_unix(self, path, close_callback=None):
+        loop = self._loop or asyncio.get_event_loop()
+        return self._connect(loop, lambda factory: loop.create_unix_connection(factory, path), close_callback)
+
+    def _connect(self, loop, create_connection, close_callback):
+        #Anything left over from a previous connection must not be parsed as a reply
+        self._reset()
+        self._transport = None
+        self._close_callback = close_callback
+        self._protocol = _RedisProtocol(self, close_callback)
+
+        protocol = self._protocol
+        self._connecting = asyncio.ensure_future(create_connection(lambda: protocol), loop=loop)
+        self._connecting.add_done_callback(self._on_connect_done)
+
+        return self._connecting
+
+    def write(self, data, callback=None):
+        if self._closed:
+            raise StreamClosedError()
+
+        #A list is a command whose large values are kept as buffers of their own
+        if self._transport is None:
+            if type(data) is list:
+                self._write_buffer.extend(data)
+            else:
+                self._write_buffer.append(data)
+        elif type(data) is list:
+            self._transport.writelines(data)
+        else:
+            self._transport.write(data)
+
+        if callback:
+            self._drain_callbacks.append(callback)
+            if self._transport is not None and not self._transport.get_write_buffer_size():
+                self._drained()
+
+    def read_until(self, delimiter, callback):
+        self._read_delimiter = delimiter
+        self._read_callback = callback
+
+        #A handler calling read_until from inside _process just registers the
+        #read; the running loop picks it up without growing the stack
+        if not self._reading:
+            self._process()
+
+    def read_bytes(self, num_bytes, callback):
+        self._read_num_bytes = num_bytes
+        self._read_callback = callback
+
+        if not self._reading:
+            self._process()
+
+    def pause_reading(self):
+        if self._transport is not None:
+            self._transport.pause_reading()
+
+    def resume_reading(self):
+        if self._transport is not None:
+            self._transport.resume_reading()
+
+    def close(self):
+        self._closed = True
+        self._write_buffer = []
+        self._drained()
+
+        if self._transport is not None:
+            self._transport.close()
+        elif self._connecting is not None:
+            self._connecting.cancel()
+
+    def closed(self):
+        return self._closed
+
+    def copy(self):
+        return AsyncioTransport(self._loop, self._socket_options)
+
+    def abandon(self):
+        '''
+            Forget the connection without closing it, for a child process that inherited it.
+            A loop handed to the constructor is forgotten too, it belongs to the parent and
+            the next connection is made on the child's current loop.
+        '''
+        self._loop = None
+        self._transport = None
+        self._protocol = None
+        self._connecting = None
+        self._close_callback = None
+        self._reset()
+
+    def _on_connect_done(self, future):
+        self._connecting = None
+
+        if future.cancelled():
+            return
+
+        if future.exception() is not None:
+            logger.error('connection failed: %s' % future.exception())
+            self._closed = True
+            self._write_buffer = []
+            self._drained()
+
+            if self._close_callback:
+                self._close_callback()
+
+    def _connection_made(self, transport):
+        #close() was called while we were still connecting
+        if self._closed:
+            transport.close()
+            return
+
+        self._transport = transport
+
+        sock = transport.get_extra_info('socket')
+        if sock is not None:
+            self._socket_options.apply(sock)
+
+        #Have the protocol told as soon as anything is left unwritten, resume_writing
+        #then means the buffer has emptied and every write has completed
+        transport.set_write_buffer_limits(high=0)
+
+        if self._write_buffer:
+            transport.writelines(self._write_buffer)
+            self._write_buffer = []
+
+        if not transport.get_write_buffer_size():
+            self._drained()
+
+    def _drained(self):
+        callbacks, self._drain_callbacks = self._drain_callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def _data_received(self, data):
+        self._buffer.extend(data)
+        self._process()
+
+    def _connection_lost(self, exc):
+        self._closed = True
+        self._transport = None
+        self._drained()
+
+        if exc:
+            logger.debug('connection lost: %s' % exc)
+
+        if self._close_callback:
+            self._close_callback()
+
+    def _process(self):
+        buf = self._buffer
+
+        self._reading = True
+        try:
+            #A callback that reconnects swaps the buffer, what is left of the old one is stale
+            while self._read_callback and self._buffer is buf:
+                start = self._buffer_pos
+                if self._read_num_bytes is not None:
+                    end = start + self._read_num_bytes
+                    if len(buf) < end:
+                        break
+                else:
+                    pos = buf.find(self._read_delimiter, start)
+                    if pos == -1:
+                        break
+                    end = pos + len(self._read_delimiter)
+
+                data = bytes(buf[start:end])
+                self._buffer_pos = end
+
+                callback = self._read_callback
+                self._read_callback = None
+                self._read_delimiter = None
+                self._read_num_bytes = None
+
+                callback(data)
+        finally:
+            self._reading = False
+
+            #Consumed bytes are dropped once per batch rather than per read
+            if self._buffer is buf and self._buffer_pos:
+                del buf[:self._buffer_pos]
+                self._buffer_pos = 0
+
+
+class _RedisProtocol(asyncio.Protocol):
+    """
+        Forward one connection's events to its AsyncioTransport.
+
+        Once the transport has moved on to a newer connection, this one's
+        events are dropped, except that its close callback still runs.
+    """
+
+    def __init__(self, owner, close_callback=None):
+        self._owner = owner
+        self._close_callback = close_callback
+
+    def _current(self):
+        return self._owner._protocol is self
+
+    def connection_made(self, transport):
+        if self._current():
+            self._owner._connection_made(transport)
+        else:
+            transport.close()
+
+    def data_received(self, data):
+        if self._current():
+            self._owner._data_received(data)
+
+    def connection_lost(self, exc):
+        if self._current():
+            self._owner._connection_lost(exc)
+        elif self._close_callback:
+            self._close_callback()
+
+    def resume_writing(self):
+        if self._current():
+            self._owner._drained()
@@ -1,3 +1,3 @@
 #!/bin/bash
 
-nosetests ./tests/tests.py --verbose
+python3 -m pytest ./tests/tests.py --verbose
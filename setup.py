@@ -2,7 +2,7 @@ from setuptools import setup, find_packages
 
 setup(
     name = 'redis-tornado',
-    version = '0.2',
+    version = '0.3',
     description = 'Async redis client built on the Tornado IOLoop.',
 
     author = 'Lin Salisbury',
@@ -14,7 +14,9 @@ setup(
 
     packages = find_packages(),
 
+    python_requires = '>=3.5',
+
     install_requires = [
-        'tornado >= 2.2.1'
+        'tornado >= 5.0'
     ],
 )
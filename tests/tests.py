@@ -1,12 +1,31 @@
 import unittest
+import asyncio
 
-from tornado import ioloop
+from tornado import ioloop, iostream
 from functools import partial
 import redis.trace as trace
 import redis.redis as redis
+import redis.transport as transport
+from redis.queue import CommandQueue, LaneQueue
+import redis.metrics as metrics
+import redis.slowlog as slowlog
+import redis.profiler as profiler
+import redis.fakeserver as fakeserver
+import redis.capture as capture
+import redis.serializer as serializer
+import redis.forksafe as forksafe
+import redis.blocking as blocking
 import logging
-import time
+import json
+import math
+import os
+import socket
+import tempfile
 import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from array import array
 
 
 logger = logging.getLogger('test')
@@ -17,18 +36,34 @@ tracer = partial(trace.echo, logger)
 
 class TestTornadoRedis(unittest.TestCase):
 
+    #Compare replies as text, TestRedisBytes covers the raw bytes default
+    decode_responses = True
+
     @tracer
     def setUp(self):
         # Create a callback that expects an 'OK' as it's result
-        self.expectok = partial(self.expect, 'OK')
+        self.expectok = partial(self.expect, 'OK' if self.decode_responses else b'OK')
 
         self.ioloop = ioloop.IOLoop.instance()
-        self.db = redis.Redis()
+        self.failure = None
+        self.db = self.make_client()
 
-        self.db.connect(self.stop)
+        self.finished = False
+        self.db.connect(self.on_close)
         self.db.select(11, self.expectok())
         self.db.flushdb(self.expectok())
 
+    @tracer
+    def tearDown(self):
+        #Drop the connection so commands left behind by a failed test can't leak into the next one
+        self.finished = True
+        self.db.disconnect()
+
+    @tracer
+    def on_close(self):
+        if not self.finished:
+            self.stop()
+
     @tracer
     def cleanup(self):
         self.db.flushdb(self.expectok(next=self.stop))
@@ -38,8 +73,28 @@ class TestTornadoRedis(unittest.TestCase):
         self.ioloop.stop()
 
     @tracer
-    def start(self):
+    def start(self, timeout=10):
+        #A callback that never fires would otherwise leave the loop running forever
+        handle = self.ioloop.add_timeout(time.time() + timeout, partial(self.fail_async, 'timed out waiting for callbacks'))
         self.ioloop.start()
+        self.ioloop.remove_timeout(handle)
+
+        if self.failure:
+            failure, self.failure = self.failure, None
+            raise failure
+
+    def fail_async(self, msg):
+        self.failure = AssertionError(msg)
+        self.stop()
+
+    def make_transport(self):
+        '''
+            Return the transport for the client under test, None means the default IOStream
+        '''
+        return None
+
+    def make_client(self):
+        return redis.Redis(transport=self.make_transport(), decode_responses=self.decode_responses)
 
     def expect(self, expected_value=None, expected_error=None, next=None, assertFunc=None):
         """
@@ -50,19 +105,26 @@ class TestTornadoRedis(unittest.TestCase):
 
         @tracer
         def _expect(received_error, received_value):
-            self.assertEqual(received_error, expected_error)
-
-            if isinstance(received_value, list):
-                received_value = sorted(received_value)
-                expected_v = sorted(expected_value)
-            else:
-                expected_v = expected_value
-
-            func = assertFunc or self.assertEqual
-            func(received_value, expected_v)
-
-            if next:
-                next()
+            try:
+                self.assertEqual(received_error, expected_error)
+
+                if isinstance(received_value, list):
+                    #Replies can mix None, ints and strings which don't order against each other
+                    received_value = sorted(received_value, key=repr)
+                    expected_v = sorted(expected_value, key=repr)
+                else:
+                    expected_v = expected_value
+
+                func = assertFunc or self.assertEqual
+                func(received_value, expected_v)
+
+                if next:
+                    next()
+            except Exception as e:
+                #Raising here would only be logged by the IOLoop, or by asyncio which then drops
+                #the connection and ends the test quietly, hand it to start() instead
+                self.failure = e
+                self.stop()
 
         return _expect
 
@@ -198,6 +260,15 @@ class TestRedisKeyCommands(TestTornadoRedis):
     def test_sort(self): #TODO: Build test
         pass
 
+    @tracer
+    def test_persist(self):
+        self.db.set('key1', 'value', self.expectok())
+        self.db.expire('key1', 100, self.expect(True))
+        self.db.persist('key1', self.expect(True))
+        self.db.persist('key1', self.expect(False))
+        self.db.ttl('key1', self.expect(-1, next=self.cleanup))
+        self.start()
+
 
 class TestRedisStringCommands(TestTornadoRedis):
     '''
@@ -248,28 +319,28 @@ class TestRedisStringCommands(TestTornadoRedis):
     def test_decr(self):
         self.db.set('key',10, self.expectok())
         self.db.decr('key', self.expect(9))
-        self.db.get('key', self.expect(9, next=self.cleanup))
+        self.db.get('key', self.expect('9', next=self.cleanup))
         self.start()
 
     @tracer
     def test_decrby(self):
         self.db.set('key',10, self.expectok())
         self.db.decrby('key', 2, self.expect(8))
-        self.db.get('key', self.expect(8, next=self.cleanup))
+        self.db.get('key', self.expect('8', next=self.cleanup))
         self.start()
 
     @tracer
     def test_incr(self):
         self.db.set('key',10, self.expectok())
         self.db.incr('key', self.expect(11))
-        self.db.get('key', self.expect(11, next=self.cleanup))
+        self.db.get('key', self.expect('11', next=self.cleanup))
         self.start()
 
     @tracer
     def test_incrby(self):
         self.db.set('key',10, self.expectok())
         self.db.incrby('key', 2, self.expect(12))
-        self.db.get('key', self.expect(12, next=self.cleanup))
+        self.db.get('key', self.expect('12', next=self.cleanup))
         self.start()
 
     @tracer
@@ -289,6 +360,62 @@ class TestRedisStringCommands(TestTornadoRedis):
         self.db.getset('key', 'value1', self.expect(None, next=self.cleanup))
         self.start()
 
+    @tracer
+    def test_getrange_setrange_strlen(self):
+        self.db.set('key0', 'Hello World', self.expectok())
+        self.db.setrange('key0', 6, 'Redis', self.expect(11))
+        self.db.getrange('key0', 0, 4, self.expect('Hello'))
+        self.db.get('key0', self.expect('Hello Redis'))
+        self.db.strlen('key0', self.expect(11, next=self.cleanup))
+        self.start()
+
+    @tracer
+    def test_set_get(self):
+        #SET ... GET answers with a bulk reply instead of a status
+        self.db.set('key0', 'value0', 'GET', self.expect(None))
+        self.db.set('key0', 'value1', 'GET', self.expect('value0'))
+        self.db.set('key0', 'value2', 'NX', self.expect(None))
+        self.db.get('key0', self.expect('value1', next=self.cleanup))
+        self.start()
+
+    @tracer
+    def test_getex(self):
+        self.db.set('key0', 'value0', self.expectok())
+        self.db.getex('key0', 'EX', 100, self.expect('value0'))
+        self.db.ttl('key0', self.expect(100))
+        self.db.getex('key0', 'PERSIST', self.expect('value0'))
+        self.db.ttl('key0', self.expect(-1, next=self.cleanup))
+        self.start()
+
+    @tracer
+    def test_incrbyfloat(self):
+        self.db.incrbyfloat('key0', 1.5, self.expect(1.5))
+        self.db.incrbyfloat('key0', 2, self.expect(3.5, next=self.cleanup))
+        self.start()
+
+    @tracer
+    def test_bits(self):
+        self.db.setbit('key0', 7, 1, self.expect(0))
+        self.db.setbit('key0', 7, 1, self.expect(1))
+        self.db.getbit('key0', 7, self.expect(1))
+        self.db.getbit('key0', 6, self.expect(0))
+        self.db.bitcount('key0', self.expect(1))
+        self.db.bitpos('key0', 1, self.expect(7))
+        self.db.bitop('OR', 'key1', 'key0', 'key0', self.expect(1))
+        self.db.bitfield('key1', 'GET', 'u8', 0, 'INCRBY', 'u8', 0, 1, self.expect([1, 2], next=self.cleanup))
+        self.start()
+
+    @tracer
+    def test_hyperloglog(self):
+        self.db.pfadd('key0', 'a', 'b', 'c', self.expect(1))
+        self.db.pfadd('key0', 'a', self.expect(0))
+        self.db.pfadd('key1', 'c', 'd', self.expect(1))
+        self.db.pfcount('key0', self.expect(3))
+        self.db.pfmerge('key2', 'key0', 'key1', self.expectok())
+        self.db.pfcount('key2', self.expect(4, next=self.cleanup))
+        self.start()
+
+
 class TestRedisHashCommands(TestTornadoRedis):
     '''
     Test the set of 'hash' commands as defined by the redis docs at :http://redis.io/commands#hash
@@ -344,10 +471,10 @@ class TestRedisHashCommands(TestTornadoRedis):
     @tracer
     def test_hgetall(self):
         self.db.hmset('key','field0','value0','field1','value1','field2','value2', self.expectok())
-        self.db.hgetall('key', self.expect(['field0','value0','field1','value1','field2','value2'], next=self.cleanup))
+        self.db.hgetall('key', self.expect({'field0':'value0','field1':'value1','field2':'value2'}, next=self.cleanup))
         self.start()
 
-        self.db.hgetall('key', self.expect([None], next=self.cleanup))
+        self.db.hgetall('key', self.expect({}, next=self.cleanup))
         self.start()
 
     @tracer
@@ -376,10 +503,10 @@ class TestRedisHashCommands(TestTornadoRedis):
     def test_hincrby(self):
         self.db.hset('key' ,'field' ,1 ,self.expect(1))
         self.db.hincrby('key' ,'field' ,2 ,self.expect(3))
-        self.db.hget('key','field', self.expect(3))
+        self.db.hget('key','field', self.expect('3'))
 
         self.db.hincrby('key' ,'field' ,-2 ,self.expect(1))
-        self.db.hget('key','field', self.expect(1, next=self.cleanup))
+        self.db.hget('key','field', self.expect('1', next=self.cleanup))
 
         self.start()
 
@@ -609,9 +736,14 @@ class TestRedisListCommands(TestTornadoRedis):
         self.db.rpush('key1','key1.value1', self.expect(2))
         self.db.rpush('key2','key2.value0', self.expect(1))
         self.db.rpush('key2','key2.value1', self.expect(2))
-        self.db.blpop('key0','key1','key2',0,self.expect(['key1','key1.value0']))
-        self.db.blpop('key0','key1','key2',0,self.expect(['key1','key1.value1']))
-        self.db.blpop('key0','key1','key2',0,self.expect(['key2','key2.value0'], next=self.cleanup))
+        #Each blocking command runs on a connection of its own, so the next one waits for its reply
+        def second():
+            self.db.blpop('key0','key1','key2',0,self.expect(['key1','key1.value1'], next=third))
+
+        def third():
+            self.db.blpop('key0','key1','key2',0,self.expect(['key2','key2.value0'], next=self.cleanup))
+
+        self.db.blpop('key0','key1','key2',0,self.expect(['key1','key1.value0'], next=second))
         self.start()
 
         self.db.blpop('key0','key1','key2',1,self.expect([None], next=self.cleanup))
@@ -636,14 +768,47 @@ class TestRedisListCommands(TestTornadoRedis):
         self.db.rpush('key1','key1.value1', self.expect(2))
         self.db.rpush('key2','key2.value0', self.expect(1))
         self.db.rpush('key2','key2.value1', self.expect(2))
-        self.db.brpop('key0','key1','key2',0,self.expect(['key1','key1.value1']))
-        self.db.brpop('key0','key1','key2',0,self.expect(['key1','key1.value0']))
-        self.db.brpop('key0','key1','key2',0,self.expect(['key2','key2.value1'], next=self.cleanup))
+        #Each blocking command runs on a connection of its own, so the next one waits for its reply
+        def second():
+            self.db.brpop('key0','key1','key2',0,self.expect(['key1','key1.value0'], next=third))
+
+        def third():
+            self.db.brpop('key0','key1','key2',0,self.expect(['key2','key2.value1'], next=self.cleanup))
+
+        self.db.brpop('key0','key1','key2',0,self.expect(['key1','key1.value1'], next=second))
         self.start()
 
         self.db.brpop('key0','key1','key2',1,self.expect([None], next=self.cleanup))
         self.start()
 
+    @tracer
+    def test_pushx(self):
+        self.db.lpushx('key0', 'value0', self.expect(0))
+        self.db.rpush('key0', 'value0', self.expect(1))
+        self.db.lpushx('key0', 'value1', self.expect(2))
+        self.db.rpushx('key0', 'value2', 'value3', self.expect(4))
+        self.db.lrange('key0', 0, -1, self.expect(['value1', 'value0', 'value2', 'value3'], next=self.cleanup))
+        self.start()
+
+    @tracer
+    def test_brpoplpush(self):
+        def check():
+            self.db.lrange('key1', 0, -1, self.expect(['value0'], next=self.cleanup))
+
+        #Blocking commands run on a connection of their own, so what follows them can overtake them
+        self.db.rpush('key0', 'value0', self.expect(1))
+        self.db.brpoplpush('key0', 'key1', 1, self.expect('value0', next=check))
+        self.start()
+
+    @tracer
+    def test_lmpop_reply(self):
+        #LMPOP needs Redis 7, check the reply conversion on its own
+        from redis.responses import key_and_items
+        self.assertEqual(key_and_items(['key0', ['value0', 'value1']], []), ('key0', ['value0', 'value1']))
+        self.assertEqual(key_and_items([None], []), None)
+        self.assertTrue(callable(self.db.lmpop))
+
+
 class TestRedisSetCommands(TestTornadoRedis):
     '''
     Test the set of 'set' commands as defined by the redis docs at :http://redis.io/commands#set
@@ -833,10 +998,10 @@ class TestRedisSortedSetCommands(TestTornadoRedis):
     @tracer
     def test_zincrby(self):
         self.db.zadd('key0',5,'value0', self.expect(1))
-        self.db.zincrby('key0',10, 'value0', self.expect(15))
-        self.db.zincrby('key0',-5, 'value0', self.expect(10))
-        self.db.zincrby('key1',5, 'value0', self.expect(5))
-        self.db.zincrby('key1',15, 'value0', self.expect(20, next=self.cleanup))
+        self.db.zincrby('key0',10, 'value0', self.expect(15.0))
+        self.db.zincrby('key0',-5, 'value0', self.expect(10.0))
+        self.db.zincrby('key1',5, 'value0', self.expect(5.0))
+        self.db.zincrby('key1',15, 'value0', self.expect(20.0, next=self.cleanup))
         self.start()
 
     @tracer
@@ -850,13 +1015,13 @@ class TestRedisSortedSetCommands(TestTornadoRedis):
         self.db.zadd('key1',5,'value5', self.expect(1))
         self.db.zadd('key1',6,'value6', self.expect(1))
         self.db.zinterstore('out',2,'key0','key1','WEIGHTS',2,3,self.expect(2))
-        self.db.zrange('out',0, -1, 'WITHSCORES', self.expect(['value3',15, 'value4',20]))
+        self.db.zrange('out',0, -1, 'WITHSCORES', self.expect([('value3', 15.0), ('value4', 20.0)]))
         self.db.zinterstore('out',2,'key0','key1',self.expect(2))
-        self.db.zrange('out',0, -1, 'WITHSCORES', self.expect(['value3',6, 'value4',8]))
+        self.db.zrange('out',0, -1, 'WITHSCORES', self.expect([('value3', 6.0), ('value4', 8.0)]))
         self.db.zinterstore('out',2,'key0','key1','WEIGHTS',2,3,'AGGREGATE','MIN',self.expect(2))
-        self.db.zrange('out',0, -1, 'WITHSCORES', self.expect(['value3',6, 'value4',8]))
+        self.db.zrange('out',0, -1, 'WITHSCORES', self.expect([('value3', 6.0), ('value4', 8.0)]))
         self.db.zinterstore('out',2,'key0','key1','WEIGHTS',2,3,'AGGREGATE','MAX',self.expect(2))
-        self.db.zrange('out',0, -1, 'WITHSCORES', self.expect(['value3',9, 'value4',12], next=self.cleanup))
+        self.db.zrange('out',0, -1, 'WITHSCORES', self.expect([('value3', 9.0), ('value4', 12.0)], next=self.cleanup))
         self.start()
 
     @tracer
@@ -867,7 +1032,7 @@ class TestRedisSortedSetCommands(TestTornadoRedis):
         self.db.zadd('key0',4,'value4', self.expect(1))
         self.db.zrange('key0', 0, -1, self.expect(['value1','value2','value3','value4']))
         self.db.zrange('key0',-2,-1, self.expect(['value3','value4']))
-        self.db.zrange('key0',0,-1,'WITHSCORES', self.expect(['value1',1,'value2',2,'value3',3,'value4',4], next=self.cleanup))
+        self.db.zrange('key0',0,-1,'WITHSCORES', self.expect([('value1', 1.0), ('value2', 2.0), ('value3', 3.0), ('value4', 4.0)], next=self.cleanup))
         self.start()
 
     @tracer
@@ -941,7 +1106,7 @@ class TestRedisSortedSetCommands(TestTornadoRedis):
         self.db.zadd('key0',4,'value4', self.expect(1))
         self.db.zrange('key0', 0, -1, self.expect(['value4','value3','value2','value1']))
         self.db.zrange('key0',-2,-1, self.expect(['value3','value4']))
-        self.db.zrange('key0',0,-1,'WITHSCORES', self.expect(['value4',4,'value3',3,'value2',2,'value1',1], next=self.cleanup))
+        self.db.zrange('key0',0,-1,'WITHSCORES', self.expect([('value4', 4.0), ('value3', 3.0), ('value2', 2.0), ('value1', 1.0)], next=self.cleanup))
         self.start()
 
     @tracer
@@ -962,7 +1127,7 @@ class TestRedisSortedSetCommands(TestTornadoRedis):
         self.db.zadd('key0',2,'value2', self.expect(1))
         self.db.zadd('key0',3,'value3', self.expect(1))
         self.db.zadd('key0',4,'value4', self.expect(1))
-        self.db.zscore('key0','value3', self.expect(3, next=self.cleanup))
+        self.db.zscore('key0','value3', self.expect(3.0, next=self.cleanup))
         self.start()
 
     @tracer
@@ -976,15 +1141,27 @@ class TestRedisSortedSetCommands(TestTornadoRedis):
         self.db.zadd('key1',5,'value5', self.expect(1))
         self.db.zadd('key1',6,'value6', self.expect(1))
         self.db.zunionstore('out',2,'key0','key1','WEIGHTS',2,3,self.expect(6))
-        self.db.zrange('out',0, -1, 'WITHSCORES', self.expect(['value1',2,'value2',4,'value3',15, 'value4',20,'value5',15,'value6',18]))
+        self.db.zrange('out',0, -1, 'WITHSCORES', self.expect([('value1', 2.0), ('value2', 4.0), ('value3', 15.0), ('value4', 20.0), ('value5', 15.0), ('value6', 18.0)]))
         self.db.zunionstore('out',2,'key0','key1',self.expect(6))
-        self.db.zrange('out',0, -1, 'WITHSCORES', self.expect(['value1',1,'value2',2,'value3',6, 'value4',8,'value5',5,'value6',6]))
+        self.db.zrange('out',0, -1, 'WITHSCORES', self.expect([('value1', 1.0), ('value2', 2.0), ('value3', 6.0), ('value4', 8.0), ('value5', 5.0), ('value6', 6.0)]))
         self.db.zunionstore('out',2,'key0','key1','WEIGHTS',2,3,'AGGREGATE','MIN',self.expect(6))
-        self.db.zrange('out',0, -1, 'WITHSCORES', self.expect(['value1',2,'value2',4,'value3',6, 'value4',8,'value5',15,'value6',18]))
+        self.db.zrange('out',0, -1, 'WITHSCORES', self.expect([('value1', 2.0), ('value2', 4.0), ('value3', 6.0), ('value4', 8.0), ('value5', 15.0), ('value6', 18.0)]))
         self.db.zunionstore('out',2,'key0','key1','WEIGHTS',2,3,'AGGREGATE','MAX',self.expect(6))
-        self.db.zrange('out',0, -1, 'WITHSCORES', self.expect(['value1',2,'value2',4,'value3',9, 'value4',12,'value5',15,'value6',18], next=self.cleanup))
+        self.db.zrange('out',0, -1, 'WITHSCORES', self.expect([('value1', 2.0), ('value2', 4.0), ('value3', 9.0), ('value4', 12.0), ('value5', 15.0), ('value6', 18.0)], next=self.cleanup))
+        self.start()
+
+    @tracer
+    def test_zrevrangebyscore(self):
+        self.db.zadd('key0', 1, 'value1', self.expect(1))
+        self.db.zadd('key0', 2, 'value2', self.expect(1))
+        self.db.zadd('key0', 3, 'value3', 4, 'value4', self.expect(2))
+        self.db.zrevrangebyscore('key0', 3, '(1', self.expect(['value3', 'value2']))
+        self.db.zrevrangebyscore('key0', '+inf', 3, 'WITHSCORES', self.expect([('value4', 4.0), ('value3', 3.0)]))
+        self.db.zpopmax('key0', self.expect([('value4', 4.0)]))
+        self.db.zmscore('key0', 'value1', 'missing', self.expect([1.0, None], next=self.cleanup))
         self.start()
 
+
 class TestRedisConnectionCommands(TestTornadoRedis):
     '''
     Test the set of 'connection' commands as defined by the redis docs at :http://redis.io/commands#connection
@@ -1008,6 +1185,30 @@ class TestRedisConnectionCommands(TestTornadoRedis):
     #    self.db.quit(expect_close)
     #    self.start()
 
+    @tracer
+    def test_execute_command(self):
+        #None of these are in the command table, their replies are read by type byte
+        self.db.execute_command('SET', 'key0', 'value0', self.expectok())
+        self.db.execute_command('object', 'ENCODING', 'key0', self.expect('embstr'))
+        self.db.execute_command('CONFIG', 'GET', 'maxmemory-policy', self.expect(['maxmemory-policy', 'noeviction']))
+        self.db.execute_command('TOUCH', 'key0', 'key1', self.expect(1))
+        self.db.execute_command('HGETALL', 'missing', self.expect({}))
+        self.db.execute_command('NOSUCHCOMMAND', self.expect(expected_error="ERR unknown command `NOSUCHCOMMAND`, with args beginning with: ", next=self.cleanup))
+        self.start()
+
+    @tracer
+    def test_client_state(self):
+        #Command methods live on the class, instances only carry connection state
+        self.assertFalse(hasattr(self.db, '__dict__'))
+        self.assertEqual(self.db.get.__func__, redis.Redis.get)
+        self.assertEqual(self.db.delete.__name__, 'delete')
+
+        #Converters are shared until a client changes its own
+        other = redis.Redis()
+        self.db.set_response_callback('GET', lambda value, args: 'converted')
+        self.assertNotIn('GET', other._response_callbacks)
+
+
 class TestRedisServerCommands(TestTornadoRedis):
     '''
     Test the set of 'server' commands as defined by the redis docs at :http://redis.io/commands#server
@@ -1029,7 +1230,10 @@ class TestRedisServerCommands(TestTornadoRedis):
         def info_callback(err, val):
             logger.debug(err)
             logger.debug(val)
-            self.assertTrue(True)
+            self.assertEqual(err, None)
+            self.assertIsInstance(val, dict)
+            self.assertIn('redis_version', val)
+            self.assertIsInstance(val['connected_clients'], int)
             self.cleanup()
 
         self.db.info(info_callback)
@@ -1041,14 +1245,15 @@ class TestRedisPubSubCommands(TestTornadoRedis):
     '''
 
     @tracer
-    def publish_thread_cb(self, err, val):
+    def publish_cb(self, err, val):
         logger.debug('published message to %d subscribers'%val)
 
     @tracer
-    def publish_thread(self, channel):
-        self.publish_db = redis.Redis()
+    def publish(self, channel):
+        #Publish from a second client on the same loop, the subscribed one can't issue commands
+        self.publish_db = self.make_client()
         self.publish_db.connect()
-        self.publish_db.publish(channel,'Test Message', self.publish_thread_cb)
+        self.publish_db.publish(channel,'Test Message', self.publish_cb)
 
     @tracer
     def test_subscribe(self):
@@ -1058,7 +1263,7 @@ class TestRedisPubSubCommands(TestTornadoRedis):
             if msg[0] == 'subscribe':
                 logger.debug('successfully subscribed')
 
-                threading.Thread(target=partial(self.publish_thread, 'test')).start()
+                self.publish('test')
 
             elif msg[0] == 'message':
                 self.assertEqual('Test Message', msg[2])
@@ -1079,7 +1284,7 @@ class TestRedisPubSubCommands(TestTornadoRedis):
             if msg[0] == 'psubscribe':
                 logger.debug('successfully subscribed')
 
-                threading.Thread(target=partial(self.publish_thread, 'test.test')).start()
+                self.publish('test.test')
 
             elif msg[0] == 'pmessage':
                 self.assertEqual('Test Message', msg[3])
@@ -1091,6 +1296,2036 @@ class TestRedisPubSubCommands(TestTornadoRedis):
         self.db.psubscribe('test.*', partial(on_message, 'test.*'))
         self.start()
 
+class TestRedisColumnar(TestTornadoRedis):
+    '''
+    Test decoding numeric multi bulk replies straight into arrays
+    '''
+
+    @tracer
+    def test_withscores(self):
+        self.db.zadd('key0', 1.5, 'value0', self.expect(1))
+        self.db.zadd('key0', 2, 'value1', self.expect(1))
+        self.db.zrange('key0', 0, -1, 'WITHSCORES', self.expect((['value0', 'value1'], array('d', [1.5, 2.0]))), columnar=True)
+        self.db.zrangebyscore('key0', 2, '+inf', 'withscores', self.expect((['value1'], array('d', [2.0]))), columnar='d')
+        self.db.zrange('key1', 0, -1, 'WITHSCORES', self.expect(([], array('d'))), columnar=True)
+        self.db.zrevrange('key0', 0, -1, 'WITHSCORES', self.expect([('value1', 2.0), ('value0', 1.5)], next=self.cleanup))
+        self.start()
+
+    @tracer
+    def test_values(self):
+        self.db.mset('key0', 10, 'key1', -3, self.expectok())
+        self.db.mget('key0', 'key1', self.expect(array('q', [10, -3])), columnar='q')
+        self.db.rpush('key2', 1.25, self.expect(1))
+        self.db.rpush('key2', '-inf', self.expect(2))
+        self.db.lrange('key2', 0, -1, self.expect(array('d', [1.25, float('-inf')]), next=self.cleanup), columnar='d')
+        self.start()
+
+    @tracer
+    def test_nil_and_bad_values(self):
+        def check_nan(error, value):
+            self.assertEqual(error, None)
+            self.assertEqual(value[0], 10.0)
+            self.assertTrue(math.isnan(value[1]))
+
+        self.db.set('key0', 10, self.expectok())
+        self.db.set('key1', 'ten', self.expectok())
+        self.db.mget('key0', 'key2', check_nan, columnar='d')
+        self.db.mget('key0', 'key2', self.expect(None, "Unable to decode MGET reply into array('q'): nil element in an integer column"), columnar='q')
+        self.db.mget('key1', 'key0', self.expect(None, "Unable to decode MGET reply into array('d'): could not convert string to float: b'ten'"), columnar='d')
+
+        #The whole reply was consumed, so the connection is still in step
+        self.db.get('key0', self.expect('10', next=self.cleanup))
+        self.start()
+
+    @tracer
+    def test_invalid_options(self):
+        self.assertRaises(TypeError, self.db.get, 'key0', self.expect(None), columnar=True)
+        self.assertRaises(TypeError, self.db.mget, 'key0', self.expect(None), columnar='f')
+        self.assertRaises(TypeError, self.db.mget, 'key0', self.expect(None), use_numpy=True)
+        self.db.dbsize(self.expect(0, next=self.cleanup))
+        self.start()
+
+    @unittest.skipIf(redis.numpy is None, 'NumPy is not installed')
+    @tracer
+    def test_numpy(self):
+        def check(error, value):
+            members, scores = value
+            self.assertEqual(members, ['value0', 'value1'])
+            self.assertEqual(scores.dtype, redis.numpy.float64)
+            self.assertEqual(scores.sum(), 3.5)
+            self.cleanup()
+
+        self.db.zadd('key0', 1.5, 'value0', self.expect(1))
+        self.db.zadd('key0', 2, 'value1', self.expect(1))
+        self.db.zrange('key0', 0, -1, 'WITHSCORES', check, columnar=True, use_numpy=True)
+        self.start()
+
+class TestRedisStreaming(TestTornadoRedis):
+    '''
+    Test delivering multi bulk replies in chunks as they are parsed
+    '''
+
+    @tracer
+    def fill(self, key, count):
+        for i in range(count):
+            self.db.rpush(key, 'value%d' % i, self.expect(i + 1))
+
+    @tracer
+    def test_stream(self):
+        chunks = []
+
+        def check(error, value):
+            self.assertEqual(error, None)
+            self.assertEqual(value, 25)
+            self.assertEqual([len(chunk) for chunk in chunks], [10, 10, 5])
+            self.assertEqual(sum(chunks, []), ['value%d' % i for i in range(25)])
+            self.cleanup()
+
+        self.fill('key', 25)
+        self.db.lrange('key', 0, -1, check, stream=chunks.append, chunk_size=10)
+        self.start()
+
+    @tracer
+    def test_stream_empty(self):
+        chunks = []
+        self.db.smembers('key', self.expect(0), stream=chunks.append)
+        self.db.get('key', self.expect(None, next=self.cleanup))
+        self.start()
+        self.assertEqual(chunks, [])
+
+    @tracer
+    def test_backpressure(self):
+        chunks = []
+        pending = []
+
+        def stream(chunk):
+            chunks.append(chunk)
+            if len(chunks) == 1:
+                pending.append(self.ioloop.asyncio_loop.create_future())
+                self.ioloop.add_timeout(time.time() + 0.1, release)
+                return pending[0]
+
+        def release():
+            #Nothing past the first chunk may have been parsed while the consumer was busy
+            self.assertEqual(len(chunks), 1)
+            pending[0].set_result(None)
+
+        self.fill('key', 6)
+        self.db.lrange('key', 0, -1, self.expect(6), stream=stream, chunk_size=2)
+        self.db.llen('key', self.expect(6, next=self.cleanup))
+        self.start()
+        self.assertEqual(len(chunks), 3)
+
+    @tracer
+    def test_iter_reply(self):
+        received = []
+
+        async def consume():
+            stream = self.db.iter_reply('lrange', 'key', 0, -1, chunk_size=3, max_chunks=1)
+            async for chunk in stream:
+                received.append(chunk)
+            self.assertEqual(stream.count, 7)
+            self.cleanup()
+
+        self.fill('key', 7)
+        self.ioloop.add_callback(consume)
+        self.start()
+        self.assertEqual(received, [['value0', 'value1', 'value2'], ['value3', 'value4', 'value5'], ['value6']])
+
+    @tracer
+    def test_iter_reply_error(self):
+        async def consume():
+            with self.assertRaises(redis.RedisError):
+                async for chunk in self.db.iter_reply('LRANGE', 'key', 0, -1):
+                    pass
+            self.cleanup()
+
+        self.db.set('key', 'value', self.expectok())
+        self.ioloop.add_callback(consume)
+        self.start()
+
+    @tracer
+    def test_invalid_options(self):
+        self.assertRaises(TypeError, self.db.get, 'key', self.expect(None), stream=list.append)
+        self.assertRaises(TypeError, self.db.lrange, 'key', 0, -1, self.expect(None), stream=list.append, columnar=True)
+        self.assertRaises(TypeError, self.db.lrange, 'key', 0, -1, self.expect(None), stream=list.append, chunk_size=0)
+        self.db.dbsize(self.expect(0, next=self.cleanup))
+        self.start()
+
+class TestRedisScan(TestTornadoRedis):
+    '''
+    Test walking SCAN cursors with async iterators
+    '''
+
+    @tracer
+    def consume(self, iterator, check):
+        async def run():
+            check([item async for item in iterator])
+            self.cleanup()
+
+        self.ioloop.add_callback(run)
+
+    @tracer
+    def test_scan(self):
+        def check(value, expected):
+            cursor, keys = value
+            self.assertEqual(cursor, 0)
+            self.assertEqual(sorted(keys), ['key0', 'key1'])
+
+        self.db.set('key0', 'value0', self.expectok())
+        self.db.set('key1', 'value1', self.expectok())
+        self.db.scan(0, 'COUNT', 100, self.expect(next=self.cleanup, assertFunc=check))
+        self.start()
+
+    @tracer
+    def test_scan_iter(self):
+        def check(keys):
+            self.assertEqual(sorted(keys), sorted('key%d' % i for i in range(50)))
+
+        for i in range(50):
+            self.db.set('key%d' % i, i, self.expectok())
+        self.consume(self.db.scan_iter(count=10), check)
+        self.start()
+
+    @tracer
+    def test_scan_iter_match(self):
+        def check(keys):
+            self.assertEqual(sorted(keys), ['a1', 'a2'])
+
+        for key in ('a1', 'a2', 'b1'):
+            self.db.set(key, 'value', self.expectok())
+        self.consume(self.db.scan_iter(match='a*', count=1, prefetch=True), check)
+        self.start()
+
+    @tracer
+    def test_sscan_iter(self):
+        def check(members):
+            self.assertEqual(sorted(members), sorted('member%d' % i for i in range(300)))
+            self.assertEqual(len(members), len(set(members)))
+
+        for i in range(300):
+            self.db.sadd('key', 'member%d' % i, self.expect(1))
+        self.consume(self.db.sscan_iter('key', count=20, prefetch=True, dedupe=True), check)
+        self.start()
+
+    @tracer
+    def test_hscan_iter(self):
+        def check(items):
+            self.assertEqual(dict(items), {'field0': 'value0', 'field1': 'value1'})
+
+        self.db.hset('key', 'field0', 'value0', self.expect(1))
+        self.db.hset('key', 'field1', 'value1', self.expect(1))
+        self.consume(self.db.hscan_iter('key'), check)
+        self.start()
+
+    @tracer
+    def test_zscan_iter(self):
+        def check(items):
+            self.assertEqual(sorted(items), [('member0', 1.5), ('member1', 2.0)])
+
+        self.db.zadd('key', 1.5, 'member0', self.expect(1))
+        self.db.zadd('key', 2, 'member1', self.expect(1))
+        self.consume(self.db.zscan_iter('key'), check)
+        self.start()
+
+    @tracer
+    def test_scan_iter_empty(self):
+        def check(members):
+            self.assertEqual(members, [])
+
+        self.consume(self.db.sscan_iter('key', prefetch=True), check)
+        self.start()
+
+    @tracer
+    def test_scan_iter_error(self):
+        async def run():
+            with self.assertRaises(redis.RedisError):
+                async for item in self.db.sscan_iter('key'):
+                    pass
+            self.cleanup()
+
+        self.db.set('key', 'value', self.expectok())
+        self.ioloop.add_callback(run)
+        self.start()
+
+class TestRedisQueue(TestTornadoRedis):
+    '''
+    Test the bounded command queue
+    '''
+
+    queue_policy = 'fail'
+
+    def make_client(self):
+        return redis.Redis(transport=self.make_transport(), decode_responses=self.decode_responses,
+                           queue_size=3, queue_low_watermark=1, queue_policy=self.queue_policy)
+
+    @tracer
+    def setUp(self):
+        super().setUp()
+
+        #Start every test with nothing queued
+        self.db.ping(self.expect('PONG', next=self.stop))
+        self.start()
+
+    @tracer
+    def fill(self, count):
+        #The first command goes straight out, the rest wait in the queue
+        for i in range(count):
+            self.db.set('key%d' % i, 'value%d' % i, self.expectok())
+
+    @tracer
+    def test_fail_when_full(self):
+        def check():
+            stats = self.db.queue_stats()
+            self.assertEqual(stats['rejected'], 1)
+            self.assertEqual(stats['max_depth'], 3)
+            self.assertEqual(stats['depth'], 0)
+            self.db.exists('key4', self.expect(False, next=self.cleanup))
+
+        self.fill(4)
+        self.assertEqual(self.db.queue_stats()['depth'], 3)
+        self.assertTrue(self.db.queue_stats()['full'])
+
+        self.db.set('key4', 'value4', self.expect(expected_error='ERR command queue is full, SET was not sent'))
+        self.db.wait_for_room().add_done_callback(lambda future: self.db.ping(self.expect('PONG', next=check)))
+        self.start()
+
+    @tracer
+    def test_wait_for_room(self):
+        depths = []
+
+        async def produce():
+            for i in range(10):
+                await self.db.wait_for_room()
+                self.db.rpush('key', i, self.expect(i + 1))
+                depths.append(self.db.queue_stats()['depth'])
+
+            await self.db.wait_for_room()
+            self.db.llen('key', self.expect(10, next=self.cleanup))
+
+        self.ioloop.add_callback(produce)
+        self.start()
+        self.assertTrue(max(depths) <= 3)
+        self.assertEqual(self.db.queue_stats()['rejected'], 0)
+
+    @tracer
+    def test_invalid_options(self):
+        self.assertRaises(TypeError, redis.Redis, queue_size=0)
+        self.assertRaises(TypeError, redis.Redis, queue_size=2, queue_low_watermark=2)
+        self.assertRaises(TypeError, redis.Redis, queue_size=2, queue_policy='drop')
+        self.db.dbsize(self.expect(0, next=self.cleanup))
+        self.start()
+
+class TestRedisQueueShed(TestRedisQueue):
+    '''
+    Test shedding the oldest waiting command when the queue is full
+    '''
+
+    queue_policy = 'shed'
+
+    @tracer
+    def test_fail_when_full(self):
+        pass
+
+    @tracer
+    def test_shed_oldest(self):
+        def check():
+            self.assertEqual(self.db.queue_stats()['shed'], 2)
+            self.db.mget('key0', 'key1', 'key2', 'key3', 'key4', 'key5',
+                         self.expect(['value0', None, None, 'value3', 'value4', 'value5'], next=self.cleanup))
+
+        dropped = self.expect(expected_error='ERR command queue is full, SET was not sent')
+        self.db.set('key0', 'value0', self.expectok())
+        self.db.set('key1', 'value1', dropped)
+        self.db.set('key2', 'value2', dropped)
+        self.db.set('key3', 'value3', self.expectok())
+        self.db.set('key4', 'value4', self.expectok())
+        self.db.set('key5', 'value5', self.expectok())
+        self.db.wait_for_room().add_done_callback(lambda future: self.db.ping(self.expect('PONG', next=check)))
+        self.start()
+
+class TestRedisWriteFlow(TestTornadoRedis):
+    '''
+    Test pausing producers while too many command bytes are outstanding
+    '''
+
+    def make_client(self):
+        return redis.Redis(transport=self.make_transport(), decode_responses=self.decode_responses,
+                           write_buffer_limit=4096, write_buffer_low_watermark=1024)
+
+    @tracer
+    def test_pause_and_resume(self):
+        value = 'x' * 1000
+
+        def check():
+            stats = self.db.write_buffer_stats()
+            self.assertEqual(stats['pending_bytes'], 0)
+            self.assertEqual(stats['pauses'], 1)
+            self.assertTrue(stats['max_pending_bytes'] >= 5000)
+            self.db.llen('key', self.expect(5, next=self.cleanup))
+
+        for i in range(5):
+            self.db.rpush('key', value, self.expect(i + 1))
+
+        self.assertFalse(self.db.writable())
+        self.assertTrue(self.db.write_buffer_stats()['paused'])
+        self.db.wait_writable().add_done_callback(lambda future: self.db.ping(self.expect('PONG', next=check)))
+        self.start()
+
+    @tracer
+    def test_throttled_producer(self):
+        async def produce():
+            for i in range(50):
+                await self.db.wait_writable()
+                self.assertTrue(self.db.write_buffer_stats()['pending_bytes'] < 4096)
+                self.db.rpush('key', 'x' * 500, self.expect(i + 1))
+            self.db.llen('key', self.expect(50, next=self.cleanup))
+
+        self.ioloop.add_callback(produce)
+        self.start()
+        self.assertTrue(self.db.write_buffer_stats()['pauses'] > 0)
+
+    @tracer
+    def test_invalid_options(self):
+        self.assertRaises(TypeError, redis.Redis, write_buffer_limit=0)
+        self.assertRaises(TypeError, redis.Redis, write_buffer_limit=10, write_buffer_low_watermark=10)
+        self.assertRaises(TypeError, redis.Redis, write_buffer_low_watermark=10)
+        self.db.dbsize(self.expect(0, next=self.cleanup))
+        self.start()
+
+class TestRedisMetrics(TestTornadoRedis):
+    '''
+    Test the per command metrics
+    '''
+
+    def make_client(self):
+        self.metrics = metrics.ClientMetrics()
+        return redis.Redis(transport=self.make_transport(), decode_responses=self.decode_responses, metrics=self.metrics)
+
+    @tracer
+    def test_command_metrics(self):
+        def check():
+            snapshot = self.metrics.snapshot()
+            self.assertEqual(snapshot['connects'], 1)
+            self.assertEqual(snapshot['in_flight'], 0)
+            self.assertEqual(snapshot['queued'], 0)
+
+            get = snapshot['commands']['GET']
+            self.assertEqual(get['count'], 3)
+            self.assertEqual(get['errors'], 1)
+            self.assertEqual(get['bytes_out'], 3 * len(b'*2\r\n$3\r\nGET\r\n$4\r\nkey0\r\n'))
+            #'$6\r\nvalue0\r\n', '$-1\r\n' and the WRONGTYPE error
+            self.assertEqual(get['bytes_in'], 12 + 5 + len(b'-WRONGTYPE Operation against a key holding the wrong kind of value\r\n'))
+            self.assertEqual(get['round_trip']['count'], 3)
+            self.assertEqual(get['queue_wait']['count'], 3)
+            self.assertTrue(0 < get['round_trip']['p50'] <= get['round_trip']['max'])
+
+            self.assertEqual(snapshot['commands']['SELECT']['count'], 1)
+            self.cleanup()
+
+        self.db.set('key0', 'value0', self.expectok())
+        self.db.rpush('key2', 'value', self.expect(1))
+        self.db.get('key0', self.expect('value0'))
+        self.db.get('key1', self.expect(None))
+        self.db.get('key2', self.expect(expected_error='WRONGTYPE Operation against a key holding the wrong kind of value', next=check))
+        self.start()
+
+    @tracer
+    def test_reconnects(self):
+        #A second client sharing the metrics, so the test's own connection stays up
+        other = redis.Redis(transport=self.make_transport(), metrics=self.metrics)
+
+        def reconnect(error, value):
+            other.disconnect()
+            other.connect()
+            other.ping(self.expect(b'PONG', next=check))
+
+        def check():
+            snapshot = self.metrics.snapshot()
+            self.assertEqual(snapshot['connects'], 3)
+            self.assertEqual(snapshot['reconnects'], 1)
+            other.disconnect()
+            self.cleanup()
+
+        other.connect()
+        other.ping(reconnect)
+        self.start()
+
+    @tracer
+    def test_prometheus(self):
+        def check():
+            sink = metrics.PrometheusSink()
+            self.metrics.report(sink)
+            self.assertIn('# TYPE redis_client_round_trip_seconds summary', sink.text)
+            self.assertIn('redis_client_commands_total{command="PING"} 1', sink.text)
+            self.assertIn('redis_client_round_trip_seconds_count{command="PING"} 1', sink.text)
+            self.assertIn('redis_client_round_trip_seconds{command="PING",quantile="0.99"} ', sink.text)
+            self.assertIn('redis_client_in_flight 0', sink.text)
+            self.cleanup()
+
+        self.db.ping(self.expect('PONG', next=check))
+        self.start()
+
+class TestMetrics(unittest.TestCase):
+    '''
+    Test the histograms and sinks without a server
+    '''
+
+    def test_histogram(self):
+        histogram = metrics.Histogram()
+        for i in range(1, 10001):
+            histogram.record(i / 1000000.0)
+
+        self.assertEqual(histogram.count, 10000)
+        self.assertEqual(histogram.min, 1)
+        self.assertEqual(histogram.max, 10000)
+        for quantile in (0.5, 0.9, 0.99):
+            expected = quantile * 10000 / 1000000.0
+            self.assertAlmostEqual(histogram.percentile(quantile), expected, delta=expected * 0.04)
+        self.assertEqual(histogram.percentile(1), 0.01)
+
+    def test_histogram_small_values_exact(self):
+        histogram = metrics.Histogram()
+        for value in (0, 5, 5, 63):
+            histogram.record(value / 1000000.0)
+        self.assertEqual(histogram.percentile(0.5), 0.000005)
+        self.assertEqual(histogram.percentile(1), 0.000063)
+
+    def test_statsd(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.bind(('127.0.0.1', 0))
+        server.settimeout(5)
+
+        client_metrics = metrics.ClientMetrics()
+        client_metrics.command_queued()
+        client_metrics.command_sent('GET', 0.001, 20)
+        client_metrics.command_done('GET', 0.002, 10, False)
+
+        sink = metrics.StatsdSink('127.0.0.1', server.getsockname()[1], prefix='app')
+        client_metrics.report(sink)
+        lines = server.recv(65536).decode('ascii').split('\n')
+        self.assertIn('app.command.get.count:1|c', lines)
+        self.assertIn('app.command.get.bytes_in:10|c', lines)
+        self.assertIn('app.command.get.round_trip.p99:2.000|g', lines)
+        self.assertIn('app.in_flight:0|g', lines)
+
+        #Counters are pushed as the change since the last push
+        client_metrics.command_queued()
+        client_metrics.command_sent('GET', 0.001, 20)
+        client_metrics.command_done('GET', 0.002, 10, False)
+        client_metrics.report(sink)
+        lines = server.recv(65536).decode('ascii').split('\n')
+        self.assertIn('app.command.get.count:1|c', lines)
+
+        sink.close()
+        server.close()
+
+    def test_lanes(self):
+        client_metrics = metrics.ClientMetrics()
+        for lane in ('interactive', 'bulk', 'bulk', 'bulk'):
+            client_metrics.command_queued(lane)
+        client_metrics.command_sent('GET', 0.001, 20, 'interactive')
+        client_metrics.command_sent('SET', 0.004, 20, 'bulk')
+        client_metrics.command_dropped('SET', 'bulk')
+
+        snapshot = client_metrics.snapshot()
+        self.assertEqual(snapshot['queued'], 1)
+        self.assertEqual(snapshot['lanes']['interactive']['queued'], 0)
+        bulk = snapshot['lanes']['bulk']
+        self.assertEqual((bulk['queued'], bulk['sent'], bulk['dropped']), (1, 1, 1))
+        self.assertEqual(bulk['queue_wait']['max'], 0.004)
+
+        text = metrics.prometheus_text(snapshot)
+        self.assertIn('redis_client_lane_queued{lane="bulk"} 1', text)
+        self.assertIn('redis_client_lane_dropped_total{lane="bulk"} 1', text)
+        self.assertIn('redis_client_lane_queue_wait_seconds_count{lane="interactive"} 1', text)
+
+        lines = metrics.StatsdSink(prefix='app').lines(snapshot)
+        self.assertIn('app.lane.bulk.queued:1|g', lines)
+        self.assertIn('app.lane.bulk.sent:1|c', lines)
+        self.assertIn('app.lane.interactive.queue_wait.p99:1.000|g', lines)
+
+class TestRedisSlowLog(TestTornadoRedis):
+    '''
+    Test the client side slow command log
+    '''
+
+    def make_client(self):
+        self.slowlog = slowlog.SlowLog(threshold=0.05, max_entries=2, max_args=2, max_arg_length=4)
+        return redis.Redis(transport=self.make_transport(), decode_responses=self.decode_responses, slowlog=self.slowlog)
+
+    @tracer
+    def test_server_slowness(self):
+        def check():
+            entries = self.slowlog.get()
+            self.assertEqual(len(entries), 1)
+
+            entry = entries[0]
+            self.assertEqual(entry['command'], 'DEBUG')
+            self.assertEqual(entry['args'], ['SLEE...', 0.1])
+            self.assertEqual(entry['key'], None)
+            self.assertTrue(entry['round_trip'] >= 0.1)
+            self.assertTrue(entry['queue_wait'] < 0.05)
+            self.assertEqual(entry['reply_bytes'], len(b'+OK\r\n'))
+            self.assertEqual(entry['connection'], self.db.connection_id)
+            self.cleanup()
+
+        def fast():
+            #Sent after the sleep, so not held up behind it
+            self.db.get('key0', self.expect('value0', next=check))
+
+        self.db.set('key0', 'value0', self.expectok())
+        self.db.execute_command('DEBUG', 'SLEEP', 0.1, self.expectok(next=fast))
+        self.start()
+
+    @tracer
+    def test_client_slowness(self):
+        def stall(error, value):
+            #An IOLoop callback hogging the loop delays every command queued behind it
+            time.sleep(0.1)
+
+        def check():
+            entries = self.slowlog.get()
+            self.assertEqual(len(entries), 2)
+
+            #Newest first, long arguments cut short
+            self.assertEqual(entries[0]['command'], 'MGET')
+            self.assertEqual(entries[0]['args'], ['long...', 'key1', '... (1 more arguments)'])
+            self.assertEqual(entries[0]['key'], 'long...')
+            self.assertTrue(entries[0]['queue_wait'] >= 0.1)
+            self.assertTrue(entries[0]['reply_bytes'] > 0)
+            self.assertEqual(entries[1]['command'], 'SET')
+            self.assertTrue(entries[0]['id'] > entries[1]['id'])
+            self.assertEqual(len(self.slowlog.get(1)), 1)
+
+            self.slowlog.reset()
+            self.assertEqual(len(self.slowlog), 0)
+            self.cleanup()
+
+        self.db.ping(stall)
+        self.db.set('key0', 'value0', self.expectok())
+        self.db.mget('longkey', 'key1', 'key2', self.expect([None, None, None], next=check))
+        self.start()
+
+class TestRedisProfiler(TestTornadoRedis):
+    '''
+    Test attributing loop time to parsing, encoding and callbacks
+    '''
+
+    def make_client(self):
+        self.profiler = profiler.LoopProfiler(callback_budget=0.02, log_level=None)
+        return redis.Redis(transport=self.make_transport(), decode_responses=self.decode_responses, profiler=self.profiler)
+
+    @tracer
+    def test_report(self):
+        def slow_callback(error, value):
+            time.sleep(0.05)
+
+        def check():
+            report = self.profiler.report()
+            self.assertTrue(0 < report['loop_share'] <= 1)
+            self.assertTrue(report['client_time'] >= 0.05)
+            self.assertTrue(report['parse']['count'] >= 4)
+            #SELECT, FLUSHDB, SET, GET and both PINGs
+            self.assertEqual(report['encode']['count'], 6)
+
+            slowest = report['callbacks'][0]
+            self.assertEqual(slowest['command'], 'GET')
+            self.assertIn('slow_callback', slowest['site'])
+            self.assertEqual(slowest['over_budget'], 1)
+            self.assertTrue(slowest['total'] >= 0.05)
+            self.assertTrue(report['parse']['total'] < slowest['total'])
+
+            self.profiler.reset()
+            self.assertEqual(self.profiler.report()['callbacks'], [])
+            self.cleanup()
+
+        self.db.set('key0', 'value0', self.expectok())
+        self.db.get('key0', slow_callback)
+        self.db.ping(self.expect('PONG', next=lambda: self.db.ping(self.expect('PONG', next=check))))
+        self.start()
+
+    @tracer
+    def test_call_site(self):
+        def named(error, value):
+            pass
+
+        self.assertIn('named', profiler.call_site(partial(named, None)))
+        self.assertIn('tests.py', profiler.call_site(named))
+        self.assertIn('TestTornadoRedis.stop', profiler.call_site(self.stop))
+        self.db.dbsize(self.expect(0, next=self.cleanup))
+        self.start()
+
+class TestCommandQueue(unittest.TestCase):
+    '''
+    Test the command queue's watermarks on their own
+    '''
+
+    def test_watermarks(self):
+        loop = asyncio.new_event_loop()
+        queue = CommandQueue(4, 1, loop=loop)
+
+        for i in range(4):
+            self.assertEqual(queue.push(i), None)
+        self.assertTrue(queue.full())
+        self.assertEqual(queue.push(4), 4)
+
+        waiter = queue.wait_for_room()
+        self.assertEqual([queue.pop(), queue.pop()], [0, 1])
+        self.assertFalse(waiter.done())
+
+        #Room only opens up again at the low watermark
+        self.assertEqual(queue.pop(), 2)
+        self.assertTrue(waiter.done())
+        self.assertFalse(queue.full())
+        self.assertTrue(queue.wait_for_room().done())
+        self.assertEqual(queue.stats()['rejected'], 1)
+        loop.close()
+
+    def test_unbounded(self):
+        queue = CommandQueue()
+        for i in range(1000):
+            self.assertEqual(queue.push(i), None)
+        self.assertFalse(queue.full())
+        self.assertEqual(len(queue), 1000)
+        self.assertEqual(queue.pop(), 0)
+
+class TestLaneQueue(unittest.TestCase):
+    '''
+    Test the priority lanes' scheduling on their own
+    '''
+
+    def test_weights(self):
+        queue = LaneQueue([('interactive', 3), ('bulk', 1)])
+        for i in range(4):
+            queue.push(('SET', i), 'bulk')
+        for i in range(6):
+            queue.push(('GET', i))
+        self.assertEqual(len(queue), 10)
+
+        popped = [queue.pop() for i in range(10)]
+        self.assertEqual([cmd for cmd, i in popped], ['GET'] * 3 + ['SET'] + ['GET'] * 3 + ['SET'] * 3)
+        #Each lane stays in order
+        self.assertEqual([i for cmd, i in popped if cmd == 'SET'], [0, 1, 2, 3])
+        self.assertEqual(len(queue), 0)
+
+        #A lane on its own gets every turn
+        for i in range(5):
+            queue.push(('SET', i), 'bulk')
+        self.assertEqual([queue.pop() for i in range(5)], [('SET', i) for i in range(5)])
+
+    def test_transaction(self):
+        queue = LaneQueue([('interactive', 1), ('bulk', 1)])
+        queue.push(('SET', 0), 'bulk')
+        queue.push(('SET', 1), 'bulk')
+        queue.push(('GET', 0))
+        queue.push(('MULTI',))
+        queue.push(('INCR', 0))
+        self.assertEqual([queue.pop(), queue.pop()], [('GET', 0), ('SET', 0)])
+
+        #Nothing from another lane until the transaction is through, even while it waits for EXEC
+        self.assertEqual([queue.pop(), queue.pop(), queue.pop()], [('MULTI',), ('INCR', 0), None])
+        queue.push(('EXEC',))
+        self.assertEqual([queue.pop(), queue.pop()], [('EXEC',), ('SET', 1)])
+
+    def test_front(self):
+        queue = LaneQueue([('interactive', 1), ('bulk', 1)])
+        queue.push(('SET', 0), 'bulk')
+        queue.push_front(('SELECT', 1))
+        self.assertEqual([queue.pop(), queue.pop()], [('SELECT', 1), ('SET', 0)])
+
+    def test_bounds(self):
+        queue = LaneQueue([('interactive', 1), ('bulk', 1)], max_size=2)
+        self.assertIsNone(queue.push(('SET', 0), 'bulk'))
+        self.assertIsNone(queue.push(('SET', 1), 'bulk'))
+        self.assertEqual(queue.push(('SET', 2), 'bulk'), ('SET', 2))
+        self.assertTrue(queue.full('bulk'))
+
+        #A full bulk lane doesn't turn interactive commands away
+        self.assertFalse(queue.full())
+        self.assertIsNone(queue.push(('GET', 0)))
+
+        stats = queue.stats()
+        self.assertEqual((stats['depth'], stats['enqueued'], stats['rejected'], stats['full']), (3, 3, 1, True))
+        self.assertEqual((stats['lanes']['bulk']['depth'], stats['lanes']['bulk']['rejected']), (2, 1))
+        self.assertEqual((stats['lanes']['interactive']['depth'], stats['lanes']['interactive']['weight']), (1, 1))
+
+    def test_priorities(self):
+        for priorities in ([], [('bulk', 0)], [('bulk', 1.5)], ['bulk'], [('bulk', 1), ('bulk', 2)]):
+            self.assertRaises(TypeError, LaneQueue, priorities)
+
+class FakeServerMixin(object):
+    '''
+    Run a test case against the in-process fake server instead of redis on :6379
+    '''
+
+    unix_socket = False
+
+    def setUp(self):
+        self.server = fakeserver.FakeRedisServer()
+        if self.unix_socket:
+            self.path = self.server.listen_unix(os.path.join(tempfile.mkdtemp(), 'redis.sock'))
+        else:
+            self.port = self.server.listen_tcp()
+        super(FakeServerMixin, self).setUp()
+
+    def tearDown(self):
+        super(FakeServerMixin, self).tearDown()
+        self.server.stop()
+        self.server.drop_connections()
+        if self.unix_socket:
+            os.unlink(self.path)
+
+    def client_options(self):
+        if self.unix_socket:
+            return {'unix_socket_path': self.path}
+        return {'host': '127.0.0.1', 'port': self.port}
+
+    def make_client(self):
+        return redis.Redis(transport=self.make_transport(), decode_responses=self.decode_responses, **self.client_options())
+
+class TestFakeServer(FakeServerMixin, TestTornadoRedis):
+    '''
+    Test the client's parser and reconnects against faults injected by the fake server
+    '''
+
+    @tracer
+    def test_commands(self):
+        self.db.set('key', 'value', self.expectok())
+        self.db.get('key', self.expect('value'))
+        self.db.hset('hash', 'a', 1, 'b', 2, self.expect(2))
+        self.db.hgetall('hash', self.expect({'a': '1', 'b': '2'}))
+        self.db.rpush('list', 'a', 'b', 'c', self.expect(3))
+        self.db.lrange('list', 0, -2, self.expect(['a', 'b']))
+        self.db.zadd('zset', 1, 'a', 2.5, 'b', self.expect(2))
+        self.db.zrange('zset', 0, -1, 'WITHSCORES', self.expect([('a', 1.0), ('b', 2.5)]))
+        self.db.incr('counter', self.expect(1))
+        self.db.get('hash', self.expect(expected_error='WRONGTYPE Operation against a key holding the wrong kind of value'))
+        self.db.execute_command('NOPE', self.expect(expected_error="ERR unknown command 'nope'", next=self.cleanup))
+        self.start()
+
+    @tracer
+    def test_partial_writes(self):
+        #Every byte of a reply arrives in a read of its own
+        self.server.chunk_size = 1
+        self.db.rpush('list', 'a', 'bb', '', self.expect(3))
+        self.db.lrange('list', 0, -1, self.expect(['a', 'bb', '']))
+        self.db.hset('hash', 'field', 'value\r\nwith a line break', self.expect(1))
+        self.db.hgetall('hash', self.expect({'field': 'value\r\nwith a line break'}))
+        self.db.get('missing', self.expect(None))
+        self.db.incr('list', self.expect(expected_error='WRONGTYPE Operation against a key holding the wrong kind of value', next=self.cleanup))
+        self.start()
+
+    @tracer
+    def test_large_replies(self):
+        def fill():
+            #Seeded once setUp's FLUSHDB has run
+            self.server.fill('big', 8 * 1024 * 1024, db=11)
+            self.server.fill_list('long', 20000, db=11)
+            self.server.chunk_size = 64 * 1024
+
+        def check_length(length):
+            return lambda received, expected: self.assertEqual(len(received), length)
+
+        self.db.ping(self.expect('PONG', next=fill))
+        self.db.get('big', self.expect(assertFunc=check_length(8 * 1024 * 1024)))
+        self.db.lrange('long', 0, -1, self.expect([], next=self.cleanup, assertFunc=check_length(20000)))
+        self.start()
+
+    @tracer
+    def test_latency(self):
+        self.server.latency = lambda cmd, args: 0.2 if cmd == 'GET' else 0
+        started = time.monotonic()
+
+        def check():
+            self.assertGreaterEqual(time.monotonic() - started, 0.2)
+            self.cleanup()
+
+        self.db.get('key', self.expect(None))
+        self.db.ping(self.expect('PONG', next=check))
+        self.start()
+
+    @tracer
+    def test_dropped_connection(self):
+        other = redis.Redis(transport=self.make_transport(), decode_responses=True, **self.client_options())
+
+        def reconnect():
+            self.server.drop_after = None
+            other.connect()
+
+        def check():
+            self.assertEqual(self.server.connections_made, 3)
+            other.disconnect()
+            self.cleanup()
+
+        def drop():
+            self.server.drop_after = 2
+
+        def run():
+            other.connect(reconnect)
+            other.set('key', 'value', self.expectok(next=drop))
+
+            #The command in flight fails, the one queued behind it goes out on the new connection
+            other.get('key', self.expect(expected_error='ERR connection closed before the reply to GET arrived'))
+            other.get('key', self.expect('value', next=check))
+
+        #Once the test's own connection is done with setUp, it sends nothing until the drops are over
+        self.db.ping(self.expect('PONG', next=run))
+        self.start()
+
+    @tracer
+    def test_select_on_connect(self):
+        other = redis.Redis(db=5, transport=self.make_transport(), **self.client_options())
+
+        def reconnect():
+            other.disconnect()
+            other.connect()
+            other.set('key2', 'value', self.expect(b'OK', next=check))
+
+        def check():
+            #Both connections started on database 0 and selected 5 first
+            self.assertEqual(sorted(self.server.database(5)), [b'key1', b'key2'])
+            other.disconnect()
+            self.cleanup()
+
+        other.connect()
+        other.set('key1', 'value', self.expect(b'OK', next=reconnect))
+        self.start()
+
+class TestFakeServerUnix(TestFakeServer):
+    '''
+    Run the fake server tests over a Unix socket
+    '''
+
+    unix_socket = True
+
+class TestFakeServerPubSub(FakeServerMixin, TestRedisPubSubCommands):
+    pass
+
+class TestRedisUrl(unittest.TestCase):
+    '''
+    Test parsing redis URLs into client options
+    '''
+
+    def test_tcp(self):
+        self.assertEqual(redis.parse_url('redis://'), {'host': 'localhost', 'port': 6379})
+        self.assertEqual(redis.parse_url('redis://cache:7000/3'), {'host': 'cache', 'port': 7000, 'db': 3})
+        self.assertEqual(redis.parse_url('redis://cache?db=4'), {'host': 'cache', 'port': 6379, 'db': 4})
+
+    def test_unix(self):
+        self.assertEqual(redis.parse_url('redis+unix:///run/redis.sock?db=2'), {'unix_socket_path': '/run/redis.sock', 'db': 2})
+        self.assertEqual(redis.parse_url('unix:///run/my%20redis.sock'), {'unix_socket_path': '/run/my redis.sock'})
+
+    def test_invalid(self):
+        for url in ('http://cache', 'redis+unix://', 'redis://cache/x', 'redis://:secret@cache'):
+            self.assertRaises(TypeError, redis.parse_url, url)
+
+    def test_from_url(self):
+        db = redis.Redis.from_url('redis+unix:///run/redis.sock', decode_responses=True)
+        self.assertIsInstance(db, redis.Redis)
+
+class TestSocketOptions(unittest.TestCase):
+    '''
+    Test the socket options transports apply
+    '''
+
+    def test_apply(self):
+        options = transport.SocketOptions(keepalive=True, keepalive_idle=30, keepalive_interval=5, keepalive_count=3,
+                                          send_buffer_size=65536, receive_buffer_size=65536)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        options.apply(sock)
+
+        self.assertEqual(sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY), 1)
+        self.assertEqual(sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE), 1)
+        if hasattr(socket, 'TCP_KEEPIDLE'):
+            self.assertEqual(sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE), 30)
+            self.assertEqual(sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL), 5)
+            self.assertEqual(sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT), 3)
+        #Linux doubles the size asked for to leave room for bookkeeping
+        self.assertGreaterEqual(sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF), 65536)
+        self.assertGreaterEqual(sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF), 65536)
+        sock.close()
+
+    def test_defaults(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        transport.SocketOptions().apply(sock)
+        self.assertEqual(sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY), 1)
+        self.assertEqual(sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE), 0)
+        sock.close()
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        transport.SocketOptions(tcp_nodelay=False).apply(sock)
+        self.assertEqual(sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY), 0)
+        sock.close()
+
+    def test_unix_socket(self):
+        #TCP options don't apply to Unix sockets and must not fail on them
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        transport.SocketOptions(keepalive=True, keepalive_idle=30).apply(sock)
+        sock.close()
+
+    def test_invalid(self):
+        self.assertRaises(TypeError, transport.SocketOptions, keepalive_idle=0)
+        self.assertRaises(TypeError, transport.SocketOptions, read_chunk_size=1.5)
+        self.assertRaises(TypeError, redis.Redis, transport=transport.IOStreamTransport(),
+                          socket_options=transport.SocketOptions())
+
+class TestRedisSocketOptions(TestTornadoRedis):
+    '''
+    Test a client on sockets with every option set
+    '''
+
+    socket_options = transport.SocketOptions(keepalive=True, keepalive_idle=60, keepalive_interval=10, keepalive_count=3,
+                                             send_buffer_size=32768, receive_buffer_size=32768, read_chunk_size=64)
+
+    def make_transport(self):
+        return transport.IOStreamTransport(socket_options=self.socket_options)
+
+    @tracer
+    def test_commands(self):
+        #Replies much larger than a read chunk
+        value = 'x' * 100000
+        self.db.set('key', value, self.expectok())
+        self.db.get('key', self.expect(value))
+        self.db.rpush('list', *(['value'] * 100 + [self.expect(100)]))
+        self.db.lrange('list', 0, -1, self.expect(['value'] * 100, next=self.cleanup))
+        self.start()
+
+class TestRedisCapture(TestTornadoRedis):
+    '''
+    Test recording the raw traffic of a client
+    '''
+
+    def make_client(self):
+        self.capture_path = os.path.join(tempfile.mkdtemp(), 'traffic.capture')
+        self.capture = capture.Capture(self.capture_path)
+        return redis.Redis(transport=self.make_transport(), decode_responses=self.decode_responses, capture=self.capture)
+
+    def tearDown(self):
+        super(TestRedisCapture, self).tearDown()
+        self.capture.close()
+        os.unlink(self.capture_path)
+
+    @tracer
+    def test_capture(self):
+        def check():
+            self.capture.flush()
+            records = list(capture.read_capture(self.capture_path))
+            outbound = [data for direction, timestamp, data in records if direction == capture.OUTBOUND]
+            inbound = b''.join([data for direction, timestamp, data in records if direction == capture.INBOUND])
+
+            self.assertEqual(outbound[2:], [b'*3\r\n$3\r\nSET\r\n$3\r\nkey\r\n$5\r\nvalue\r\n',
+                                            b'*2\r\n$3\r\nGET\r\n$3\r\nkey\r\n',
+                                            b'*4\r\n$5\r\nRPUSH\r\n$4\r\nlist\r\n$1\r\na\r\n$2\r\nb\n\r\n',
+                                            b'*4\r\n$6\r\nLRANGE\r\n$4\r\nlist\r\n$1\r\n0\r\n$2\r\n-1\r\n'])
+            #Exactly the reply stream, in the order it was parsed
+            self.assertEqual(inbound, b'+OK\r\n+OK\r\n+OK\r\n$5\r\nvalue\r\n:2\r\n*2\r\n$1\r\na\r\n$2\r\nb\n\r\n')
+            self.assertEqual(self.capture.records, len(records))
+            self.assertTrue(all(time.time() - 60 < timestamp <= time.time() for direction, timestamp, data in records))
+            self.cleanup()
+
+        self.db.set('key', 'value', self.expectok())
+        self.db.get('key', self.expect('value'))
+        self.db.rpush('list', 'a', 'b\n', self.expect(2))
+        self.db.lrange('list', 0, -1, self.expect(['a', 'b\n'], next=check))
+        self.start()
+
+class TestRedisZeroCopy(TestTornadoRedis):
+    '''
+    Test writing large values as buffers of their own instead of copying them into the command
+    '''
+
+    decode_responses = False
+
+    def make_client(self):
+        return redis.Redis(transport=self.make_transport(), decode_responses=self.decode_responses,
+                           zero_copy_threshold=1024)
+
+    @tracer
+    def test_pack_command(self):
+        value = bytearray(b'x' * 2048)
+        packed = self.db._pack_command('SET', ['key0', value])
+        self.assertEqual(packed, [b'*3\r\n$3\r\nSET\r\n$4\r\nkey0\r\n$2048\r\n', value, b'\r\n'])
+        self.assertIs(packed[1], value)
+
+        #Small values and large ones of any other type are still joined into one bytes object
+        self.assertEqual(self.db._pack_command('SET', ['key0', bytearray(b'xy')]), b'*3\r\n$3\r\nSET\r\n$4\r\nkey0\r\n$2\r\nxy\r\n')
+        self.assertEqual(type(self.db._pack_command('SET', ['key0', 'x' * 2048])), list)
+
+        #A view is sized in bytes whatever its format
+        view = memoryview(array('i', range(512)))
+        packed = self.db._pack_command('SET', ['key0', view])
+        self.assertTrue(packed[0].endswith(b'$%d\r\n' % view.nbytes))
+        self.assertEqual(bytes(packed[1]), view.tobytes())
+
+        self.assertEqual(redis.Redis(zero_copy_threshold=None)._pack_command('SET', ['key0', value]),
+                         b'*3\r\n$3\r\nSET\r\n$4\r\nkey0\r\n$2048\r\n' + value + b'\r\n')
+        self.assertRaises(TypeError, redis.Redis, zero_copy_threshold=0)
+        self.db.dbsize(self.expect(0, next=self.cleanup))
+        self.start()
+
+    @tracer
+    def test_large_values(self):
+        data = bytes(range(256)) * 64
+
+        def check():
+            self.assertEqual(self.db.write_buffer_stats()['pending_bytes'], 0)
+            self.cleanup()
+
+        self.db.set('key0', data, self.expectok())
+        self.db.set('key1', bytearray(data), self.expectok())
+        self.db.set('key2', memoryview(data)[1:], self.expectok())
+        self.db.mset('key3', data, 'key4', b'small', 'key5', data, self.expectok())
+        self.db.rpush('key6', data, data, self.expect(2))
+        self.db.mget('key0', 'key1', 'key2', 'key3', 'key4', 'key5', self.expect([data, data, data[1:], data, b'small', data]))
+        self.db.lrange('key6', 0, -1, self.expect([data, data], next=check))
+        self.start()
+
+class TestSerializer(unittest.TestCase):
+    '''
+    Test encoding and tagging values on their own
+    '''
+
+    def test_round_trip(self):
+        value = {'name': 'caf\xe9', 'tags': [1, 2.5, None, True]}
+        for codec in ('json', 'pickle'):
+            codec_serializer = serializer.Serializer(codec)
+            data = codec_serializer.dumps(value)
+            self.assertEqual(data[:3], b'\x00' + codec_serializer.codec.tag + b'-')
+            self.assertEqual(codec_serializer.loads(data), value)
+
+    def test_compression(self):
+        compressing = serializer.Serializer(compress_threshold=100)
+        document = {'rows': [{'id': i, 'state': 'active'} for i in range(200)]}
+        data = compressing.dumps(document)
+        self.assertEqual(data[:3], b'\x00jz')
+        self.assertTrue(len(data) * 5 < len(serializer.Serializer().dumps(document)))
+        self.assertEqual(serializer.Serializer().loads(data), document)
+
+        #Below the threshold, or when zlib would not make it smaller, the value is stored as it is
+        self.assertEqual(compressing.dumps('short'), b'\x00j-"short"')
+        self.assertEqual(serializer.Serializer(compress_threshold=0).dumps(1), b'\x00j-1')
+
+    def test_mixed_values(self):
+        json_serializer = serializer.Serializer()
+        pickle_serializer = serializer.Serializer('pickle')
+        self.assertEqual(pickle_serializer.loads(json_serializer.dumps([1, 2])), [1, 2])
+        self.assertEqual(json_serializer.loads(b'plain'), b'plain')
+        self.assertEqual(json_serializer.loads(b'plain', lambda value: value.decode('utf-8')), 'plain')
+        self.assertEqual(json_serializer.loads(None), None)
+
+        #Loading a pickle can run code, so only a pickle serializer does it
+        self.assertRaises(ValueError, json_serializer.loads, pickle_serializer.dumps(1))
+        self.assertRaises(ValueError, json_serializer.loads, b'\x00?-1')
+
+    def test_dump_args(self):
+        dumps = serializer.Serializer().dumps
+        dump_args = serializer.Serializer().dump_args
+        self.assertEqual(dump_args('SET', ['key', [1], 'EX', 10]), ['key', dumps([1]), 'EX', 10])
+        self.assertEqual(dump_args('HSET', ['key', 'f0', 0, 'f1', 1]), ['key', 'f0', dumps(0), 'f1', dumps(1)])
+        self.assertEqual(dump_args('LINSERT', ['key', 'BEFORE', 'a', 'b']), ['key', 'BEFORE', dumps('a'), dumps('b')])
+        self.assertEqual(dump_args('INCR', ['key']), ['key'])
+
+    def test_invalid_options(self):
+        self.assertRaises(TypeError, serializer.Serializer, 'yaml')
+        self.assertRaises(TypeError, serializer.Serializer, compress_threshold=-1)
+        if serializer.msgpack is None:
+            self.assertRaises(TypeError, serializer.Serializer, 'msgpack')
+        self.assertRaises(TypeError, redis.Redis, serializer='json')
+
+class TestRedisSerializer(TestTornadoRedis):
+    '''
+    Test the values of string, hash and list commands going through a serializer
+    '''
+
+    def make_client(self):
+        self.serializer = serializer.Serializer(compress_threshold=256)
+        return redis.Redis(transport=self.make_transport(), decode_responses=self.decode_responses,
+                           serializer=self.serializer)
+
+    def text(self, value):
+        return value if self.decode_responses else value.encode('utf-8')
+
+    @tracer
+    def test_strings(self):
+        document = {'rows': [{'id': i, 'state': 'active'} for i in range(100)]}
+
+        def check_stored(stored, expected):
+            #What redis holds is the tagged and compressed document
+            self.assertEqual(stored[:3], b'\x00jz')
+            self.assertTrue(len(stored) * 5 < len(serializer.Serializer().dumps(expected)))
+            self.assertEqual(self.serializer.loads(stored), expected)
+
+        def check():
+            raw = redis.Redis(transport=self.make_transport())
+            raw.connect()
+            raw.select(11)
+            raw.get('key0', self.expect(document, assertFunc=check_stored, next=self.cleanup))
+
+        self.db.set('key0', document, self.expectok())
+        self.db.get('key0', self.expect(document))
+        self.db.mset('key1', [1, 'a'], 'key2', 2.5, self.expectok())
+        self.db.mget('key1', 'key2', 'key3', self.expect([[1, 'a'], 2.5, None], assertFunc=self.assertCountEqual))
+        self.db.getset('key2', 'new', self.expect(2.5))
+        self.db.get('key2', self.expect('new'))
+        self.db.set('key4', {'set': 'with get'}, 'GET', self.expect(None, next=check))
+        self.start()
+
+    @tracer
+    def test_hashes(self):
+        self.db.hset('key0', 'field0', {'a': 1}, 'field1', [None], self.expect(2))
+        self.db.hsetnx('key0', 'field2', True, self.expect(True))
+        self.db.hget('key0', 'field0', self.expect({'a': 1}))
+        self.db.hmget('key0', 'field1', 'field9', self.expect([[None], None], assertFunc=self.assertCountEqual))
+        self.db.hvals('key0', self.expect([{'a': 1}, [None], True], assertFunc=self.assertCountEqual))
+        self.db.hgetall('key0', self.expect({self.text('field0'): {'a': 1}, self.text('field1'): [None],
+                                             self.text('field2'): True}, next=self.cleanup))
+        self.start()
+
+    @tracer
+    def test_lists(self):
+        def popped():
+            self.db.rpop('key0', self.expect({'n': 2}))
+            self.db.lrange('key0', 0, -1, self.expect([None], next=self.cleanup))
+
+        self.db.rpush('key0', {'n': 0}, {'n': 1}, {'n': 2}, self.expect(3))
+        self.db.lrange('key0', 0, -1, self.expect([{'n': 0}, {'n': 1}, {'n': 2}], assertFunc=self.assertCountEqual))
+        self.db.lset('key0', 0, 'first', self.expectok())
+        self.db.lindex('key0', 0, self.expect('first'))
+        self.db.lpos('key0', {'n': 1}, self.expect(1))
+        self.db.lrem('key0', 0, {'n': 1}, self.expect(1))
+        self.db.blpop('key0', 0, self.expect([self.text('key0'), 'first'], assertFunc=self.assertCountEqual, next=popped))
+        self.start()
+
+    @tracer
+    def test_plain_values(self):
+        def check():
+            #Values written without a serializer come back as they are
+            self.db.get('key0', self.expect(self.text('plain')))
+            self.db.lrange('key1', 0, -1, self.expect([self.text('a'), {'b': 1}], assertFunc=self.assertCountEqual))
+            self.db.incr('key2', self.expect(2, next=self.cleanup))
+
+        def write_raw():
+            raw = redis.Redis(transport=self.make_transport())
+            raw.connect()
+            raw.select(11)
+            raw.set('key0', 'plain')
+            raw.rpush('key1', 'a', self.serializer.dumps({'b': 1}))
+            raw.set('key2', 1, lambda error, value: check())
+
+        self.db.dbsize(self.expect(0, next=write_raw))
+        self.start()
+
+    @tracer
+    def test_errors(self):
+        #json has no encoding for bytes, which is the caller's to fix
+        self.assertRaises(TypeError, self.db.set, 'key0', b'\xff', self.expectok())
+        self.assertRaises(TypeError, self.db.lrange, 'key0', 0, -1, self.expectok(), stream=lambda chunk: None)
+
+        def check():
+            self.db.get('key1', self.expect(None, 'Unable to decode GET reply: no codec for values tagged %r' % b'p'))
+            self.db.get('key0', self.expect(1, next=self.cleanup))
+
+        def write_raw():
+            #Only once setUp's FLUSHDB is through
+            raw = redis.Redis(transport=self.make_transport())
+            raw.connect()
+            raw.select(11)
+            raw.set('key1', serializer.Serializer('pickle').dumps(1), lambda error, value: check())
+
+        self.db.set('key0', 1, self.expectok(next=write_raw))
+        self.start()
+
+class TestRedisSerializerBytes(TestRedisSerializer):
+
+    decode_responses = False
+
+def _record_thread(data, threads=[]):
+    threads.append(threading.current_thread())
+    return json.loads(data)
+
+class TestRedisDecodeExecutor(TestTornadoRedis):
+    '''
+    Test decoding large replies on an executor instead of the IOLoop
+    '''
+
+    def make_client(self):
+        self.executor = ThreadPoolExecutor(2)
+        self.addCleanup(self.executor.shutdown)
+        self.threads = []
+        codec = serializer.Codec('json', b'j', serializer.JSON.dumps, partial(_record_thread, threads=self.threads))
+        return redis.Redis(transport=self.make_transport(), decode_responses=self.decode_responses,
+                           serializer=serializer.Serializer(codec), decode_executor=self.executor, decode_threshold=1024)
+
+    @tracer
+    def test_large_replies(self):
+        large = {'rows': list(range(1000))}
+        order = []
+
+        def check():
+            self.assertEqual(order, ['large', 'small', 'list', 'hash'])
+            #Only the large replies were decoded away from the IOLoop
+            self.assertEqual(len([thread for thread in self.threads if thread is not threading.main_thread()]), 5)
+            self.cleanup()
+
+        def record(name, expected):
+            def _record(received, expected_value):
+                self.assertEqual(received, expected_value)
+                order.append(name)
+            return self.expect(expected, assertFunc=_record)
+
+        self.db.set('key0', large, self.expectok())
+        self.db.set('key1', 'small', self.expectok())
+        self.db.rpush('key2', large, large, self.expect(2))
+        self.db.hset('key3', 'field0', large, 'field1', 1, self.expect(2))
+        self.db.get('key0', record('large', large))
+        self.db.get('key1', record('small', 'small'))
+        self.db.lrange('key2', 0, -1, record('list', [large, large]))
+        self.db.hgetall('key3', record('hash', {'field0': large, 'field1': 1} if self.decode_responses else
+                                                {b'field0': large, b'field1': 1}))
+        self.db.ping(self.expect('PONG' if self.decode_responses else b'PONG', next=check))
+        self.start()
+
+    @tracer
+    def test_decode_error(self):
+        def check(error, value):
+            if not (error or '').startswith('Unable to decode GET reply: '):
+                self.failure = AssertionError('expected a decode error, got %r, %r' % (error, value))
+
+        self.db.set('key0', {'rows': list(range(1000))}, self.expectok())
+        #No longer valid JSON
+        self.db.append('key0', '!', self.expect(assertFunc=lambda received, expected: None))
+        self.db.get('key0', check)
+        self.db.dbsize(self.expect(1, next=self.cleanup))
+        self.start()
+
+    @tracer
+    def test_process_pool(self):
+        large = {'rows': list(range(1000))}
+        executor = ProcessPoolExecutor(1)
+        self.addCleanup(executor.shutdown)
+
+        def run():
+            #The serializer and the reply are pickled over to the worker process
+            db = redis.Redis(transport=self.make_transport(), decode_responses=self.decode_responses,
+                             serializer=serializer.Serializer(), decode_executor=executor, decode_threshold=1024)
+            db.connect()
+            db.select(11)
+            db.set('key0', large, self.expectok())
+            db.get('key0', self.expect(large))
+            db.mget('key0', 'key1', self.expect([large, None], assertFunc=self.assertCountEqual, next=self.cleanup))
+
+        self.db.dbsize(self.expect(0, next=run))
+        self.start()
+
+    @tracer
+    def test_invalid_options(self):
+        self.assertRaises(TypeError, redis.Redis, decode_executor=self.executor)
+        self.assertRaises(TypeError, redis.Redis, serializer=serializer.Serializer(), decode_executor=self.executor,
+                          decode_threshold=-1)
+        self.db.dbsize(self.expect(0, next=self.cleanup))
+        self.start()
+
+class TestRedisFork(TestTornadoRedis):
+    '''
+    Test clients copied into a child process starting over with a connection of their own
+    '''
+
+    decode_responses = False
+
+    @tracer
+    def test_reconnect(self):
+        db = redis.Redis(db=11, transport=self.make_transport())
+        first_connection = []
+
+        def forked():
+            first_connection.append(db.connection_id)
+            #What os.fork() does in the child, without leaving this process
+            forksafe._count_fork()
+            db.get('key0', self.expect(b'value0'))
+            self.assertNotEqual(db.connection_id, first_connection[0])
+            db.dbsize(self.expect(1, next=self.cleanup))
+
+        def run():
+            db.connect()
+            #A fork happens between callbacks, not in the middle of handling a reply
+            db.set('key0', 'value0', self.expectok(next=partial(self.ioloop.add_callback, forked)))
+
+        #Only once setUp's FLUSHDB is through
+        self.db.ping(self.expect(b'PONG', next=run))
+        self.start()
+
+    @tracer
+    def test_fork(self):
+        parent = redis.Redis(db=11, transport=transport.AsyncioTransport(loop=self.ioloop.asyncio_loop))
+        cache = forksafe.PerProcess(object)
+        parent_value = cache.get()
+        inherited = []
+
+        def run():
+            parent.connect()
+            parent.set('key0', 'value0', self.expectok(next=self.stop))
+
+        self.db.ping(self.expect(b'PONG', next=run))
+        self.start()
+
+        #One command in flight and one queued behind it, both are the parent's
+        parent.get('key0', lambda error, value: inherited.append(value))
+        parent.set('key1', 'value1', lambda error, value: inherited.append(value))
+
+        (read_fd, write_fd) = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                os.close(read_fd)
+                loop = asyncio.new_event_loop()
+                asyncio.set_event_loop(loop)
+
+                reply = loop.create_future()
+                parent.get('key0', lambda error, value: reply.set_result((error, value)))
+                result = (loop.run_until_complete(asyncio.wait_for(reply, 5)), inherited, cache.get() is not parent_value)
+                os.write(write_fd, repr(result).encode('ascii'))
+                status = 0
+            except BaseException:
+                os.write(write_fd, traceback.format_exc().encode('utf-8'))
+            finally:
+                os._exit(status)
+
+        os.close(write_fd)
+        with os.fdopen(read_fd, 'rb') as child_output:
+            output = child_output.read()
+        self.assertEqual(output, repr(((None, b"value0"), [], True)).encode("ascii"), output.decode("utf-8"))
+        self.assertEqual(os.waitpid(pid, 0)[1], 0)
+
+        #The parent's connection and commands were left alone
+        self.assertIs(cache.get(), parent_value)
+        parent.dbsize(self.expect(2, next=self.cleanup))
+        self.start()
+        self.assertEqual(inherited, [b'value0', b'OK'])
+
+class TestPerProcess(unittest.TestCase):
+    '''
+    Test building a value once in each process
+    '''
+
+    def test_get(self):
+        built = []
+        cache = forksafe.PerProcess(lambda: built.append(1) or len(built))
+        self.assertFalse(cache.built())
+        self.assertEqual([cache.get(), cache.get()], [1, 1])
+        self.assertTrue(cache.built())
+
+        forksafe._count_fork()
+        self.assertFalse(cache.built())
+        self.assertEqual(cache.get(), 2)
+
+class TestRedisPriorities(TestTornadoRedis):
+    '''
+    Test interactive commands overtaking queued bulk ones
+    '''
+
+    def make_client(self):
+        self.metrics = metrics.ClientMetrics()
+        return redis.Redis(transport=self.make_transport(), decode_responses=self.decode_responses, metrics=self.metrics,
+                           priorities=[('interactive', 2), ('bulk', 1)])
+
+    @tracer
+    def test_interactive_first(self):
+        order = []
+
+        def record(name, expected):
+            def _record(received, expected_value):
+                self.assertEqual(received, expected_value)
+                order.append(name)
+            return self.expect(expected, assertFunc=_record)
+
+        def check():
+            #Ahead of all but at most one bulk SET, left to it by the lanes' credits
+            self.assertLessEqual(order.index('get1'), 2)
+            stats = self.db.queue_stats()
+            self.assertEqual((stats['depth'], stats['lanes']['bulk']['enqueued']), (0, 21))
+
+            bulk = self.metrics.snapshot()['lanes']['bulk']
+            self.assertEqual((bulk['queued'], bulk['sent']), (0, 21))
+            self.assertEqual(bulk['queue_wait']['count'], 21)
+            self.assertEqual(self.metrics.snapshot()['lanes']['interactive']['queued'], 0)
+            self.cleanup()
+
+        def run():
+            for i in range(20):
+                self.db.set('key%d' % i, 'value%d' % i, record('set%d' % i, 'OK'), priority='bulk')
+            #Answered before the bulk SET of the key
+            self.db.get('key19', record('get0', None))
+            self.db.get('missing', record('get1', None))
+            self.db.dbsize(self.expect(20, next=check), priority='bulk')
+
+        self.db.ping(self.expect('PONG', next=run))
+        self.start()
+
+    @tracer
+    def test_transaction(self):
+        def run():
+            for i in range(5):
+                self.db.set('key%d' % i, 'value%d' % i, self.expectok(), priority='bulk')
+            #Were a bulk SET popped in between it would be part of the transaction, and of its reply
+            self.db.execute_command('MULTI', self.expectok())
+            self.db.incr('counter', self.expect('QUEUED'), priority='bulk')
+            self.db.execute_command('EXEC', self.expect([1]))
+            self.db.dbsize(self.expect(6, next=self.cleanup), priority='bulk')
+
+        self.db.ping(self.expect('PONG', next=run))
+        self.start()
+
+    @tracer
+    def test_unknown_priority(self):
+        self.assertRaises(TypeError, self.db.get, 'key0', priority='urgent')
+        self.assertRaises(TypeError, redis.Redis(transport=self.make_transport()).get, 'key0', priority='bulk')
+        self.assertRaises(TypeError, redis.Redis, priorities=[('bulk', 0)])
+        self.db.ping(self.expect('PONG', next=self.cleanup))
+        self.start()
+
+class TestRedisBulkLoad(TestTornadoRedis):
+    '''
+    Test loading commands from an iterable in pipelined chunks
+    '''
+
+    @tracer
+    def test_load(self):
+        loaders = []
+        in_flight = []
+        progress = []
+
+        def commands():
+            for i in range(25000):
+                #The window bounds how far ahead of the replies the iterable is read
+                in_flight.append(loaders[0].sent - loaders[0].replies)
+                yield ('SET', 'key%d' % i, 'value%d' % i)
+
+        def loaded(error, stats):
+            self.assertIsNone(error)
+            self.assertEqual((stats['sent'], stats['replies'], stats['errors'], stats['chunks']), (25000, 25000, 0, 25))
+            self.assertTrue(stats['done'])
+            self.assertGreater(stats['commands_per_second'], 0)
+            self.assertLessEqual(max(in_flight), 4000)
+            self.assertEqual([entry['replies'] for entry in progress], list(range(1000, 25001, 1000)))
+            #Loaded into the database the client selected
+            self.db.dbsize(self.expect(25000))
+            self.db.get('key24999', self.expect('value24999', next=self.cleanup))
+
+        def run():
+            loaders.append(self.db.bulk_load(commands(), loaded, window=5000, progress=progress.append))
+
+        self.db.ping(self.expect('PONG', next=run))
+        self.start()
+
+    @tracer
+    def test_replies(self):
+        #Every shape of reply is read past, only top level errors count
+        commands = [
+            ('SET', 'key0', 'value0'),
+            ('GET', 'key0'),
+            ('GET', 'missing'),
+            ('RPUSH', 'key1', 'a', 'b', 'c'),
+            ('LRANGE', 'key1', 0, -1),
+            ('LRANGE', 'missing', 0, -1),
+            ('MULTI',),
+            ('SET', 'key2', 'value2'),
+            ('INCR', 'key0'),
+            ('EXEC',),
+            ('HSET', 'key3', 'field', b'\r\n'),
+            ('HGETALL', 'key3'),
+            (b'incr', 'key1'),
+        ]
+
+        def loaded(error, stats):
+            self.assertIsNone(error)
+            self.assertEqual((stats['sent'], stats['replies'], stats['errors']), (13, 13, 1))
+            self.assertEqual(stats['error_samples'], [(12, 'WRONGTYPE Operation against a key holding the wrong kind of value')])
+            self.db.dbsize(self.expect(4, next=self.cleanup))
+
+        def run():
+            self.db.bulk_load(commands, loaded, chunk_size=5, window=5)
+
+        self.db.ping(self.expect('PONG', next=run))
+        self.start()
+
+    @tracer
+    def test_max_errors(self):
+        commands = [('SET', 'key0', 'value0')] + [('INCR', 'key0')] * 10 + [('SET', 'key1', 'value1')]
+
+        def loaded(error, stats):
+            self.assertEqual(error, 'ERR bulk load stopped after 3 errors')
+            self.assertEqual((stats['sent'], stats['errors']), (4, 3))
+            self.assertEqual([index for index, message in stats['error_samples']], [1, 2, 3])
+            self.db.exists('key1', self.expect(False, next=self.cleanup))
+
+        def run():
+            self.db.bulk_load(commands, loaded, chunk_size=1, window=1, max_errors=3)
+
+        self.db.ping(self.expect('PONG', next=run))
+        self.start()
+
+    @tracer
+    def test_bad_command(self):
+        def loaded(error, stats):
+            self.assertTrue(error.startswith('ERR bulk load stopped at command 1: commands must be'), error)
+            self.assertEqual((stats['sent'], stats['replies']), (1, 1))
+            self.db.exists('key0', self.expect(True, next=self.cleanup))
+
+        def run():
+            self.db.bulk_load([('SET', 'key0', 'value0'), 'PING', ('SET', 'key1', 'value1')], loaded)
+
+        self.assertRaises(TypeError, self.db.bulk_load, [], chunk_size=100, window=10)
+        self.db.ping(self.expect('PONG', next=run))
+        self.start()
+
+class TestBlockSeconds(unittest.TestCase):
+    '''
+    Test finding how long a command may block on the server
+    '''
+
+    def test_block_seconds(self):
+        self.assertEqual(blocking.block_seconds('BLPOP', ['key0', 'key1', 5]), 5)
+        self.assertEqual(blocking.block_seconds('BRPOPLPUSH', ['key0', 'key1', b'0.5']), 0.5)
+        self.assertEqual(blocking.block_seconds('BZMPOP', [1.5, 1, 'key0', 'MIN']), 1.5)
+        self.assertEqual(blocking.block_seconds('XREAD', ['COUNT', 1, 'block', 250, 'STREAMS', 'key0', '$']), 0.25)
+        self.assertIsNone(blocking.block_seconds('XREAD', ['STREAMS', 'key0', '0']))
+        self.assertIsNone(blocking.block_seconds('GET', ['key0']))
+        #Malformed, the server rejects it without blocking
+        self.assertEqual(blocking.block_seconds('BLPOP', []), 0)
+
+class _StuckClient(object):
+    #Never answers, like a connection to a server that went away without closing it
+    def __init__(self):
+        self.entries = []
+        self.disconnected = False
+
+    def connect(self):
+        pass
+
+    def _run_entry(self, entry, db, response_callbacks):
+        self.entries.append((entry[0], db))
+
+    def closed(self):
+        return self.disconnected
+
+    def disconnect(self):
+        self.disconnected = True
+
+class TestRedisBlocking(TestTornadoRedis):
+    '''
+    Test running blocking commands on connections of their own
+    '''
+
+    @tracer
+    def test_main_connection_free(self):
+        def check():
+            stats = self.db.blocking_stats()
+            self.assertEqual((stats['connections_made'], stats['idle'], stats['busy']), (1, 1, 0))
+            self.cleanup()
+
+        def run():
+            #Without a connection of its own the BLPOP would hold up the RPUSH for 5 seconds and get nothing
+            self.db.blpop('key0', 5, self.expect(['key0', 'value0'], next=check))
+            self.db.rpush('key0', 'value0', self.expect(1))
+
+        self.db.ping(self.expect('PONG', next=run))
+        self.start()
+
+    @tracer
+    def test_reuse(self):
+        def check():
+            self.assertEqual(self.db.blocking_stats()['connections_made'], 1)
+            self.cleanup()
+
+        def second():
+            self.db.brpop('key0', 1, self.expect(['key0', 'value1'], next=check))
+
+        self.db.rpush('key0', 'value0', 'value1', self.expect(2))
+        self.db.blpop('key0', 1, self.expect(['key0', 'value0'], next=second))
+        self.start()
+
+    @tracer
+    def test_select(self):
+        def back():
+            self.assertEqual(self.db.db, 12)
+            self.db.flushdb(self.expectok())
+            self.db.select(11, self.expectok(next=self.cleanup))
+
+        def other_db():
+            #The blocking connection follows the database the client selected
+            self.db.select(12, self.expectok())
+            self.db.rpush('key0', 'value12', self.expect(1))
+            self.db.blpop('key0', 1, self.expect(['key0', 'value12'], next=back))
+
+        self.assertEqual(self.db.db, 0)
+        self.db.rpush('key0', 'value11', self.expect(1))
+        self.db.blpop('key0', 1, self.expect(['key0', 'value11'], next=other_db))
+        self.start()
+
+    @tracer
+    def test_multi(self):
+        #A blocking command in a transaction is queued by the server rather than run, it stays in the transaction
+        self.db.execute_command('MULTI', self.expectok())
+        self.db.blpop('key0', 1, self.expect('QUEUED'))
+        self.db.rpush('key0', 'value0', self.expect('QUEUED'))
+        self.db.execute_command('EXEC', self.expect([None, 1]))
+        self.db.dbsize(self.expect(1, next=self.cleanup))
+        self.start()
+
+    @tracer
+    def test_disabled(self):
+        db = redis.Redis(db=11, transport=self.make_transport(), decode_responses=True, blocking_connections=0)
+        order = []
+
+        def check():
+            self.assertEqual(order, ['blpop', 'rpush'])
+            self.assertIsNone(db.blocking_stats())
+            db.disconnect()
+            self.cleanup()
+
+        def run():
+            db.connect()
+            db.blpop('key0', 1, lambda error, value: order.append('blpop'))
+            db.rpush('key0', 'value0', lambda error, value: order.append('rpush') or check())
+
+        self.db.ping(self.expect('PONG', next=run))
+        self.start()
+
+    @tracer
+    def test_deadline(self):
+        clients = []
+        replies = []
+
+        def factory():
+            clients.append(_StuckClient())
+            return clients[-1]
+
+        def check():
+            (error, value) = replies[0]
+            self.assertTrue(error.startswith('ERR no reply to BLPOP within '), error)
+            self.assertTrue(clients[0].disconnected)
+            #The command waiting for a connection got a new one
+            self.assertEqual(clients[1].entries, [('BRPOP', 11)])
+            stats = pool.stats()
+            self.assertEqual((stats['timeouts'], stats['connections_made'], stats['busy'], stats['waiting']), (1, 2, 1, 0))
+            pool.close()
+            self.assertTrue(clients[1].disconnected)
+            self.stop()
+
+        def entry(cmd):
+            return (cmd, ['key0', 0.05], lambda error, value: replies.append((error, value)), b'', (None, None, None, 0.05), None)
+
+        pool = blocking.BlockingPool(factory, max_connections=1, timeout_margin=0.05)
+        pool.execute(entry('BLPOP'), 11, {}, 0.05)
+        pool.execute(entry('BRPOP'), 11, {}, 0.05)
+        self.assertEqual(pool.stats()['waiting'], 1)
+        self.ioloop.call_later(0.15, check)
+        self.start()
+
+class TestRedisBytes(TestTornadoRedis):
+    '''
+    Test the default client, which encodes arguments itself and returns raw bytes
+    '''
+
+    decode_responses = False
+
+    @tracer
+    def test_get_returns_bytes(self):
+        self.db.set('key0', 'value0', self.expectok())
+        self.db.get('key0', self.expect(b'value0'))
+        self.db.type('key0', self.expect(b'string', next=self.cleanup))
+        self.start()
+
+    @tracer
+    def test_binary_value(self):
+        value = b'\x00\xff\r\nbinary\r\n\r\n$3\r\n'
+        self.db.set('key0', value, self.expectok())
+        self.db.get('key0', self.expect(value))
+        self.db.rpush('key1', value, self.expect(1))
+        self.db.rpush('key1', b'', self.expect(2))
+        self.db.lrange('key1', 0, -1, self.expect([value, b''], next=self.cleanup))
+        self.start()
+
+    @tracer
+    def test_digits_are_not_converted(self):
+        self.db.set('key0', '007', self.expectok())
+        self.db.get('key0', self.expect(b'007'))
+        self.db.mget('key0', 'key1', self.expect([b'007', None], next=self.cleanup))
+        self.start()
+
+    @tracer
+    def test_number_arguments(self):
+        self.db.set('key0', 10, self.expectok())
+        self.db.incrby('key0', 5, self.expect(15))
+        self.db.get('key0', self.expect(b'15'))
+        self.db.set('key1', 1.5, self.expectok())
+        self.db.get('key1', self.expect(b'1.5'))
+        self.db.zadd('key2', 2.5, 'member', self.expect(1))
+        self.db.zscore('key2', 'member', self.expect(2.5, next=self.cleanup))
+        self.start()
+
+    @tracer
+    def test_text_arguments_are_encoded(self):
+        self.db.set(u'cl\xe9', u'valeur ☃', self.expectok())
+        self.db.get(u'cl\xe9', self.expect(u'valeur ☃'.encode('utf-8'), next=self.cleanup))
+        self.start()
+
+    @tracer
+    def test_converters(self):
+        self.db.hmset('key0', 'field0', b'\x00', 'field1', '007', self.expectok())
+        self.db.hgetall('key0', self.expect({b'field0': b'\x00', b'field1': b'007'}))
+        self.db.exists('key0', self.expect(True, assertFunc=self.assertIs))
+        self.db.exists('key1', self.expect(False, assertFunc=self.assertIs))
+        self.db.zadd('key1', 1.5, 'member0', self.expect(1))
+        self.db.zrange('key1', 0, -1, 'withscores', self.expect([(b'member0', 1.5)]))
+        self.db.zrange('key1', 0, -1, self.expect([b'member0'], next=self.cleanup))
+        self.start()
+
+    @tracer
+    def test_custom_converter(self):
+        def unregister():
+            #Converters apply when the reply arrives, so only swap them once the previous reply is in
+            self.db.set_response_callback('GET', None)
+            self.db.set_response_callback('LLEN', lambda value, args: 1 // 0)
+            self.db.get('key0', self.expect(b'value0'))
+            self.db.llen('key1', self.expect(None, 'Unable to convert LLEN reply: integer division or modulo by zero', next=self.cleanup))
+
+        self.db.set_response_callback('get', lambda value, args: (args[0], value.upper()))
+        self.db.set('key0', 'value0', self.expectok())
+        self.db.get('key0', self.expect(('key0', b'VALUE0'), next=unregister))
+        self.start()
+
+    @tracer
+    def test_invalid_arguments(self):
+        self.assertRaises(TypeError, self.db.set, 'key0', True, self.expectok())
+        self.assertRaises(TypeError, self.db.set, 'key0', None, self.expectok())
+        self.assertRaises(TypeError, self.db.set, 'key0', object(), self.expectok())
+        self.db.exists('key0', self.expect(0, next=self.cleanup))
+        self.start()
+
+    @tracer
+    def test_subscribe(self):
+        def on_message(msg):
+            if msg[0] == b'subscribe':
+                self.assertEqual(msg, [b'subscribe', b'test', 1])
+
+                self.publish_db = self.make_client()
+                self.publish_db.connect()
+                self.publish_db.publish('test', b'\x00Test Message', self.expect(1))
+
+            elif msg[0] == b'message':
+                self.assertEqual(msg, [b'message', b'test', b'\x00Test Message'])
+                self.db.unsubscribe('test')
+
+            elif msg[0] == b'unsubscribe':
+                self.cleanup()
+
+        self.db.subscribe('test', on_message)
+        self.start()
+
+class TestAsyncioTransportBuffer(unittest.TestCase):
+    '''
+    Feed the asyncio transport's read buffer directly, no connection involved
+    '''
+
+    def setUp(self):
+        self.transport = transport.AsyncioTransport()
+        self.received = []
+
+    def read_line(self, data):
+        self.received.append(data)
+        self.transport.read_until(b'\r\n', self.read_line)
+
+    def test_split_delimiter(self):
+        self.transport.read_until(b'\r\n', self.received.append)
+        self.transport._data_received(b'+O')
+        self.transport._data_received(b'K\r')
+        self.assertEqual(self.received, [])
+
+        self.transport._data_received(b'\n')
+        self.assertEqual(self.received, [b'+OK\r\n'])
+
+    def test_multiple_replies_in_one_chunk(self):
+        self.transport.read_until(b'\r\n', self.read_line)
+        self.transport._data_received(b'+OK\r\n:1\r\n$-1\r\n+PART')
+        self.assertEqual(self.received, [b'+OK\r\n', b':1\r\n', b'$-1\r\n'])
+
+        self.transport._data_received(b'IAL\r\n')
+        self.assertEqual(self.received, [b'+OK\r\n', b':1\r\n', b'$-1\r\n', b'+PARTIAL\r\n'])
+
+    def test_reentrant_reads_do_not_recurse(self):
+        #Each callback registers the next read, this must not grow the stack per reply
+        self.transport.read_until(b'\r\n', self.read_line)
+        self.transport._data_received(b':1\r\n' * 10000)
+        self.assertEqual(len(self.received), 10000)
+        self.assertEqual(len(self.transport._buffer), 0)
+
+    def test_read_bytes(self):
+        def read_header(data):
+            self.received.append(data)
+            self.transport.read_bytes(7, self.received.append)
+
+        self.transport.read_until(b'\r\n', read_header)
+        self.transport._data_received(b'$5\r\na\r\nb')
+        self.assertEqual(self.received, [b'$5\r\n'])
+
+        self.transport._data_received(b'c\r\n')
+        self.assertEqual(self.received, [b'$5\r\n', b'a\r\nbc\r\n'])
+
+    def test_write_after_close(self):
+        self.transport.write(b'*1\r\n$4\r\nPING\r\n')
+        self.assertEqual(self.transport._write_buffer, [b'*1\r\n$4\r\nPING\r\n'])
+
+        self.transport.close()
+        self.assertEqual(self.transport._write_buffer, [])
+        self.assertRaises(transport.StreamClosedError, self.transport.write, b'*1\r\n$4\r\nPING\r\n')
+
+    def test_write_callbacks(self):
+        class FakeTransport(object):
+            buffered = 0
+            def set_write_buffer_limits(self, high=None, low=None):
+                pass
+            def get_extra_info(self, name, default=None):
+                return default
+            def get_write_buffer_size(self):
+                return self.buffered
+            def writelines(self, data):
+                self.buffered += sum(len(chunk) for chunk in data)
+            def write(self, data):
+                self.buffered += len(data)
+
+        written = []
+        self.transport.write(b'held', partial(written.append, 1))
+
+        #The held write is flushed on connect but is still in the buffer
+        fake = FakeTransport()
+        self.transport._connection_made(fake)
+        self.transport.write(b'more', partial(written.append, 2))
+        self.assertEqual(written, [])
+
+        fake.buffered = 0
+        self.transport._drained()
+        self.assertEqual(written, [1, 2])
+
+        #Nothing left unwritten completes straight away
+        self.transport.write(b'next', partial(written.append, 3))
+        fake.buffered = 0
+        self.transport.write(b'', partial(written.append, 4))
+        self.assertEqual(written, [1, 2, 3, 4])
+
+    def test_stale_connection(self):
+        closed = []
+        stale = transport._RedisProtocol(self.transport, partial(closed.append, 'stale'))
+        self.transport._protocol = transport._RedisProtocol(self.transport)
+        self.transport.read_until(b'\r\n', self.received.append)
+
+        #A connection replaced by a reconnect must not feed or close the new one
+        stale.data_received(b'+OLD\r\n')
+        stale.connection_lost(None)
+        self.assertEqual(self.received, [])
+        self.assertEqual(closed, ['stale'])
+        self.assertFalse(self.transport.closed())
+
+        self.transport._protocol.data_received(b'+NEW\r\n')
+        self.assertEqual(self.received, [b'+NEW\r\n'])
+
+
+class AsyncioTransportMixin(object):
+    '''
+    Run a command test case over the asyncio.Protocol transport, bound to the loop the IOLoop runs on
+    '''
+
+    def make_transport(self):
+        return transport.AsyncioTransport(loop=self.ioloop.asyncio_loop)
+
+class TestAsyncioKeyCommands(AsyncioTransportMixin, TestRedisKeyCommands):
+    pass
+
+class TestAsyncioHashCommands(AsyncioTransportMixin, TestRedisHashCommands):
+    pass
+
+class TestAsyncioStringCommands(AsyncioTransportMixin, TestRedisStringCommands):
+    pass
+
+class TestAsyncioSetCommands(AsyncioTransportMixin, TestRedisSetCommands):
+    pass
+
+class TestAsyncioSortedSetCommands(AsyncioTransportMixin, TestRedisSortedSetCommands):
+    pass
+
+class TestAsyncioListCommands(AsyncioTransportMixin, TestRedisListCommands):
+    pass
+
+class TestAsyncioServerCommands(AsyncioTransportMixin, TestRedisServerCommands):
+    pass
+
+class TestAsyncioPubSubCommands(AsyncioTransportMixin, TestRedisPubSubCommands):
+    pass
+
+class TestAsyncioConnectionCommands(AsyncioTransportMixin, TestRedisConnectionCommands):
+    pass
+
+class TestAsyncioBytes(AsyncioTransportMixin, TestRedisBytes):
+    pass
+
+class TestAsyncioStreaming(AsyncioTransportMixin, TestRedisStreaming):
+    pass
+
+class TestAsyncioScan(AsyncioTransportMixin, TestRedisScan):
+    pass
+
+class TestAsyncioQueue(AsyncioTransportMixin, TestRedisQueue):
+    pass
+
+class TestAsyncioWriteFlow(AsyncioTransportMixin, TestRedisWriteFlow):
+    pass
+
+class TestAsyncioMetrics(AsyncioTransportMixin, TestRedisMetrics):
+    pass
+
+class TestAsyncioSlowLog(AsyncioTransportMixin, TestRedisSlowLog):
+    pass
+
+class TestAsyncioProfiler(AsyncioTransportMixin, TestRedisProfiler):
+    pass
+
+class TestAsyncioFakeServer(AsyncioTransportMixin, TestFakeServer):
+    pass
+
+class TestAsyncioCapture(AsyncioTransportMixin, TestRedisCapture):
+    pass
+
+class TestAsyncioFakeServerUnix(AsyncioTransportMixin, TestFakeServerUnix):
+    pass
+
+class TestAsyncioZeroCopy(AsyncioTransportMixin, TestRedisZeroCopy):
+    pass
+
+class TestAsyncioSerializer(AsyncioTransportMixin, TestRedisSerializer):
+    pass
+
+class TestAsyncioDecodeExecutor(AsyncioTransportMixin, TestRedisDecodeExecutor):
+    pass
+
+class TestAsyncioFork(AsyncioTransportMixin, TestRedisFork):
+    pass
+
+class TestAsyncioBlocking(AsyncioTransportMixin, TestRedisBlocking):
+    pass
+
+class TestAsyncioPriorities(AsyncioTransportMixin, TestRedisPriorities):
+    pass
+
+class TestAsyncioBulkLoad(AsyncioTransportMixin, TestRedisBulkLoad):
+    pass
+
+class TestAsyncioSocketOptions(TestRedisSocketOptions):
+
+    def make_transport(self):
+        return transport.AsyncioTransport(loop=self.ioloop.asyncio_loop, socket_options=self.socket_options)
+
 if __name__ == '__main__':
     suite = unittest.TestSuite()
     #suite.addTest(TestRedisKeyCommands('test_randomkey'))
@@ -1103,5 +3338,65 @@ if __name__ == '__main__':
     suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestRedisServerCommands))
     suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestRedisPubSubCommands))
     suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestRedisConnectionCommands))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestRedisColumnar))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestRedisStreaming))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestRedisScan))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestRedisQueue))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestRedisQueueShed))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestRedisWriteFlow))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestRedisMetrics))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestMetrics))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestRedisSlowLog))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestRedisProfiler))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestCommandQueue))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestLaneQueue))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestFakeServer))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestFakeServerUnix))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestFakeServerPubSub))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestRedisUrl))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestSocketOptions))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestRedisSocketOptions))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestRedisCapture))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestRedisZeroCopy))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestSerializer))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestRedisSerializer))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestRedisSerializerBytes))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestRedisDecodeExecutor))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestRedisFork))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestPerProcess))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestRedisPriorities))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestRedisBulkLoad))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestBlockSeconds))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestRedisBlocking))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestRedisBytes))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestAsyncioTransportBuffer))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestAsyncioKeyCommands))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestAsyncioHashCommands))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestAsyncioStringCommands))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestAsyncioSetCommands))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestAsyncioSortedSetCommands))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestAsyncioListCommands))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestAsyncioServerCommands))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestAsyncioPubSubCommands))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestAsyncioConnectionCommands))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestAsyncioBytes))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestAsyncioStreaming))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestAsyncioScan))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestAsyncioQueue))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestAsyncioWriteFlow))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestAsyncioMetrics))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestAsyncioSlowLog))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestAsyncioProfiler))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestAsyncioFakeServer))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestAsyncioCapture))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestAsyncioFakeServerUnix))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestAsyncioZeroCopy))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestAsyncioSerializer))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestAsyncioDecodeExecutor))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestAsyncioFork))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestAsyncioBlocking))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestAsyncioPriorities))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestAsyncioBulkLoad))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestAsyncioSocketOptions))
 
     unittest.TextTestRunner().run(suite)